@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from .git_utils import get_staged_changes, run_git_command
+from .openai_utils import agenerate_commit_message, aclose_clients, bulk_generate_commit_messages
+
+# 默认同时进行的模型请求数
+DEFAULT_CONCURRENCY = 8
+
+# 默认收集 diff、执行提交的线程数
+DEFAULT_WORKERS = 8
+
+def read_manifest(path: str) -> List[str]:
+    """读取清单文件：每行一个仓库路径，忽略空行和以 # 开头的注释"""
+    repos = []
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            repos.append(os.path.join(base_dir, os.path.expanduser(line)))
+    return repos
+
+def dedupe_repos(repos: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """去掉指向同一个仓库目录的重复路径，保留第一次出现的位置
+
+    同一个仓库处理两次会重复提交，结果也无法区分。
+
+    Returns:
+        (去重后的路径, 被去掉的路径)
+    """
+    unique = []
+    duplicates = []
+    seen = set()
+    for repo in repos:
+        key = os.path.realpath(repo)
+        if key in seen:
+            duplicates.append(repo)
+        else:
+            seen.add(key)
+            unique.append(repo)
+    return unique, duplicates
+
+def _staged_changes(repo: str):
+    """读取一个仓库的暂存区，出错时返回异常而不是抛出，错误记录在该仓库的结果中"""
+    try:
+        return get_staged_changes(repo)
+    except Exception as e:
+        return e
+
+def provider_key(api_base: Optional[str]) -> str:
+    """按 API base 的主机名区分服务商"""
+    return urlparse(api_base or "https://api.openai.com/v1").netloc
+
+class RateLimiter:
+    """按固定间隔放行请求的限速器，rate 为每秒请求数"""
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+def _commit(repo: str, message: str) -> Optional[str]:
+    """非交互式提交，失败时返回错误信息"""
+    returncode, _, stderr = run_git_command(['git', 'commit', '-m', message], cwd=repo)
+    if returncode != 0:
+        return stderr.strip() or f"git commit exited with {returncode}"
+    return None
+
+async def _run_batch(
+    repos: List[str],
+    api_key: str,
+    api_base: Optional[str],
+    model: Optional[str],
+    prompt_template: Optional[str],
+    concurrency: int,
+    rate_limits: Dict[str, float],
+    workers: int,
+    dry_run: bool,
+    on_result: Callable[[Dict], None]
+) -> List[Dict]:
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    provider = provider_key(api_base)
+    limiter = RateLimiter(rate_limits.get(provider) or rate_limits.get("*"))
+
+    async def process(pool: ThreadPoolExecutor, repo: str) -> Dict:
+        started = time.monotonic()
+        result = {"repo": repo, "status": "failed", "message": None, "error": None}
+        try:
+            diff, dependency_files, dependency_summary = await loop.run_in_executor(pool, get_staged_changes, repo)
+            if not diff and not dependency_files:
+                result["status"] = "skipped"
+                result["error"] = "no staged changes"
+                return result
+
+            async with semaphore:
+                await limiter.acquire()
+                message = await agenerate_commit_message(
+                    diff=diff,
+                    api_key=api_key,
+                    api_base=api_base,
+                    model=model,
+                    prompt_template=prompt_template,
+                    dependency_files=dependency_files,
+                    dependency_summary=dependency_summary
+                )
+            result["message"] = message
+
+            if dry_run:
+                result["status"] = "generated"
+                return result
+
+            error = await loop.run_in_executor(pool, _commit, repo, message)
+            if error:
+                result["error"] = error
+            else:
+                result["status"] = "committed"
+            return result
+        except Exception as e:
+            result["error"] = str(e)
+            return result
+        finally:
+            result["elapsed"] = round(time.monotonic() - started, 3)
+            on_result(result)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return await asyncio.gather(*(process(pool, repo) for repo in repos))
+    finally:
+        await aclose_clients()
+
+def run_batch(
+    repos: Iterable[str],
+    api_key: str,
+    api_base: Optional[str] = None,
+    model: Optional[str] = None,
+    prompt_template: Optional[str] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rate_limits: Optional[Dict[str, float]] = None,
+    workers: int = DEFAULT_WORKERS,
+    dry_run: bool = False,
+    report: Optional[Callable[[str], None]] = None
+) -> List[Dict]:
+    """Generate and commit messages for the staged changes of many repositories.
+
+    Staged diffs are collected in a thread pool while the model requests run
+    on an asyncio event loop, limited by ``concurrency`` and by the per-provider
+    ``rate_limits`` (requests per second keyed by API host, ``*`` for any host).
+
+    Args:
+        repos: Repository paths; paths to the same repository are processed once
+        api_key: API key for the AI service
+        api_base: Optional API base URL
+        model: Optional model to use
+        prompt_template: Optional custom prompt template
+        concurrency: Maximum number of concurrent model requests
+        rate_limits: Optional requests per second per provider host
+        workers: Number of threads used for git operations
+        dry_run: Generate messages without committing
+        report: Optional callback receiving one JSON line per repository as it finishes
+
+    Returns:
+        List of result records in input order
+    """
+    def on_result(result: Dict):
+        if report:
+            report(json.dumps(result, ensure_ascii=False))
+
+    return asyncio.run(_run_batch(
+        dedupe_repos(repos)[0],
+        api_key=api_key,
+        api_base=api_base,
+        model=model,
+        prompt_template=prompt_template,
+        concurrency=max(1, concurrency),
+        rate_limits=rate_limits or {},
+        workers=max(1, workers),
+        dry_run=dry_run,
+        on_result=on_result
+    ))
+
+def run_bulk_batch(
+    repos: Iterable[str],
+    api_key: str,
+    api_base: Optional[str] = None,
+    model: Optional[str] = None,
+    prompt_template: Optional[str] = None,
+    provider: Optional[str] = None,
+    workers: int = DEFAULT_WORKERS,
+    dry_run: bool = False,
+    poll_interval: Optional[float] = None,
+    timeout: Optional[float] = None,
+    report: Optional[Callable[[str], None]] = None,
+    on_status: Optional[Callable[[str], None]] = None
+) -> List[Dict]:
+    """Like run_batch, but sends all model requests as one provider batch job.
+
+    Intended for offline bulk jobs where cost and throughput matter more
+    than latency: diffs are collected first, submitted together through
+    the provider's batch API, and repositories are committed once the
+    job has finished.
+
+    Args:
+        provider: Optional provider adapter name, detected from api_base by default
+        poll_interval: Optional maximum seconds between batch status checks
+        timeout: Optional seconds to wait before cancelling the batch
+        on_status: Optional callback receiving batch status updates
+        Other arguments are the same as run_batch
+
+    Returns:
+        List of result records in input order
+    """
+    repos, _ = dedupe_repos(repos)
+    started = time.monotonic()
+    results = {repo: {"repo": repo, "status": "failed", "message": None, "error": None} for repo in repos}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        changes = {}
+        for repo, staged in zip(repos, pool.map(_staged_changes, repos)):
+            if isinstance(staged, Exception):
+                results[repo]["error"] = str(staged)
+            elif staged[0] or staged[1]:
+                changes[repo] = staged
+            else:
+                results[repo].update(status="skipped", error="no staged changes")
+
+        try:
+            generated = bulk_generate_commit_messages(
+                changes,
+                api_key=api_key,
+                api_base=api_base,
+                model=model,
+                prompt_template=prompt_template,
+                provider=provider,
+                poll_interval=poll_interval,
+                timeout=timeout,
+                on_status=on_status
+            )
+        except Exception as e:
+            generated = {repo: {"message": None, "error": str(e)} for repo in changes}
+
+        to_commit = []
+        for repo, result in generated.items():
+            results[repo].update(message=result["message"], error=result["error"])
+            if result["message"] is None:
+                continue
+            if dry_run:
+                results[repo]["status"] = "generated"
+            else:
+                to_commit.append(repo)
+
+        for repo, error in zip(to_commit, pool.map(lambda repo: _commit(repo, results[repo]["message"]), to_commit)):
+            if error:
+                results[repo]["error"] = error
+            else:
+                results[repo]["status"] = "committed"
+
+    elapsed = round(time.monotonic() - started, 3)
+    ordered = []
+    for repo in repos:
+        result = results[repo]
+        result["elapsed"] = elapsed
+        if report:
+            report(json.dumps(result, ensure_ascii=False))
+        ordered.append(result)
+    return ordered
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import hashlib
+from typing import Dict, Optional
+
+from .config import CONFIG_DIR
+
+# 优先使用 XDG 缓存目录，否则放在配置目录下
+CACHE_DIR = os.path.join(os.environ["XDG_CACHE_HOME"], "acmt") if os.environ.get("XDG_CACHE_HOME") \
+    else os.path.join(CONFIG_DIR, "cache")
+
+# 缓存总大小上限（字节）
+MAX_CACHE_BYTES = 10 * 1024 * 1024
+
+# 缓存条目的最长保存时间（秒）
+MAX_CACHE_AGE = 7 * 24 * 3600
+
+def make_cache_key(
+    tree: str,
+    model: Optional[str],
+    api_base: Optional[str],
+    prompt_template: Optional[str],
+    settings: Optional[Dict] = None
+) -> str:
+    """根据暂存区 tree、模型、API base、提示词和模型参数生成缓存键"""
+    prompt_hash = hashlib.sha256((prompt_template or "").encode("utf-8")).hexdigest()
+    payload = json.dumps(
+        {
+            "tree": tree,
+            "model": str(model or ""),
+            "api_base": api_base or "",
+            "prompt": prompt_hash,
+            "settings": settings or {},
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def commit_cache_key(
+    tree: str,
+    model: Optional[str],
+    api_base: Optional[str],
+    prompt_template: Optional[str],
+    map_reduce: bool = False,
+    map_model: Optional[str] = None
+) -> str:
+    """acmt commit 和 acmt daemon 共用的缓存键，两者必须一致才能共享结果"""
+    from .openai_utils import get_request_settings
+    from .semantic import semantic_enabled
+    from .history import history_enabled
+
+    settings = dict(get_request_settings(model), map_reduce=map_reduce, map_model=map_model)
+    # 关闭 semantic 预处理或历史示例时模型看到的提示词不同，不能共用缓存
+    if not semantic_enabled():
+        settings["semantic"] = False
+    if not history_enabled():
+        settings["history"] = False
+    return make_cache_key(tree, model, api_base, prompt_template, settings)
+
+def resolve_generation_settings(map_reduce: bool = False, map_model: Optional[str] = None) -> Dict:
+    """acmt commit 和 acmt daemon 共用的生成参数，可以直接传给 generate_commit_message
+
+    命令行参数优先，其次是配置项 "map_reduce" / "map_model"。
+    """
+    from .config import get_config_value
+
+    if not map_reduce:
+        value = get_config_value("map_reduce", False)
+        if isinstance(value, str):
+            value = value.strip().lower() in ("1", "true", "yes", "on")
+        map_reduce = bool(value)
+    return {
+        "api_key": get_config_value("api_key"),
+        "api_base": get_config_value("api_base"),
+        "model": get_config_value("model"),
+        "prompt_template": get_config_value("prompt"),
+        "map_reduce": map_reduce,
+        "map_model": map_model or get_config_value("map_model"),
+    }
+
+def generation_cache_key(tree: str, settings: Dict) -> str:
+    """按 resolve_generation_settings 的参数计算 commit_cache_key"""
+    return commit_cache_key(
+        tree,
+        settings["model"],
+        settings["api_base"],
+        settings["prompt_template"],
+        settings["map_reduce"],
+        settings["map_model"]
+    )
+
+class ResponseCache:
+    """按内容寻址的提交信息缓存，每个条目一个文件，按修改时间做 LRU 淘汰"""
+
+    def __init__(
+        self,
+        cache_dir: str = CACHE_DIR,
+        max_bytes: int = MAX_CACHE_BYTES,
+        max_age: float = MAX_CACHE_AGE
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存的提交信息，命中时刷新修改时间"""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, 'r') as f:
+                message = json.load(f).get("message")
+            os.utime(path)
+            return message
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, message: str):
+        """写入缓存，先写临时文件再替换，避免并发读到不完整的内容"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"message": message, "created": time.time()}, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def _entries(self):
+        """返回 (修改时间, 大小, 路径) 列表"""
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def evict(self):
+        """删除过期条目，并在超出大小上限时删除最久未使用的条目"""
+        now = time.time()
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self) -> int:
+        """清空缓存，返回删除的条目数"""
+        removed = 0
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def stats(self) -> Dict:
+        """缓存统计信息"""
+        entries = self._entries()
+        mtimes = [mtime for mtime, _, _ in entries]
+        return {
+            "path": self.cache_dir,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "oldest": min(mtimes) if mtimes else None,
+            "newest": max(mtimes) if mtimes else None,
+        }
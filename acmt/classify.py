@@ -0,0 +1,230 @@
+import re
+import json
+from typing import Dict, Iterable, List, Optional
+
+# 文件分类
+DEPENDENCY = "dependency"
+GENERATED = "generated"
+VENDORED = "vendored"
+BINARY = "binary"
+
+CATEGORIES = (DEPENDENCY, GENERATED, VENDORED, BINARY)
+
+# 这些分类的 patch 内容对提交信息没有帮助，只保留文件名
+SKIPPED_CATEGORIES = frozenset([GENERATED, VENDORED, BINARY])
+
+DEPENDENCY_FILES = [
+    'pnpm-lock.yaml',      # pnpm
+    'package-lock.json',   # npm
+    'npm-shrinkwrap.json', # npm
+    'yarn.lock',          # yarn
+    'bun.lockb',          # bun
+    'requirements.txt',    # Python
+    '*-requirements.txt',  # Python
+    'requirements-*.txt',  # Python
+    'poetry.lock',        # Python Poetry
+    'Pipfile.lock',       # Python Pipenv
+    'uv.lock',            # Python uv
+    'pom.xml',           # Maven
+    'build.gradle',      # Gradle
+    'build.gradle.kts',  # Gradle Kotlin
+    'gradle.lockfile',   # Gradle
+    'composer.lock',     # PHP
+    'Gemfile.lock',      # Ruby
+    'Cargo.lock',        # Rust
+    'go.sum',           # Go
+]
+
+# 默认规则：分类 -> glob 列表
+# 不含 "/" 的模式匹配文件名；以 "/" 结尾的模式匹配任意层级的目录；其他模式匹配完整路径，"**" 可跨目录
+DEFAULT_RULES: Dict[str, List[str]] = {
+    DEPENDENCY: DEPENDENCY_FILES,
+    GENERATED: [
+        "*.min.js", "*.min.css", "*.map", "*.snap",
+        "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.pb.h", "*.pb.cc",
+        "*.g.dart", "*.freezed.dart", "*.generated.*", "*.designer.cs",
+    ],
+    VENDORED: [
+        "vendor/", "node_modules/", "third_party/", "third-party/", "bower_components/",
+    ],
+    BINARY: [
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.bmp", "*.ico", "*.webp", "*.pdf",
+        "*.zip", "*.gz", "*.tgz", "*.bz2", "*.xz", "*.7z", "*.jar", "*.war", "*.class",
+        "*.so", "*.dylib", "*.dll", "*.exe", "*.o", "*.a", "*.woff", "*.woff2", "*.ttf",
+        "*.otf", "*.eot", "*.mp3", "*.mp4", "*.mov", "*.avi", "*.wasm", "*.pyc",
+    ],
+}
+
+# 省略内容的文件在 diff 中只保留文件头和这一行说明
+_OMITTED_NOTE = re.compile(r"\((dependency|generated|vendored|binary) file, [^)\n]*omitted\)$")
+
+def omitted_note(category: str, added: int = 0, removed: int = 0) -> str:
+    """替代被省略的 patch 内容的说明行"""
+    if added or removed:
+        return f"({category} file, +{added} -{removed} lines omitted)"
+    return f"({category} file, content omitted)"
+
+def parse_omitted_note(line: str) -> Optional[str]:
+    """如果是 omitted_note 生成的说明行，返回其中的分类"""
+    match = _OMITTED_NOTE.match(line)
+    return match.group(1) if match else None
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+
+# *.ext 形式且扩展名中没有其他通配符，可以直接查表
+_SIMPLE_EXTENSION = re.compile(r"\*\.([^*?\[/.]+)$")
+
+def _glob_to_regex(glob: str) -> str:
+    """把 glob 转换为正则：** 可跨目录，* 和 ? 不跨目录"""
+    parts = []
+    i = 0
+    while i < len(glob):
+        char = glob[i]
+        if glob.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+            continue
+        if glob.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            end = glob.find("]", i + 1)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                parts.append(glob[i:end + 1])
+                i = end
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return "".join(parts)
+
+class _RuleSet:
+    """编译后的一组规则
+
+    按代价从低到高依次检查：文件名表、扩展名表、目录名表，最后是只匹配文件名的
+    合并正则和匹配完整路径的合并正则。大多数路径只需几次字典查找。
+    """
+
+    def __init__(self, rules: Dict[str, Iterable[str]]):
+        self.basenames: Dict[str, str] = {}
+        self.extensions: Dict[str, str] = {}
+        self.directories: Dict[str, str] = {}
+        basename_groups = []
+        path_groups = []
+        self.group_categories: Dict[str, str] = {}
+        for category, patterns in rules.items():
+            for pattern in patterns:
+                if pattern.endswith("/"):
+                    directory = pattern.strip("/")
+                    if "/" not in directory and not pattern.startswith("/") and not _GLOB_CHARS.search(directory):
+                        self.directories.setdefault(directory, category)
+                        continue
+                    # 目录：匹配该目录下的所有文件
+                    prefix = "" if pattern.startswith("/") or "/" in directory else "(?:.*/)?"
+                    regex, groups = f"{prefix}{_glob_to_regex(directory)}/.*", path_groups
+                elif "/" in pattern:
+                    regex, groups = _glob_to_regex(pattern.lstrip("/")), path_groups
+                elif not _GLOB_CHARS.search(pattern):
+                    self.basenames.setdefault(pattern, category)
+                    continue
+                else:
+                    match = _SIMPLE_EXTENSION.match(pattern)
+                    if match:
+                        self.extensions.setdefault(match.group(1).lower(), category)
+                        continue
+                    regex, groups = _glob_to_regex(pattern), basename_groups
+                group = f"g{len(self.group_categories)}"
+                self.group_categories[group] = category
+                groups.append(f"(?P<{group}>{regex})")
+        self.basename_regex = re.compile("|".join(basename_groups)) if basename_groups else None
+        self.path_regex = re.compile("|".join(path_groups)) if path_groups else None
+
+    def match(self, path: str, basename: str, extension: str) -> Optional[str]:
+        category = self.basenames.get(basename) or self.extensions.get(extension)
+        if category:
+            return category
+        if self.directories:
+            for directory in path.split("/")[:-1]:
+                category = self.directories.get(directory)
+                if category:
+                    return category
+        match = self.basename_regex and self.basename_regex.fullmatch(basename)
+        if not match:
+            match = self.path_regex and self.path_regex.fullmatch(path)
+        if match:
+            return self.group_categories[match.lastgroup]
+        return None
+
+# 分类缓存中未命中的标记，分类结果本身可能是 None
+_UNKNOWN = object()
+
+class Classifier:
+    """把路径分为依赖文件、生成文件、第三方代码和二进制文件
+
+    所有规则在创建时编译为文件名表、扩展名表、目录名表和合并的正则，
+    每个路径只需几次字典查找和最多两次正则匹配。用户规则优先于默认规则。
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Iterable[str]]] = None, defaults: bool = True):
+        self._rule_sets = []
+        if rules:
+            unknown = set(rules) - set(CATEGORIES)
+            if unknown:
+                raise ValueError(f"Unknown file categories: {', '.join(sorted(unknown))}")
+            self._rule_sets.append(_RuleSet(rules))
+        if defaults:
+            self._rule_sets.append(_RuleSet(DEFAULT_RULES))
+        self._cache: Dict[str, Optional[str]] = {}
+
+    def classify(self, path: str) -> Optional[str]:
+        """返回路径的分类，普通源代码返回 None"""
+        category = self._cache.get(path, _UNKNOWN)
+        if category is not _UNKNOWN:
+            return category
+        basename = path.rpartition("/")[2]
+        extension = basename.rpartition(".")[2].lower() if "." in basename else ""
+        for rule_set in self._rule_sets:
+            category = rule_set.match(path, basename, extension)
+            if category:
+                break
+        self._cache[path] = category
+        return category
+
+    def classify_all(self, paths: Iterable[str], attributes: Optional[Dict[str, str]] = None) -> Dict[str, Optional[str]]:
+        """批量分类；attributes 为 gitattributes 给出的分类，优先于规则
+
+        attributes 中的值为空字符串时表示属性被显式取消（如 -linguist-generated），
+        只取消规则给出的生成文件或第三方代码分类，锁文件等其他分类不受影响。
+        """
+        attributes = attributes or {}
+        result = {}
+        for path in paths:
+            attribute = attributes.get(path)
+            if attribute:
+                result[path] = attribute
+                continue
+            category = self.classify(path)
+            if attribute == "" and category in (GENERATED, VENDORED):
+                category = None
+            result[path] = category
+        return result
+
+# 按规则内容缓存的分类器
+_classifier_cache = {"rules": None, "classifier": None}
+
+def get_classifier() -> Classifier:
+    """获取使用配置文件 "classify" 规则的分类器，规则不变时复用已编译的分类器"""
+    from .config import get_config_value
+
+    rules = get_config_value("classify") or {}
+    signature = json.dumps(rules, sort_keys=True)
+    if _classifier_cache["rules"] != signature:
+        _classifier_cache["classifier"] = Classifier(rules)
+        _classifier_cache["rules"] = signature
+    return _classifier_cache["classifier"]
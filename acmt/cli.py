@@ -1,14 +1,16 @@
 import click
-from dotenv import load_dotenv
-from pathlib import Path
-from .git_utils import get_staged_diff, commit_with_message
-from .openai_utils import generate_commit_message, Model
-from .config import load_config, save_config, get_config_value, Config
-from . import __version__
+from .git_utils import get_staged_changes, get_staged_tree, get_git_root, get_head, commit_with_message
+from .openai_utils import generate_commit_message, generate_commit_messages, revise_commit_message, Model
+from .config import load_config, save_config, get_config_value, custom_api_base, Config
+from .cache import ResponseCache, resolve_generation_settings, generation_cache_key
+from .models import get_model_info
+from .incremental import load_last_generation, save_last_generation, clear_last_generation, get_revision_delta
+from . import __version__, trace
+import os
 import sys
-
-# 加载环境变量
-load_dotenv()
+import time
+from datetime import datetime
+from typing import Optional
 
 @click.group()
 @click.version_option(__version__, prog_name='acmt', message='%(prog)s version %(version)s')
@@ -17,40 +19,217 @@ def cli():
     pass
 
 @cli.command()
-def commit():
+@click.option('--stream/--no-stream', default=True, help='Show the message as it is generated.')
+@click.option('--no-cache', is_flag=True, help='Ignore cached messages and always call the model.')
+@click.option('--map-reduce', is_flag=True, help='Summarize oversized diffs in parallel chunks instead of compacting them.')
+@click.option('--map-model', help='Cheaper model used for chunk summaries in --map-reduce mode.')
+@click.option('--candidates', '-n', type=click.IntRange(1, 10), default=1, show_default=True,
+              help='Generate several alternative messages and pick one.')
+@click.option('--profile', is_flag=True, help='Print a per-stage timing breakdown when done.')
+@click.option('--full', is_flag=True, help='Generate from the full diff instead of revising the previous message.')
+@click.option('--server', metavar='URL', help='Generate through a shared acmt serve instance (defaults to the server setting).')
+def commit(stream: bool, no_cache: bool, map_reduce: bool, map_model: Optional[str], candidates: int, profile: bool,
+           full: bool, server: Optional[str]):
     """Generate commit message for staged changes."""
+    # 追踪只在 --profile 或配置了 trace_file 时开启
+    started = time.monotonic()
+    trace_file = get_config_value("trace_file")
+    if profile or trace_file:
+        trace.enable(trace_file, command="commit", started=started)
+        trace.mark("config.resolve", since=started)
     try:
         # 获取 diff 和依赖文件列表
-        diff, dependency_files = get_staged_diff()
+        diff, dependency_files, dependency_summary = get_staged_changes()
         if not diff and not dependency_files:
             click.echo("No staged changes found. Please stage your changes first using 'git add'.", err=True)
             return
              
         # 获取配置
-        api_key = get_config_value("api_key")
-        api_base = get_config_value("api_base")
-        model = get_config_value("model")
-        prompt = get_config_value("prompt")
+        # 与守护进程共用同一组参数和缓存键，才能取到它预先生成的结果
+        settings = resolve_generation_settings(map_reduce, map_model)
+        api_key = settings["api_key"]
+        api_base = settings["api_base"]
+        model = settings["model"]
+        prompt = settings["prompt_template"]
+        map_reduce = settings["map_reduce"]
+        map_model = settings["map_model"]
+        # 共享服务一次性返回结果；不支持流式输出的模型也一次性显示
+        server = server or get_config_value("server")
+        if server and candidates > 1:
+            raise ValueError("--candidates is not supported with --server")
+        stream = stream and not server and get_model_info(model).streaming
 
-        # 生成提交消息
-        commit_message = generate_commit_message(
-            diff=diff,
-            api_key=api_key,
-            api_base=api_base,
-            model=model,
-            prompt_template=prompt,
-            dependency_files=dependency_files
-        )
-        
-        # 显示生成的消息
-        click.echo("Generated commit message:")
-        click.echo("-" * 40)
-        click.echo(commit_message)
+        # 按暂存区 tree 查找缓存
+        cache = None if no_cache else ResponseCache()
+        cache_key = None
+        tree = get_staged_tree()
+        with trace.span("cache.lookup") as span:
+            if cache and tree:
+                cache_key = generation_cache_key(tree, settings)
+            # 多候选模式下用户想看到新的选项，不读取缓存
+            commit_message = cache.get(cache_key) if cache_key and candidates == 1 else None
+            span.set(hit=commit_message is not None)
+
+        # 记录为当前暂存区生成的提交信息，再次暂存更多改动后只发送增量 diff
+        git_root = get_git_root() if tree else None
+        head = get_head() if git_root else None
+        context = generation_cache_key("", settings) if git_root else None
+
+        def remember(message: str):
+            if git_root:
+                save_last_generation(git_root, tree, head, context, message)
+
+        def forget():
+            if git_root:
+                clear_last_generation(git_root)
+
+        def history_examples() -> Optional[list]:
+            """仓库中改动过相似文件的历史提交信息，作为风格示例"""
+            if not git_root:
+                return None
+            from .history import find_examples
+
+            with trace.span("history") as span:
+                examples = find_examples(git_root, head)
+                span.set(examples=len(examples))
+            return examples
+
+        if candidates > 1:
+            click.echo("Generated commit messages:")
+            click.echo("-" * 40)
+
+            # 每个候选生成后立即显示，用户阅读时其余候选继续生成
+            shown = []
+
+            def show_candidate(message: str):
+                shown.append(message)
+                lines = message.split("\n")
+                click.echo(f"[{len(shown)}] {lines[0]}")
+                for line in lines[1:]:
+                    click.echo(f"    {line}" if line else "")
+                click.echo()
+
+            messages = generate_commit_messages(
+                diff=diff,
+                api_key=api_key,
+                candidates=candidates,
+                api_base=api_base,
+                model=model,
+                prompt_template=prompt,
+                dependency_files=dependency_files,
+                dependency_summary=dependency_summary,
+                on_candidate=show_candidate,
+                map_reduce=map_reduce,
+                map_model=map_model,
+                examples=history_examples()
+            )
+            click.echo("-" * 40)
+
+            with trace.span("user.select"):
+                choice = click.prompt(
+                    "Select a message to commit (0 to cancel)",
+                    type=click.IntRange(0, len(messages)),
+                    default=1
+                )
+            if choice == 0:
+                click.echo("Commit cancelled.")
+                return
+            commit_message = messages[choice - 1]
+            if cache_key:
+                cache.put(cache_key, commit_message)
+            remember(commit_message)
+            if commit_with_message(commit_message):
+                forget()
+                click.echo("Changes committed successfully!")
+            else:
+                click.echo("Failed to commit changes", err=True)
+            return
+
+        # 守护进程正在为当前暂存区生成时，等待它的结果而不是重复请求
+        if not commit_message and cache_key and candidates == 1:
+            from .daemon import fetch_message
+
+            with trace.span("daemon.fetch") as span:
+                if git_root:
+                    commit_message = fetch_message(git_root, cache_key)
+                span.set(hit=commit_message is not None)
+
+        if commit_message:
+            click.echo("Generated commit message (cached):")
+            click.echo("-" * 40)
+            click.echo(commit_message)
+        else:
+            # 上一次生成之后又暂存了少量改动时，只发送两个 tree 之间的 diff 和上一次的提交信息
+            delta = None
+            previous = None
+            if git_root and not full and not server:
+                with trace.span("incremental") as span:
+                    previous = load_last_generation(git_root)
+                    delta = get_revision_delta(previous, tree, head, context, diff)
+                    span.set(revise=delta is not None)
+            title = "Revised commit message:" if delta else "Generated commit message:"
+
+            # 流式输出时先显示标题，消息随生成逐步显示
+            if stream:
+                click.echo(title)
+                click.echo("-" * 40)
+
+            # 生成提交消息
+            if server:
+                from .server import build_payload, request_message
+
+                payload = build_payload(
+                    diff, model, prompt, dependency_files, dependency_summary, history_examples(), map_reduce, map_model
+                )
+                with trace.span("server.request") as span:
+                    commit_message, source = request_message(server, payload, get_config_value("server_token"))
+                    span.set(source=source)
+            elif delta:
+                delta_diff, delta_files, delta_summary = delta
+                commit_message = revise_commit_message(
+                    previous_message=previous["message"],
+                    delta=delta_diff,
+                    api_key=api_key,
+                    api_base=api_base,
+                    model=model,
+                    prompt_template=prompt,
+                    dependency_files=delta_files,
+                    dependency_summary=delta_summary,
+                    stream=stream
+                )
+            else:
+                commit_message = generate_commit_message(
+                    diff=diff,
+                    api_key=api_key,
+                    api_base=api_base,
+                    model=model,
+                    prompt_template=prompt,
+                    dependency_files=dependency_files,
+                    dependency_summary=dependency_summary,
+                    stream=stream,
+                    map_reduce=map_reduce,
+                    map_model=map_model,
+                    examples=history_examples()
+                )
+            if cache_key:
+                cache.put(cache_key, commit_message)
+
+            # 显示生成的消息
+            if stream:
+                click.echo()
+            else:
+                click.echo(title)
+                click.echo("-" * 40)
+                click.echo(commit_message)
         click.echo("-" * 40)
+        remember(commit_message)
         
         # 询问是否提交
-        if click.confirm("Do you want to commit with this message?"):
+        with trace.span("user.confirm"):
+            confirmed = click.confirm("Do you want to commit with this message?")
+        if confirmed:
             if commit_with_message(commit_message):
+                forget()
                 click.echo("Changes committed successfully!")
             else:
                 click.echo("Failed to commit changes", err=True)
@@ -59,6 +238,67 @@ def commit():
 
     except Exception as e:
         click.echo(f"Error: {str(e)}", err=True)
+    finally:
+        if profile:
+            click.echo(trace.format_report(), err=True)
+        trace.disable()
+
+@cli.command()
+@click.option('--model', 'model_name', help='Model to estimate for, defaults to the configured model.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the estimate as JSON.')
+def estimate(model_name: Optional[str], as_json: bool):
+    """Report prompt tokens and cost for the staged changes without calling the model."""
+    import json
+    from .models import count_tokens, has_exact_tokenizer
+    from .openai_utils import build_chat_request, prepare_diff
+    from .history import find_examples
+
+    try:
+        diff, dependency_files, dependency_summary = get_staged_changes()
+        if not diff and not dependency_files:
+            click.echo("No staged changes found. Please stage your changes first using 'git add'.", err=True)
+            return
+
+        model = model_name or get_config_value("model")
+        prompt = get_config_value("prompt")
+        info = get_model_info(model)
+        git_root = get_git_root()
+        examples = find_examples(git_root) if git_root else []
+
+        content, _ = prepare_diff(diff, model, prompt)
+        request = build_chat_request(content, model, prompt, dependency_summary=dependency_summary,
+                                     examples=examples)
+        system, user = request["messages"]
+        result = {
+            "model": info.name,
+            "context_window": info.context_window,
+            "tokenizer": info.tokenizer if has_exact_tokenizer(model) else None,
+            "diff_tokens": count_tokens(diff, model),
+            "sent_diff_tokens": count_tokens(user["content"], model),
+            "prompt_tokens": count_tokens(system["content"], model) + count_tokens(user["content"], model),
+            "max_output_tokens": info.max_tokens,
+            "input_price": info.input_price,
+            "output_price": info.output_price,
+        }
+        result["cost"] = info.cost(result["prompt_tokens"], result["max_output_tokens"])
+
+        if as_json:
+            click.echo(json.dumps(result))
+            return
+        counting = f"tokenizer {result['tokenizer']}" if result["tokenizer"] else "estimated from characters"
+        click.echo(f"Model:          {info.name or 'default'} (context {info.context_window} tokens, {counting})")
+        click.echo(f"Staged diff:    {result['diff_tokens']} tokens")
+        compacted = " (compacted to fit the budget)" if result["sent_diff_tokens"] < result["diff_tokens"] else ""
+        click.echo(f"Sent to model:  {result['sent_diff_tokens']} tokens{compacted}")
+        click.echo(f"Prompt total:   {result['prompt_tokens']} tokens, answer up to {info.max_tokens} tokens")
+        if result["cost"] is None:
+            click.echo("Estimated cost: unknown (no price for this model, see 'acmt model add --input-price')")
+        else:
+            click.echo(f"Estimated cost: ${result['cost']:.4f} "
+                       f"(${info.input_price:.2f} / ${info.output_price:.2f} per 1M tokens)")
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
 
 @cli.command()
 def init():
@@ -76,7 +316,7 @@ def init():
             click.echo(f"{i}. {prefix}{model.value}")
         
         # 显示自定义模型
-        custom_models = config.get("custom_models", {})
+        custom_models = {name: custom_api_base(value) for name, value in config.get("custom_models", {}).items()}
         custom_start = len(models) + 1
         if custom_models:
             click.echo("\nCustom models:")
@@ -111,8 +351,11 @@ def init():
                     default=api_base
                 )
         
-        # 设置 API key
-        api_key = click.prompt('\nEnter your API key', type=str)
+        # 设置 API key；本地模型不需要
+        if model_name == Model.LOCAL.value:
+            api_key = "local"
+        else:
+            api_key = click.prompt('\nEnter your API key', type=str)
         if not api_key:
             raise ValueError("API key is required")
         
@@ -250,6 +493,10 @@ def list_models():
             "Together": {
                 "models": [Model.MISTRAL, Model.MIXTRAL],
                 "description": "Open source models hosted by Together AI"
+            },
+            "Local": {
+                "models": [Model.LOCAL],
+                "description": "Quantized models running on this machine, no network needed"
             }
         }
         
@@ -268,9 +515,9 @@ def list_models():
         custom_models = config.get("custom_models", {})
         if custom_models:
             click.echo("Custom Models:")
-            for name, api_base in custom_models.items():
+            for name, value in custom_models.items():
                 prefix = "* " if name == current_model else "  "
-                click.echo(f"{prefix}{name}: {api_base}")
+                click.echo(f"{prefix}{name}: {custom_api_base(value)}")
             click.echo()
         
         # 显示说明
@@ -285,11 +532,28 @@ def list_models():
 @model.command()
 @click.argument('name')
 @click.argument('api_base')
-def add(name: str, api_base: str):
+@click.option('--context-window', type=int, help='Context window in tokens.')
+@click.option('--tokenizer', help='tiktoken encoding used to count tokens, e.g. cl100k_base.')
+@click.option('--input-price', type=float, help='USD per million prompt tokens.')
+@click.option('--output-price', type=float, help='USD per million completion tokens.')
+@click.option('--max-tokens', type=int, help='Maximum tokens of the generated message.')
+@click.option('--streaming/--no-streaming', default=None, help='Whether the API supports streaming.')
+def add(name: str, api_base: str, context_window: Optional[int], tokenizer: Optional[str],
+        input_price: Optional[float], output_price: Optional[float], max_tokens: Optional[int],
+        streaming: Optional[bool]):
     """Add a custom model configuration"""
     try:
         config = Config()
-        config.add_custom_model(name, api_base)
+        config.add_custom_model(
+            name,
+            api_base,
+            context_window=context_window,
+            tokenizer=tokenizer,
+            input_price=input_price,
+            output_price=output_price,
+            max_tokens=max_tokens,
+            streaming=streaming
+        )
         click.echo(f"Successfully added custom model '{name}'")
     except Exception as e:
         click.echo(f"Failed to add custom model: {str(e)}", err=True)
@@ -308,5 +572,273 @@ def remove_model(name):
     except Exception as e:
         click.echo(f"Error: {str(e)}", err=True)
 
+@cli.command()
+@click.argument('repos', nargs=-1, type=click.Path(exists=True, file_okay=False))
+@click.option('--manifest', type=click.Path(exists=True, dir_okay=False), help='File listing one repository path per line.')
+@click.option('--concurrency', default=8, show_default=True, help='Maximum concurrent model requests.')
+@click.option('--rate-limit', type=float, help='Maximum requests per second to the provider.')
+@click.option('--workers', default=8, show_default=True, help='Threads used for git operations.')
+@click.option('--dry-run', is_flag=True, help='Generate messages without committing.')
+@click.option('--report', type=click.File('w'), default='-', help='JSON-lines report file (default: stdout).')
+@click.option('--bulk', is_flag=True, help="Submit all requests as one job through the provider's batch API (cheaper, slower).")
+@click.option('--provider', help='Provider adapter for --bulk, detected from the API base by default.')
+@click.option('--poll-interval', type=float, default=30, show_default=True, help='Maximum seconds between batch status checks.')
+@click.option('--bulk-timeout', type=float, help='Cancel the batch job if it has not finished after this many seconds.')
+def batch(repos, manifest, concurrency, rate_limit, workers, dry_run, report, bulk, provider, poll_interval, bulk_timeout):
+    """Generate messages and commit staged changes in many repositories."""
+    from .batch import run_batch, run_bulk_batch, read_manifest, provider_key, dedupe_repos
+
+    repos = list(repos)
+    if manifest:
+        repos.extend(read_manifest(manifest))
+    repos, duplicates = dedupe_repos(repos)
+    for repo in duplicates:
+        click.echo(f"Warning: {repo} is listed more than once, processing it once", err=True)
+    if not repos:
+        click.echo("No repositories given. Pass repository paths or --manifest.", err=True)
+        sys.exit(1)
+
+    # 限速：命令行参数优先，其次是配置文件中按服务商主机名配置的 rate_limits
+    rate_limits = dict(load_config().get("rate_limits") or {})
+    if rate_limit:
+        rate_limits["*"] = rate_limit
+        rate_limits.pop(provider_key(get_config_value("api_base")), None)
+
+    def write_report(line: str):
+        report.write(line + "\n")
+        report.flush()
+
+    if bulk:
+        results = run_bulk_batch(
+            repos,
+            api_key=get_config_value("api_key"),
+            api_base=get_config_value("api_base"),
+            model=get_config_value("model"),
+            prompt_template=get_config_value("prompt"),
+            provider=provider or get_config_value("provider"),
+            workers=workers,
+            dry_run=dry_run,
+            poll_interval=poll_interval,
+            timeout=bulk_timeout,
+            report=write_report,
+            on_status=lambda status: click.echo(f"Batch status: {status}", err=True)
+        )
+    else:
+        results = run_batch(
+            repos,
+            api_key=get_config_value("api_key"),
+            api_base=get_config_value("api_base"),
+            model=get_config_value("model"),
+            prompt_template=get_config_value("prompt"),
+            concurrency=concurrency,
+            rate_limits=rate_limits,
+            workers=workers,
+            dry_run=dry_run,
+            report=write_report
+        )
+    failed = sum(1 for result in results if result["status"] == "failed")
+    click.echo(f"{len(results)} repositories, {failed} failed", err=True)
+    if failed:
+        sys.exit(1)
+
+@cli.command()
+@click.argument('rev_range', metavar='BASE..[BRANCH]')
+@click.option('--concurrency', '-c', type=click.IntRange(1), default=8, show_default=True,
+              help='Maximum concurrent model requests.')
+@click.option('--dry-run', is_flag=True, help='Generate and show the new messages without rewriting.')
+@click.option('--restart', is_flag=True, help='Ignore messages saved by an interrupted run.')
+@click.option('--yes', '-y', is_flag=True, help='Rewrite without asking for confirmation.')
+def reword(rev_range: str, concurrency: int, dry_run: bool, restart: bool, yes: bool):
+    """Regenerate the messages of existing commits and rewrite the branch."""
+    from .reword import run_reword
+
+    try:
+        def confirm(count: int, ref: str) -> bool:
+            return yes or click.confirm(f"Rewrite {count} commit messages on {ref}?")
+
+        result = run_reword(
+            rev_range,
+            concurrency=concurrency,
+            dry_run=dry_run,
+            restart=restart,
+            confirm=confirm,
+            log=click.echo
+        )
+        if result["backup"]:
+            click.echo(f"Rewrote {result['rewritten']} commits. The original branch is saved as {result['backup']}.")
+        elif dry_run and result["commits"]:
+            click.echo("Dry run: history not rewritten. Run again without --dry-run to apply these messages.")
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
+
+@cli.command()
+@click.option('--debounce', type=float, default=0.5, show_default=True,
+              help='Seconds the staged changes must stay unchanged before generating.')
+@click.option('--stop', is_flag=True, help='Stop the daemon running for this repository.')
+def daemon(debounce: float, stop: bool):
+    """Pre-generate commit messages in the background whenever staged changes change."""
+    from .daemon import run_daemon, stop_daemon
+
+    try:
+        if stop:
+            if stop_daemon():
+                click.echo("Daemon stopped.")
+            else:
+                click.echo("No daemon is running for this repository.", err=True)
+            return
+
+        def log(message: str):
+            click.echo(f"[{datetime.now():%H:%M:%S}] {message}")
+
+        run_daemon(debounce=debounce, log=log)
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', show_default=True, help='Address to listen on.')
+@click.option('--port', type=int, default=8765, show_default=True, help='Port to listen on.')
+@click.option('--concurrency', type=click.IntRange(1), default=16, show_default=True,
+              help='Maximum concurrent model requests, also the connection pool size.')
+@click.option('--rate-limit', type=float, help='Maximum requests per second to the provider.')
+@click.option('--memory-entries', type=click.IntRange(1), default=1024, show_default=True,
+              help='Messages kept in the in-memory LRU cache.')
+@click.option('--model', 'model_name', help='Default model, defaults to the configured model.')
+@click.option('--api-base', help='Provider API base, defaults to the configured api_base.')
+@click.option('--api-key', help='Provider API key, defaults to the configured api_key.')
+@click.option('--token', help='Require this bearer token from clients (defaults to the server_token setting).')
+def serve(host: str, port: int, concurrency: int, rate_limit: Optional[float], memory_entries: int,
+          model_name: Optional[str], api_base: Optional[str], api_key: Optional[str], token: Optional[str]):
+    """Serve commit message generation to a team over HTTP."""
+    from .server import run_server
+
+    try:
+        def log(message: str):
+            click.echo(f"[{datetime.now():%H:%M:%S}] {message}")
+
+        run_server(
+            host=host,
+            port=port,
+            log=log,
+            api_key=api_key or get_config_value("api_key"),
+            api_base=api_base or get_config_value("api_base"),
+            model=model_name or get_config_value("model"),
+            prompt=get_config_value("prompt"),
+            concurrency=concurrency,
+            rate_limit=rate_limit,
+            memory_entries=memory_entries,
+            token=token or get_config_value("server_token")
+        )
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
+
+@cli.group()
+def local():
+    """Run local models without network access."""
+    pass
+
+@local.command(name="serve")
+@click.option('--model-path', type=click.Path(exists=True, dir_okay=False),
+              help='GGUF model file, defaults to the local_model setting.')
+@click.option('--host', default='127.0.0.1', show_default=True, help='Address to listen on.')
+@click.option('--port', type=int, default=8080, show_default=True, help='Port to listen on.')
+def local_serve(model_path: Optional[str], host: str, port: int):
+    """Keep a local model loaded and serve it to acmt commit."""
+    from .local import get_local_model_path, serve
+
+    try:
+        model_path = model_path or get_local_model_path()
+        if not model_path:
+            raise ValueError("No model file. Pass --model-path or set local_model in config.json")
+
+        def log(message: str):
+            click.echo(f"[{datetime.now():%H:%M:%S}] {message}")
+
+        serve(model_path, host=host, port=port, log=log)
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
+
+@cli.group()
+def history():
+    """Manage the index of past commit messages used as style examples."""
+    pass
+
+@history.command(name="update")
+@click.option('--all', 'index_all', is_flag=True, help='Index the whole history instead of the most recent commits.')
+@click.option('--rebuild', is_flag=True, help='Drop the index and build it again.')
+def history_update(index_all: bool, rebuild: bool):
+    """Index commits added since the last update."""
+    from .history import HistoryIndex, MAX_INITIAL_COMMITS
+
+    try:
+        git_root = get_git_root()
+        if not git_root:
+            raise ValueError("Not a git repository")
+        with HistoryIndex(git_root) as index:
+            if rebuild or index_all:
+                index.clear()
+            added = index.update(max_commits=None if index_all else MAX_INITIAL_COMMITS)
+            click.echo(f"Indexed {added} new commits, {index.count()} in total.")
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
+
+@history.command(name="search")
+@click.argument('paths', nargs=-1)
+@click.option('-k', type=int, default=3, show_default=True, help='Number of messages to show.')
+def history_search(paths, k: int):
+    """Show the past messages used as examples for PATHS (default: staged files)."""
+    from .history import HistoryIndex, get_staged_paths
+
+    try:
+        git_root = get_git_root()
+        if not git_root:
+            raise ValueError("Not a git repository")
+        with HistoryIndex(git_root) as index:
+            index.update()
+            for message in index.search(list(paths) or get_staged_paths(git_root), k):
+                click.echo(message)
+                click.echo("-" * 40)
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
+
+@history.command(name="clear")
+def history_clear():
+    """Remove the index of this repository."""
+    from .history import index_path
+
+    git_root = get_git_root()
+    if git_root and os.path.exists(index_path(git_root)):
+        os.remove(index_path(git_root))
+        click.echo("History index removed.")
+    else:
+        click.echo("No history index for this repository.")
+
+@cli.group()
+def cache():
+    """Manage cached commit messages."""
+    pass
+
+@cache.command(name="stats")
+def cache_stats():
+    """Show cache statistics."""
+    stats = ResponseCache().stats()
+    click.echo(f"Path: {stats['path']}")
+    click.echo(f"Entries: {stats['entries']}")
+    click.echo(f"Size: {stats['bytes'] / 1024:.1f} KB / {stats['max_bytes'] / 1024:.0f} KB")
+    if stats["oldest"] is not None:
+        click.echo(f"Oldest: {datetime.fromtimestamp(stats['oldest']):%Y-%m-%d %H:%M:%S}")
+        click.echo(f"Newest: {datetime.fromtimestamp(stats['newest']):%Y-%m-%d %H:%M:%S}")
+
+@cache.command(name="clear")
+def cache_clear():
+    """Remove all cached commit messages."""
+    removed = ResponseCache().clear()
+    click.echo(f"Removed {removed} cached messages.")
+
 if __name__ == "__main__":
     cli()
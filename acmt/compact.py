@@ -0,0 +1,270 @@
+from typing import List, Optional, Tuple
+
+from .classify import SKIPPED_CATEGORIES, Classifier, get_classifier, parse_omitted_note
+
+# 粗略估算：平均每个 token 约 4 个字符
+CHARS_PER_TOKEN = 4
+
+# 保留在改动行周围的上下文行数
+DEFAULT_CONTEXT_LINES = 1
+
+# 剩余预算小于这个字符数时不再尝试放入 hunk
+MIN_HUNK_CHARS = 64
+
+# 当整个 diff 只剩下一个大 hunk 时，至少保留预算的这一比例用于截断输出
+MIN_TRUNCATE_RATIO = 0.25
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """估算文本的 token 数量"""
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class _FileDiff:
+    """单个文件的 diff 片段"""
+
+    __slots__ = ("path", "header", "body", "_hunks", "added", "removed", "skipped")
+
+    def __init__(self, text: str, classifier: Classifier):
+        # 第一个 hunk 之前的部分是文件头
+        pos = text.find("\n@@")
+        if pos == -1:
+            self.header, self.body = text, ""
+        else:
+            self.header, self.body = text[:pos], text[pos + 1:]
+
+        self.path = _parse_path(self.header)
+        self._hunks = None
+
+        # 用 str.count 统计增删行数，避免逐行遍历
+        self.added = text.count("\n+") - self.header.count("\n+++ ")
+        self.removed = text.count("\n-") - self.header.count("\n--- ")
+
+        # get_staged_changes 已经省略内容的文件（包括按 gitattributes 分类的）
+        omitted = parse_omitted_note(self.header.rstrip("\n").rpartition("\n")[2])
+        if omitted:
+            self.skipped = omitted
+        elif "\nBinary files " in self.header or "\nGIT binary patch" in self.header:
+            self.skipped = "binary"
+        else:
+            category = classifier.classify(self.path)
+            self.skipped = category if category in SKIPPED_CATEGORIES else None
+
+    @property
+    def hunks(self) -> List[str]:
+        """按需切分 hunk，只输出统计信息时无需切分"""
+        if self._hunks is None:
+            self._hunks = _split_hunks(self.body) if self.body else []
+        return self._hunks
+
+    def stat_line(self) -> str:
+        return f"{self.path} | +{self.added} -{self.removed}"
+
+    def short_header(self) -> str:
+        """只保留 diff --git 行和新增/删除/重命名等信息，去掉 index 行"""
+        lines = self.header.split("\n")
+        kept = [lines[0]]
+        for line in lines[1:]:
+            if line.startswith(("index ", "--- ", "+++ ", "similarity index", "dissimilarity index")):
+                continue
+            kept.append(line)
+        return "\n".join(kept)
+
+
+def _parse_path(header: str) -> str:
+    """从文件头中解析出文件路径"""
+    for marker in ("\n+++ b/", "\nrename to ", "\n--- a/"):
+        pos = header.find(marker)
+        if pos != -1:
+            end = header.find("\n", pos + 1)
+            return header[pos + len(marker):end if end != -1 else None]
+    first_line = header.split("\n", 1)[0]
+    # diff --git a/<path> b/<path>
+    pos = first_line.rfind(" b/")
+    return first_line[pos + 3:] if pos != -1 else first_line
+
+
+def split_diff_files(diff: str) -> List[str]:
+    """按 "diff --git" 切分 diff，每个元素对应一个文件"""
+    parts = diff.split("\ndiff --git ")
+    files = [parts[0]] if parts[0].startswith("diff --git ") else []
+    files.extend("diff --git " + part for part in parts[1:])
+    return files
+
+
+def _split_hunks(body: str) -> List[str]:
+    """按 "@@" 切分 hunk；内容行都带有前缀，所以行首的 "@@" 一定是 hunk 头"""
+    parts = body.split("\n@@")
+    return [parts[0]] + ["@@" + part for part in parts[1:]]
+
+
+def shrink_context(hunk: str, context_lines: int = DEFAULT_CONTEXT_LINES) -> str:
+    """只保留改动行及其附近的上下文行"""
+    lines = hunk.split("\n")
+    # "~" 开头的是 semantic 预处理写入的说明行，和改动行一样保留
+    changed = [
+        i for i, line in enumerate(lines)
+        if i > 0 and line[:1] in ("+", "-", "~")
+    ]
+    if not changed:
+        return lines[0]
+
+    keep = bytearray(len(lines))
+    keep[0] = 1
+    for i in changed:
+        start = max(1, i - context_lines)
+        end = min(len(lines), i + context_lines + 1)
+        keep[start:end] = b"\x01" * (end - start)
+
+    result = []
+    gap = False
+    for i, line in enumerate(lines):
+        if keep[i]:
+            result.append(line)
+            gap = False
+        elif not gap and line:
+            result.append(" ...")
+            gap = True
+    return "\n".join(result)
+
+
+def _rank_hunks(files: List[_FileDiff]) -> List[Tuple[int, int]]:
+    """给所有 hunk 排序，返回 (文件序号, hunk 序号) 列表
+
+    优先保证覆盖面：先取每个文件中最重要的 hunk，再取次重要的，以此类推。
+    同一轮中，改动密度越高的 hunk 越靠前。
+    """
+    ranked = []
+    for file_index, file_diff in enumerate(files):
+        if file_diff.skipped:
+            continue
+        scored = []
+        for hunk_index, hunk in enumerate(file_diff.hunks):
+            changes = hunk.count("\n+") + hunk.count("\n-")
+            density = changes / (hunk.count("\n") + 1)
+            scored.append((density, changes, hunk_index))
+        scored.sort(reverse=True)
+        for rank, (density, changes, hunk_index) in enumerate(scored):
+            ranked.append((rank, -density, -changes, file_index, hunk_index))
+    ranked.sort()
+    return [(item[3], item[4]) for item in ranked]
+
+
+def _omitted_line(count: int) -> str:
+    return f" ... ({count} more hunks omitted)"
+
+
+def compact_diff(
+    diff: Optional[str],
+    max_tokens: int,
+    context_lines: int = DEFAULT_CONTEXT_LINES,
+) -> Optional[str]:
+    """把 diff 压缩到给定的 token 预算之内
+
+    1. 跳过二进制文件、生成文件和第三方代码，只保留文件名
+    2. 每个文件先以一行统计信息 (path | +N -M) 占位
+    3. 按重要性依次加入缩减了上下文的 hunk，直到预算用完
+    4. 未能放入任何 hunk 的文件以统计信息的形式列出
+
+    Args:
+        diff: 原始的 git diff 内容
+        max_tokens: diff 可以使用的 token 预算
+        context_lines: 每个改动周围保留的上下文行数
+
+    Returns:
+        压缩后的 diff；如果原始 diff 已经在预算之内则原样返回
+    """
+    if not diff:
+        return diff
+
+    budget = max_tokens * CHARS_PER_TOKEN
+    if len(diff) <= budget:
+        return diff
+
+    classifier = get_classifier()
+    files = [_FileDiff(text, classifier) for text in split_diff_files(diff)]
+    skipped = [f for f in files if f.skipped]
+    kept = [f for f in files if not f.skipped]
+
+    # 为统计信息和跳过的文件预留空间
+    skipped_line = ""
+    if skipped:
+        skipped_line = "Skipped binary/generated/vendored files: " + ", ".join(f.path for f in skipped)
+        if len(skipped_line) > budget // 4:
+            skipped_line = skipped_line[:budget // 4] + f" ... ({len(skipped)} files)"
+    stat_lines = [f.stat_line() for f in kept]
+    reserved = len(skipped_line) + sum(len(line) + 1 for line in stat_lines)
+
+    # 文件太多，连统计信息都放不下时只输出统计信息
+    if reserved >= budget:
+        return _summarize_only(stat_lines, kept, skipped_line, budget)
+
+    remaining = budget - reserved
+    selected = {}  # 文件序号 -> {hunk 序号: 压缩后的 hunk}
+    for file_index, hunk_index in _rank_hunks(kept):
+        if remaining < MIN_HUNK_CHARS:
+            break
+        file_diff = kept[file_index]
+        hunk = shrink_context(file_diff.hunks[hunk_index], context_lines)
+        cost = len(hunk) + 1
+        if file_index not in selected:
+            # 第一次选中这个文件：文件头替换掉统计信息
+            cost += len(file_diff.short_header()) + 1 - (len(stat_lines[file_index]) + 1)
+            if len(file_diff.hunks) > 1:
+                cost += len(_omitted_line(len(file_diff.hunks))) + 1
+        if cost > remaining:
+            # 第一个 hunk 就放不下时，若剩余空间足够大则截断后放入
+            if file_index in selected or remaining < budget * MIN_TRUNCATE_RATIO:
+                continue
+            marker = "\n ... (truncated)"
+            hunk = hunk[:max(0, len(hunk) - (cost - remaining) - len(marker))] + marker
+            cost = remaining
+        selected.setdefault(file_index, {})[hunk_index] = hunk
+        remaining -= cost
+
+    output = []
+    others = []
+    for file_index, file_diff in enumerate(kept):
+        hunks = selected.get(file_index)
+        if not hunks:
+            others.append(stat_lines[file_index])
+            continue
+        output.append(file_diff.short_header())
+        output.extend(hunks[i] for i in sorted(hunks))
+        omitted = len(file_diff.hunks) - len(hunks)
+        if omitted:
+            output.append(_omitted_line(omitted))
+
+    if others:
+        output.append("Other changed files:")
+        output.extend(others)
+    if skipped_line:
+        output.append(skipped_line)
+    return "\n".join(output)
+
+
+def _summarize_only(
+    stat_lines: List[str],
+    files: List[_FileDiff],
+    skipped_line: str,
+    budget: int,
+) -> str:
+    """只输出文件统计信息，超出预算的部分合并为一行"""
+    output = ["Changed files:"]
+    used = len(output[0]) + len(skipped_line) + 80
+    count = 0
+    for line in stat_lines:
+        if used + len(line) + 1 > budget:
+            break
+        output.append(line)
+        used += len(line) + 1
+        count += 1
+    rest = files[count:]
+    if rest:
+        added = sum(f.added for f in rest)
+        removed = sum(f.removed for f in rest)
+        output.append(f"... and {len(rest)} more files (+{added} -{removed})")
+    if skipped_line:
+        output.append(skipped_line)
+    return "\n".join(output)
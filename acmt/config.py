@@ -1,7 +1,8 @@
 import os
+import copy
 import json
 from typing import Dict, Optional
-from dotenv import load_dotenv
+from . import trace
 
 CONFIG_DIR = os.path.expanduser("~/.config/acmt")
 CONFIG_FILE = os.path.join(CONFIG_DIR, "config.json")
@@ -19,52 +20,111 @@ Add a blank line followed by a more detailed description if necessary.
 """
 }
 
+# 配置文件解析结果缓存：(文件签名, 配置)
+_file_cache = {"signature": None, "config": None}
+
+# 合并后的配置缓存：(各层签名, 配置)
+_resolved_cache = {"signature": None, "config": None}
+
 def ensure_config_dir():
     """确保配置目录存在"""
     if not os.path.exists(CONFIG_DIR):
         os.makedirs(CONFIG_DIR)
 
-def load_config() -> Dict:
-    """加载配置文件"""
-    ensure_config_dir()
-    if not os.path.exists(CONFIG_FILE):
-        return DEFAULT_CONFIG.copy()
-    
+def _file_signature(path: str):
+    """文件签名：修改时间和大小，文件不存在时为 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _read_config_file(path: str, signature) -> Dict:
+    """读取配置文件，签名未变时直接返回缓存"""
+    if signature is None:
+        return DEFAULT_CONFIG
+    if _file_cache["signature"] == (path, signature):
+        return _file_cache["config"]
     try:
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-            return {**DEFAULT_CONFIG, **config}
+        with open(path, 'r') as f:
+            config = {**DEFAULT_CONFIG, **json.load(f)}
     except Exception:
-        return DEFAULT_CONFIG.copy()
+        config = DEFAULT_CONFIG
+    _file_cache["signature"] = (path, signature)
+    _file_cache["config"] = config
+    return config
 
-def save_config(config: Dict):
-    """保存配置文件"""
+def load_config() -> Dict:
+    """加载配置文件，返回可修改的副本"""
+    return copy.deepcopy(_read_config_file(CONFIG_FILE, _file_signature(CONFIG_FILE)))
+
+def _write_config_file(path: str, config: Dict):
+    """写入配置文件，并直接更新缓存，无需重新解析"""
     ensure_config_dir()
-    with open(CONFIG_FILE, 'w') as f:
+    with open(path, 'w') as f:
         json.dump(config, f, indent=2)
+    _file_cache["signature"] = (path, _file_signature(path))
+    _file_cache["config"] = copy.deepcopy({**DEFAULT_CONFIG, **config})
+    _resolved_cache["signature"] = None
+
+def save_config(config: Dict):
+    """保存配置文件"""
+    _write_config_file(CONFIG_FILE, config)
+
+def _read_dotenv(path: str) -> Dict[str, str]:
+    """读取 .env 中的 ACMT_ 配置项
+
+    其他变量（如 OPENAI_API_KEY、HTTPS_PROXY）与 load_dotenv 一样写入进程环境变量，
+    已经设置的不覆盖，OpenAI 客户端和 httpx 从环境变量中读取它们；
+    ACMT_ 配置项不写入环境变量，它们参与配置缓存的签名。
+    """
+    from dotenv import dotenv_values
+
+    values = {}
+    for key, value in dotenv_values(path).items():
+        if key.startswith("ACMT_"):
+            if value:
+                values[key] = value
+        elif value is not None and key not in os.environ:
+            os.environ[key] = value
+    return values
+
+def resolve_config() -> Dict:
+    """合并各层配置，按优先级顺序：.env文件 > 环境变量 > 配置文件
+
+    结果在进程内缓存，配置文件或 .env 的修改时间、环境变量变化时才重新合并；
+    返回的字典是共享的，不要修改。
+    """
+    dotenv_path = os.path.join(os.getcwd(), '.env')
+    config_signature = _file_signature(CONFIG_FILE)
+    dotenv_signature = _file_signature(dotenv_path)
+    environ = tuple(sorted((k, v) for k, v in os.environ.items() if k.startswith("ACMT_")))
+    signature = (config_signature, dotenv_path, dotenv_signature, environ)
+    if _resolved_cache["signature"] == signature:
+        return _resolved_cache["config"]
+
+    with trace.span("config.resolve", dotenv=dotenv_signature is not None):
+        # 3. 配置文件
+        config = dict(_read_config_file(CONFIG_FILE, config_signature))
+        # 2. 环境变量
+        for env_key, value in environ:
+            config[env_key[len("ACMT_"):].lower()] = value
+        # 1. .env 文件
+        if dotenv_signature is not None:
+            for env_key, value in _read_dotenv(dotenv_path).items():
+                config[env_key[len("ACMT_"):].lower()] = value
+
+    _resolved_cache["signature"] = signature
+    _resolved_cache["config"] = config
+    return config
 
 def get_config_value(key: str, default=None) -> Optional[str]:
     """获取配置值，按优先级顺序：.env文件 > 环境变量 > 配置文件"""
-    env_key = f"ACMT_{key.upper()}"
-    # 1. 首先尝试.env文件
-    load_dotenv()
-    env_value = os.getenv(env_key)
-    if env_value:
-        # 检查这个值是否来自.env文件
-        try:
-            with open(os.path.join(os.getcwd(), '.env'), 'r') as f:
-                if any(line.strip().startswith(env_key) for line in f):
-                    return env_value
-        except FileNotFoundError:
-            pass
-    
-    # 2. 然后尝试环境变量
-    if env_key in os.environ:
-        return os.environ[env_key]
-    
-    # 3. 最后尝试配置文件
-    config = load_config()
-    return config.get(key, default)
+    return resolve_config().get(key, default)
+
+def custom_api_base(value) -> Optional[str]:
+    """custom_models 中的条目可以是 API base 字符串，也可以是包含 api_base 和其他字段的字典"""
+    return value.get("api_base") if isinstance(value, dict) else value
 
 def get_custom_model(name: str) -> Optional[dict]:
     """获取指定名称的自定义模型配置"""
@@ -74,36 +134,37 @@ def get_custom_model(name: str) -> Optional[dict]:
 class Config:
     def __init__(self):
         self.config_file = CONFIG_FILE
+        # 配置在实例内只解析一次，之后的读写都基于内存中的数据
+        self._data: Optional[Dict] = None
     
     def load_config(self) -> Dict:
         """加载配置文件"""
-        ensure_config_dir()
-        if not os.path.exists(self.config_file):
-            return DEFAULT_CONFIG.copy()
-        
-        try:
-            with open(self.config_file, 'r') as f:
-                config = json.load(f)
-                return {**DEFAULT_CONFIG, **config}
-        except Exception:
-            return DEFAULT_CONFIG.copy()
+        if self._data is None:
+            self._data = copy.deepcopy(_read_config_file(self.config_file, _file_signature(self.config_file)))
+        return self._data
     
     def save_config(self, config: Dict):
         """保存配置文件"""
-        ensure_config_dir()
-        with open(self.config_file, 'w') as f:
-            json.dump(config, f, indent=2)
+        _write_config_file(self.config_file, config)
+        self._data = config
     
-    def add_custom_model(self, name: str, api_base: str):
-        """Add a custom model configuration"""
+    def add_custom_model(self, name: str, api_base: str, **fields):
+        """Add a custom model configuration
+
+        fields 覆盖模型表中的字段，如 context_window、tokenizer、input_price；
+        没有额外字段时只保存 API base
+        """
         if not name or not api_base:
             raise ValueError("Model name and API base URL are required")
+        from .models import parse_overrides
+
+        overrides = parse_overrides({k: v for k, v in fields.items() if v is not None})
             
         config = self.load_config()
         if 'custom_models' not in config:
             config['custom_models'] = {}
             
-        config['custom_models'][name] = api_base
+        config['custom_models'][name] = dict(overrides, api_base=api_base) if overrides else api_base
         self.save_config(config)
     
     def remove_custom_model(self, name: str):
@@ -118,9 +179,9 @@ class Config:
         self.save_config(config)
     
     def get_custom_models(self) -> dict:
-        """Get all custom model configurations"""
+        """Get all custom model configurations: name -> API base"""
         config = self.load_config()
-        return config.get('custom_models', {})
+        return {name: custom_api_base(value) for name, value in config.get('custom_models', {}).items()}
     
     def get_model_config(self, model_name: str) -> Optional[dict]:
         """Get configuration for a specific model"""
@@ -128,7 +189,10 @@ class Config:
         custom_models = config.get('custom_models', {})
         
         if model_name in custom_models:
+            value = custom_models[model_name]
+            if isinstance(value, dict):
+                return dict(value)
             return {
-                'api_base': custom_models[model_name]
+                'api_base': value
             }
         return None
@@ -0,0 +1,262 @@
+import os
+import json
+import socket
+import hashlib
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+from .cache import CACHE_DIR, ResponseCache, generation_cache_key, resolve_generation_settings
+from .git_utils import aget_staged_changes, get_git_root, get_head, get_staged_tree, run_git_command
+
+# 守护进程只在运行时导入 asyncio，acmt commit 连接守护进程时只需要 socket
+if TYPE_CHECKING:
+    import asyncio
+
+# socket 文件放在运行时目录下，没有时放在缓存目录下
+RUNTIME_DIR = os.path.join(os.environ["XDG_RUNTIME_DIR"], "acmt") if os.environ.get("XDG_RUNTIME_DIR") \
+    else CACHE_DIR
+
+# 暂存区稳定这么久（秒）之后才开始生成，避免连续 git add 时重复请求
+DEFAULT_DEBOUNCE = 0.5
+
+# 检查 index 修改时间的间隔（秒）
+POLL_INTERVAL = 0.2
+
+# acmt commit 等待进行中的请求的最长时间（秒）
+DEFAULT_WAIT_TIMEOUT = 60.0
+
+def socket_path(git_root: str) -> str:
+    """每个仓库一个 socket，文件名取仓库路径的哈希，避免超出 socket 路径长度限制"""
+    digest = hashlib.sha1(os.path.abspath(git_root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(RUNTIME_DIR, f"daemon-{digest}.sock")
+
+def request_daemon(git_root: str, request: Dict, timeout: float = DEFAULT_WAIT_TIMEOUT) -> Optional[Dict]:
+    """向仓库的守护进程发送一个请求，守护进程未运行时返回 None"""
+    path = socket_path(git_root)
+    if not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        return json.loads(data) if data else None
+    except (OSError, ValueError):
+        return None
+
+def fetch_message(git_root: str, key: str, timeout: float = DEFAULT_WAIT_TIMEOUT) -> Optional[str]:
+    """从守护进程获取预生成的提交信息，有进行中的请求时等待它完成"""
+    response = request_daemon(git_root, {"op": "get", "key": key, "wait": timeout}, timeout + 1)
+    if response and response.get("status") == "ready":
+        return response.get("message")
+    return None
+
+class Daemon:
+    """监视暂存区，在暂存内容变化后预先生成提交信息
+
+    生成结果写入 ResponseCache，缓存键与 acmt commit 相同；同一个键同时只有一个请求，
+    acmt commit 通过 unix socket 等待进行中的请求，而不是重复发送。
+    """
+
+    def __init__(
+        self,
+        git_root: str,
+        debounce: float = DEFAULT_DEBOUNCE,
+        cache: Optional[ResponseCache] = None,
+        log: Optional[Callable[[str], None]] = None
+    ):
+        self.git_root = git_root
+        self.debounce = debounce
+        self.cache = cache or ResponseCache()
+        self.log = log or (lambda message: None)
+        self.socket_path = socket_path(git_root)
+        self._inflight: Dict[str, "asyncio.Task"] = {}
+        self._stopping = None
+
+        # 支持 worktree：index 文件不一定在 <root>/.git/index
+        returncode, stdout, _ = run_git_command(['git', 'rev-parse', '--git-path', 'index'], cwd=git_root)
+        if returncode != 0:
+            raise Exception(f"Error: {git_root} is not a git repository")
+        self.index_path = os.path.join(git_root, stdout.strip())
+
+    def _index_signature(self):
+        try:
+            stat = os.stat(self.index_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+
+    async def refresh(self) -> Optional[str]:
+        """计算当前暂存区的缓存键，没有缓存也没有进行中的请求时开始生成"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        tree = await loop.run_in_executor(None, get_staged_tree, self.git_root)
+        if not tree:
+            return None
+        # 参数和缓存键与 acmt commit 相同（包括 map_reduce / map_model 配置）
+        settings = resolve_generation_settings()
+        key = generation_cache_key(tree, settings)
+        if key not in self._inflight and self.cache.get(key) is None:
+            self._inflight[key] = asyncio.create_task(self._generate(key, tree, settings))
+        return key
+
+    async def _generate(self, key: str, tree: str, settings: Dict) -> Optional[str]:
+        """与 acmt commit 相同：读取暂存区 diff 后生成提交信息并写入缓存"""
+        import asyncio
+        from .openai_utils import agenerate_commit_message
+
+        loop = asyncio.get_running_loop()
+        try:
+            diff, dependency_files, dependency_summary = await aget_staged_changes(self.git_root)
+            if not diff and not dependency_files:
+                return None
+            from .history import find_examples
+
+            head = await loop.run_in_executor(None, get_head, self.git_root)
+            examples = await loop.run_in_executor(None, find_examples, self.git_root, head)
+            self.log(f"Generating message for tree {tree[:12]}")
+            message = await agenerate_commit_message(
+                diff=diff,
+                dependency_files=dependency_files,
+                dependency_summary=dependency_summary,
+                examples=examples,
+                **settings
+            )
+            self.cache.put(key, message)
+            self.log(f"Message ready for tree {tree[:12]}")
+            return message
+        except Exception as e:
+            # 失败时 acmt commit 会自己重新生成并显示错误
+            self.log(str(e))
+            return None
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _watch(self):
+        """轮询 index 的修改时间，变化后等待暂存区稳定再生成"""
+        import asyncio
+
+        signature = None
+        changed_at = None
+        loop = asyncio.get_running_loop()
+        while True:
+            current = self._index_signature()
+            if current != signature:
+                signature = current
+                changed_at = loop.time()
+            elif changed_at is not None and loop.time() - changed_at >= self.debounce:
+                changed_at = None
+                await self.refresh()
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _get(self, key: str, wait: float) -> Dict:
+        import asyncio
+
+        message = self.cache.get(key)
+        if message is not None:
+            return {"status": "ready", "message": message}
+
+        # 守护进程还没注意到这次暂存，立即检查一次
+        task = self._inflight.get(key)
+        if task is None and await self.refresh() == key:
+            task = self._inflight.get(key)
+        if task is None:
+            message = self.cache.get(key)
+            if message is not None:
+                return {"status": "ready", "message": message}
+            return {"status": "missing"}
+
+        try:
+            message = await asyncio.wait_for(asyncio.shield(task), wait)
+        except asyncio.TimeoutError:
+            return {"status": "pending"}
+        if message is None:
+            return {"status": "missing"}
+        return {"status": "ready", "message": message}
+
+    async def _handle(self, reader: "asyncio.StreamReader", writer: "asyncio.StreamWriter"):
+        try:
+            request = json.loads(await reader.readline() or b"{}")
+            op = request.get("op")
+            if op == "get":
+                response = await self._get(request.get("key", ""), float(request.get("wait", DEFAULT_WAIT_TIMEOUT)))
+            elif op == "ping":
+                response = {"status": "ok", "repo": self.git_root, "inflight": len(self._inflight)}
+            elif op == "stop":
+                response = {"status": "ok"}
+                self._stopping.set()
+            else:
+                response = {"status": "error", "error": f"unknown op: {op}"}
+            writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+        except Exception as e:
+            self.log(f"Error: {str(e)}")
+        finally:
+            writer.close()
+
+    async def serve(self):
+        import asyncio
+        from .openai_utils import aclose_clients
+
+        # socket 文件存在但无法连接时说明上次没有正常退出
+        if request_daemon(self.git_root, {"op": "ping"}, timeout=1) is not None:
+            raise Exception(f"Error: acmt daemon is already running for {self.git_root}")
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+
+        self._stopping = asyncio.Event()
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        watcher = asyncio.create_task(self._watch())
+        self.log(f"Watching {self.git_root} (socket: {self.socket_path})")
+        try:
+            await self._stopping.wait()
+        finally:
+            watcher.cancel()
+            server.close()
+            await server.wait_closed()
+            for task in list(self._inflight.values()):
+                task.cancel()
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
+            await aclose_clients()
+
+def run_daemon(
+    cwd: Optional[str] = None,
+    debounce: float = DEFAULT_DEBOUNCE,
+    log: Optional[Callable[[str], None]] = None
+):
+    """Watch the staged changes of a repository and pre-generate commit messages.
+
+    Runs until stopped with ``stop_daemon`` or interrupted.
+
+    Args:
+        cwd: Optional path inside the repository, defaults to the current directory
+        debounce: Seconds the index must stay unchanged before generating
+        log: Optional callback receiving progress messages
+    """
+    import asyncio
+
+    git_root = get_git_root(cwd)
+    if not git_root:
+        raise Exception("Error: not a git repository")
+    try:
+        asyncio.run(Daemon(git_root, debounce=debounce, log=log).serve())
+    except KeyboardInterrupt:
+        pass
+
+def stop_daemon(cwd: Optional[str] = None) -> bool:
+    """停止仓库的守护进程，没有运行时返回 False"""
+    git_root = get_git_root(cwd)
+    if not git_root:
+        return False
+    return request_daemon(git_root, {"op": "stop"}, timeout=5) is not None
@@ -1,116 +1,553 @@
-import os
+import functools
 import subprocess
-from typing import Optional, Tuple, List
-
-DEPENDENCY_FILES = [
-    'pnpm-lock.yaml',      # pnpm
-    'package-lock.json',   # npm
-    'yarn.lock',          # yarn
-    'bun.lockb',          # bun
-    'requirements.txt',    # Python
-    'poetry.lock',        # Python Poetry
-    'Pipfile.lock',       # Python Pipenv
-    'pom.xml',           # Maven
-    'build.gradle',      # Gradle
-    'build.gradle.kts',  # Gradle Kotlin
-    'gradle.lockfile',   # Gradle
-    'composer.lock',     # PHP
-    'Gemfile.lock',      # Ruby
-    'cargo.lock',        # Rust
-    'go.sum',           # Go
-]
+from typing import Dict, Optional, Tuple, List
+from . import trace
+from .lockfiles import LockfileDiff, format_dependency_summary
+from .classify import DEPENDENCY, DEPENDENCY_FILES, SKIPPED_CATEGORIES, get_classifier, omitted_note
+
 
 MAX_DIFF_LENGTH = 5000  # 设置一个合理的阈值，超过这个长度就认为是大规模依赖更新
 
-def run_git_command(command: list[str]) -> Tuple[int, str, str]:
+# 读取 git 输出时每次读取的字节数
+READ_CHUNK_SIZE = 1 << 16
+
+# 每个文件的 patch 都以这一行开头；内容行都带有前缀，所以不会误匹配
+PATCH_HEADER = b"\ndiff --git "
+
+def run_git_command(command: list[str], cwd: Optional[str] = None) -> Tuple[int, str, str]:
     """运行 git 命令"""
     try:
         process = subprocess.Popen(
             command,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True
+            text=True,
+            cwd=cwd
         )
         stdout, stderr = process.communicate()
         return process.returncode, stdout, stderr
     except Exception as e:
         return 1, "", str(e)
 
-def get_git_root() -> Optional[str]:
+def get_git_root(cwd: Optional[str] = None) -> Optional[str]:
     """获取 git 仓库的根目录"""
-    returncode, stdout, _ = run_git_command(['git', 'rev-parse', '--show-toplevel'])
+    returncode, stdout, _ = run_git_command(['git', 'rev-parse', '--show-toplevel'], cwd=cwd)
     if returncode == 0:
         return stdout.strip()
     return None
 
-def get_staged_diff() -> tuple[Optional[str], Optional[List[str]]]:
-    """Get the diff of staged changes and dependency files.
-    
+def get_head(cwd: Optional[str] = None) -> Optional[str]:
+    """获取 HEAD 的提交哈希，还没有提交时返回 None"""
+    returncode, stdout, _ = run_git_command(['git', 'rev-parse', '-q', '--verify', 'HEAD'], cwd=cwd)
+    if returncode == 0:
+        return stdout.strip()
+    return None
+
+def get_staged_tree(cwd: Optional[str] = None) -> Optional[str]:
+    """获取暂存区对应的 tree 对象哈希"""
+    with trace.span("git.write_tree"):
+        returncode, stdout, _ = run_git_command(['git', 'write-tree'], cwd=cwd)
+    if returncode == 0:
+        return stdout.strip()
+    return None
+
+def is_dependency_file(path: str) -> bool:
+    """判断文件是否为依赖文件"""
+    return get_classifier().classify(path) == DEPENDENCY
+
+# gitattributes 中表示生成文件和第三方代码的属性
+LINGUIST_ATTRIBUTES = {
+    "linguist-generated": "generated",
+    "linguist-vendored": "vendored",
+}
+
+CHECK_ATTR_COMMAND = ['git', 'check-attr', '-z', '--stdin', *LINGUIST_ATTRIBUTES]
+
+def get_linguist_attributes(paths: List[str], cwd: Optional[str] = None) -> Dict[str, str]:
+    """用一次 git check-attr 读取 linguist-generated / linguist-vendored 属性
+
+    paths 为相对仓库根目录的路径（git diff 的输出），所以在根目录运行 check-attr，
+    而不是在 cwd 所在的子目录中。
+
     Returns:
-        A tuple of (diff_content, dependency_files), where:
+        路径 -> 分类；属性被显式取消（-linguist-generated 或 false）时为空字符串
+    """
+    if not paths:
+        return {}
+    git_root = get_git_root(cwd)
+    if not git_root:
+        return {}
+    try:
+        with trace.span("git.check_attr", paths=len(paths)):
+            result = subprocess.run(
+                CHECK_ATTR_COMMAND,
+                input=_check_attr_input(paths),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                cwd=git_root
+            )
+    except OSError:
+        return {}
+    if result.returncode != 0:
+        return {}
+    return _parse_check_attr(result.stdout)
+
+async def aget_linguist_attributes(paths: List[str], cwd: Optional[str] = None) -> Dict[str, str]:
+    """get_linguist_attributes 的异步版本"""
+    if not paths:
+        return {}
+    returncode, stdout = await _arun(['git', 'rev-parse', '--show-toplevel'], cwd)
+    if returncode != 0:
+        return {}
+    with trace.span("git.check_attr", paths=len(paths)):
+        returncode, stdout = await _arun(
+            CHECK_ATTR_COMMAND, stdout.decode("utf-8", "replace").strip(), _check_attr_input(paths)
+        )
+    if returncode != 0:
+        return {}
+    return _parse_check_attr(stdout)
+
+async def _arun(command: List[str], cwd: Optional[str], input: Optional[bytes] = None) -> Tuple[int, bytes]:
+    """运行一个输出较少的 git 命令，返回 (退出码, stdout)；取消时结束子进程"""
+    import asyncio
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            cwd=cwd
+        )
+    except OSError:
+        return 1, b""
+    try:
+        stdout, _ = await process.communicate(input)
+    finally:
+        await _akill(process)
+    return process.returncode, stdout
+
+def _check_attr_input(paths: List[str]) -> bytes:
+    return "\0".join(paths).encode("utf-8") + b"\0"
+
+def _parse_check_attr(stdout: bytes) -> Dict[str, str]:
+    # 输出为 <path>\0<attribute>\0<value>\0 三元组
+    fields = stdout.decode("utf-8", "replace").split("\0")
+    attributes = {}
+    for i in range(0, len(fields) - 2, 3):
+        path, attribute, value = fields[i:i + 3]
+        if value in ("set", "true"):
+            if not attributes.get(path):
+                attributes[path] = LINGUIST_ATTRIBUTES[attribute]
+        elif value in ("unset", "false"):
+            attributes.setdefault(path, "")
+    return attributes
+
+class _OmittedPatch:
+    """生成文件、第三方代码和二进制文件的 patch：只保留文件头和增删行数"""
+
+    __slots__ = ("category", "header", "added", "removed", "_in_body", "_line_start")
+
+    def __init__(self, category: str):
+        self.category = category
+        self.header = b""
+        self.added = 0
+        self.removed = 0
+        self._in_body = False
+        self._line_start = False
+
+    def feed(self, data: bytes):
+        if not self._in_body:
+            self.header += data
+            pos = self.header.find(b"\n@@")
+            if pos == -1:
+                return
+            data = self.header[pos + 1:]
+            self.header = self.header[:pos + 1]
+            self._in_body = True
+            self._line_start = True
+        # 跨块的行首也要计入
+        if self._line_start and data[:1] in (b"+", b"-"):
+            if data[:1] == b"+":
+                self.added += 1
+            else:
+                self.removed += 1
+        self.added += data.count(b"\n+")
+        self.removed += data.count(b"\n-")
+        self._line_start = data.endswith(b"\n")
+
+    def render(self) -> bytes:
+        header = self.header if self.header.endswith(b"\n") else self.header + b"\n"
+        note = omitted_note(self.category, self.added, self.removed)
+        return header + note.encode("utf-8") + b"\n"
+
+class _RawEntryParser:
+    """解析 --raw -z 输出的文件列表，按块输入，同步和异步读取共用
+
+    每条记录形如 ":<mode> <mode> <sha> <sha> <status>\\0<path>\\0"，重命名和复制
+    会多一个路径；文件列表之后紧跟一个空字段，然后是 patch 内容。
+    """
+
+    def __init__(self):
+        # [(status, paths), ...]
+        self.entries: List[Tuple[str, List[str]]] = []
+        self._fields: List[str] = []
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> Optional[bytes]:
+        """输入一块输出；文件列表还没结束时返回 None，结束时返回之后的 patch 字节"""
+        buffer = self._buffer + chunk
+        offset = 0
+        while True:
+            pos = buffer.find(b"\0", offset)
+            if pos == -1:
+                self._buffer = buffer[offset:]
+                return None
+            field = buffer[offset:pos]
+            offset = pos + 1
+            if not self._fields:
+                if not field:
+                    # 文件列表结束，剩下的是 patch
+                    self._buffer = b""
+                    return buffer[offset:]
+                self._fields.append(field.decode("utf-8", "replace"))
+                continue
+            self._fields.append(field.decode("utf-8", "replace"))
+            status = self._fields[0].rsplit(" ", 1)[-1]
+            if status[:1] in ("R", "C") and len(self._fields) < 3:
+                continue
+            self.entries.append((status, self._fields[1:]))
+            self._fields = []
+
+def get_staged_changes(cwd: Optional[str] = None) -> Tuple[Optional[str], Optional[List[str]], Optional[str]]:
+    """Get the staged diff, the changed dependency files and a summary of their version changes.
+
+    Runs a single ``git diff --cached -z --raw --patch -M`` and splits its
+    output while reading it: the raw file list tells which patch belongs to
+    a dependency file, so those patches are streamed into a lockfile parser
+    instead of being buffered, and only the version changes are kept.
+
+    Args:
+        cwd: Optional directory inside the repository, defaults to the current directory
+
+    Returns:
+        A tuple of (diff_content, dependency_files, dependency_summary), where:
         - diff_content: The diff content of non-dependency files, or None if no changes
         - dependency_files: List of dependency files changed, or None if no dependency updates
+        - dependency_summary: "name: old → new" table of dependency changes, or None
+
+    Raises:
+        Exception: If git fails; nothing is printed
     """
-    try:
-        # 获取 git 根目录
-        git_root = get_git_root()
-        if not git_root:
-            return None, None
+    return _read_changes(['--cached'], cwd, "git.diff")
+
+def get_tree_changes(
+    old_tree: str,
+    new_tree: str,
+    cwd: Optional[str] = None
+) -> Tuple[Optional[str], Optional[List[str]], Optional[str]]:
+    """两个 tree 之间的变更，处理方式与 get_staged_changes 相同（依赖文件、生成文件等）"""
+    return _read_changes([old_tree, new_tree], cwd, "git.diff_trees")
+
+def _read_changes(
+    revisions: List[str],
+    cwd: Optional[str],
+    span_name: str
+) -> Tuple[Optional[str], Optional[List[str]], Optional[str]]:
+    with trace.span(span_name) as span:
+        diff, dep_files, dependency_summary = _read_diff(revisions, cwd, span)
+        span.set(
+            bytes=len(diff) if diff else 0,
+            dependency_files=len(dep_files) if dep_files else 0,
+        )
+    return diff, dep_files, dependency_summary
+
+def _diff_command(revisions: List[str]) -> List[str]:
+    return ['git', 'diff', *revisions, '-z', '--raw', '--patch', '-M']
 
-        # 切换到 git 根目录
-        original_dir = os.getcwd()
-        os.chdir(git_root)
+def _read_diff(revisions: List[str], cwd: Optional[str], span) -> Tuple[Optional[str], Optional[List[str]], Optional[str]]:
+    """get_staged_changes 和 get_tree_changes 的实现，span 用于记录读取的字节数和文件数"""
+    read = [0]
+    entries = []
 
+    def read_chunk() -> bytes:
+        chunk = process.stdout.read(READ_CHUNK_SIZE)
+        read[0] += len(chunk)
+        return chunk
+
+    try:
+        process = subprocess.Popen(
+            _diff_command(revisions),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=cwd
+        )
         try:
-            # 获取所有暂存的文件列表，包括重命名操作
-            returncode, stdout, _ = run_git_command(['git', 'diff', '--cached', '--name-status', '-M'])
-            if returncode != 0:
-                return None, None
-
-            # 解析状态和文件名
-            staged_files = []
-            for line in stdout.strip().split('\n'):
-                if not line:
-                    continue
-                # 分割状态和文件名
-                parts = line.split(maxsplit=2)  # 使用 maxsplit=2 来处理重命名操作
-                status = parts[0]
-                
-                if status.startswith('R'):  # 处理重命名操作
-                    if len(parts) >= 3:
-                        # 对于重命名操作，我们需要同时记录新旧文件名
-                        old_file, new_file = parts[1], parts[2]
-                        staged_files.extend([old_file, new_file])
-                elif len(parts) >= 2:
-                    staged_files.append(parts[1])
-
-            if not staged_files:
-                return None, None
-
-            # 分离依赖文件和非依赖文件
-            dep_files = [f for f in staged_files if any(f.endswith(dep) for dep in DEPENDENCY_FILES)]
-            non_dep_files = [f for f in staged_files if not any(f.endswith(dep) for dep in DEPENDENCY_FILES)]
-
-            # 获取非依赖文件的 diff
-            diff = None
-            if non_dep_files:
-                returncode, stdout, _ = run_git_command(['git', 'diff', '--cached', '--'] + non_dep_files)
-                if returncode == 0:
-                    diff = stdout
-
-            return diff, dep_files if dep_files else None
+            chunks = iter(read_chunk, b"")
+            parser = _RawEntryParser()
+            pending = None
+            for chunk in chunks:
+                pending = parser.feed(chunk)
+                if pending is not None:
+                    break
+            entries = _resolved_entries(parser.entries)
+            if not entries:
+                return None, None, None
+            splitter = _PatchSplitter(entries, get_linguist_attributes(_entry_paths(entries), cwd))
+            splitter.feed(pending or b"")
+            for chunk in chunks:
+                splitter.feed(chunk)
+            parts = splitter.close()
         finally:
-            # 恢复原始目录
-            os.chdir(original_dir)
+            process.stdout.close()
+            process.wait()
+            span.set(files=len(entries), read_bytes=read[0])
+
+        if process.returncode != 0:
+            return None, None, None
+        return _render_changes(*parts)
     except Exception as e:
-        print(f"Error getting staged diff: {str(e)}")
-        return None, None
+        # 不向 stdout 输出：acmt batch 的 JSON 行报告默认写到 stdout，由调用方记录错误
+        raise Exception(f"Error getting staged diff: {str(e)}")
+
+def _resolved_entries(entries: List[Tuple[str, List[str]]]) -> List[Tuple[str, List[str]]]:
+    # 冲突中的文件没有 "diff --git" patch，不参与对应
+    return [entry for entry in entries if not entry[0].startswith("U")]
+
+def _entry_paths(entries: List[Tuple[str, List[str]]]) -> List[str]:
+    return [path for _, paths in entries for path in paths]
+
+class _PatchSplitter:
+    """把 patch 分给各个文件，按块输入，同步和异步读取共用
+
+    依赖文件的 patch 直接交给锁文件解析器，生成文件等只统计行数，
+    只有保留原文的 patch 留在内存中。
+    """
+
+    def __init__(self, entries: List[Tuple[str, List[str]]], attributes: Dict[str, str]):
+        # 按路径分类，gitattributes 中的 linguist-* 属性优先
+        all_paths = _entry_paths(entries)
+        with trace.span("classify", paths=len(all_paths)):
+            categories = get_classifier().classify_all(all_paths, attributes)
+
+        # 每个文件的 patch 写到哪里：普通文件保留原文，依赖文件交给锁文件解析器，
+        # 生成文件等只统计行数
+        self.kept = []
+        self.dep_files = []
+        self.lockfiles = []
+        self._sinks = []
+        self._starts = []
+        for _, paths in entries:
+            category = next((categories[path] for path in reversed(paths) if categories[path]), None)
+            start = None
+            if category == DEPENDENCY:
+                self.dep_files.extend(paths)
+                lockfile = LockfileDiff(paths[-1])
+                self.lockfiles.append(lockfile)
+                sink = lockfile.feed
+            elif category in SKIPPED_CATEGORIES:
+                omitted = _OmittedPatch(category)
+                sink = omitted.feed
+                start = functools.partial(self.kept.append, omitted)
+            else:
+                sink = self.kept.append
+            self._sinks.append(sink)
+            self._starts.append(start)
+
+        self._index = -1
+        self._header = None
+        self._sink = None
+        self._buffer = b"\n"
+
+    def feed(self, chunk: bytes):
+        """按 "diff --git" 切分 patch，第 i 段对应第 i 个文件；
+        类型变更（T）会输出两段相同文件头的 patch，对应同一个文件"""
+        buffer = self._buffer + chunk
+        start = search = 0
+        while True:
+            pos = buffer.find(PATCH_HEADER, search)
+            if pos == -1:
+                break
+            line_end = buffer.find(b"\n", pos + 1)
+            if line_end == -1:
+                # 文件头还没读完整，等待下一块
+                break
+            if self._sink:
+                self._sink(buffer[start:pos + 1])
+            new_header = buffer[pos + 1:line_end]
+            if new_header != self._header:
+                self._index += 1
+                if self._index < len(self._starts) and self._starts[self._index]:
+                    self._starts[self._index]()
+            self._header = new_header
+            self._sink = self._sinks[self._index] if self._index < len(self._sinks) else None
+            start = pos + 1
+            search = line_end
+
+        # 保留可能是下一个文件头前缀的尾部
+        if pos != -1:
+            flush_end = pos
+        else:
+            flush_end = max(start, len(buffer) - len(PATCH_HEADER) + 1)
+        if self._sink:
+            self._sink(buffer[start:flush_end])
+        self._buffer = buffer[flush_end:]
+
+    def close(self) -> Tuple[List, List[str], List[LockfileDiff]]:
+        """输出结束
+
+        Returns:
+            (保留的 patch 片段, 依赖文件, 锁文件解析器)，交给 _render_changes
+        """
+        if self._sink:
+            self._sink(self._buffer)
+        self._buffer = b""
+        return self.kept, self.dep_files, self.lockfiles
+
+def _render_changes(kept: List, dep_files: List[str], lockfiles: List[LockfileDiff]) -> Tuple[Optional[str], Optional[List[str]], Optional[str]]:
+    diff = b"".join(
+        part.render() if isinstance(part, _OmittedPatch) else part for part in kept
+    ).lstrip(b"\n").decode("utf-8", "replace") or None
+    if not dep_files:
+        return diff, None, None
+    for lockfile in lockfiles:
+        lockfile.close()
+    return diff, dep_files, format_dependency_summary(lockfiles)
+
+async def _akill(process: "asyncio.subprocess.Process"):
+    """结束还在运行的子进程并等待退出；超时或取消时不留下 git 进程"""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+async def _aread_diff(revisions: List[str], cwd: Optional[str], span) -> Tuple[Optional[str], Optional[List[str]], Optional[str]]:
+    """_read_diff 的异步版本：用 asyncio 子进程按块读取输出，边读边切分，读取期间不阻塞事件循环"""
+    import asyncio
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *_diff_command(revisions),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            cwd=cwd
+        )
+    except OSError as e:
+        raise Exception(f"Error getting staged diff: {str(e)}")
+    read = [0]
+    entries = []
+
+    async def read_chunk() -> bytes:
+        chunk = await process.stdout.read(READ_CHUNK_SIZE)
+        read[0] += len(chunk)
+        return chunk
+
+    try:
+        parser = _RawEntryParser()
+        pending = None
+        while pending is None:
+            chunk = await read_chunk()
+            if not chunk:
+                break
+            pending = parser.feed(chunk)
+        entries = _resolved_entries(parser.entries)
+        if not entries:
+            return None, None, None
+        splitter = _PatchSplitter(entries, await aget_linguist_attributes(_entry_paths(entries), cwd))
+        splitter.feed(pending or b"")
+        while True:
+            chunk = await read_chunk()
+            if not chunk:
+                break
+            splitter.feed(chunk)
+        parts = splitter.close()
+        await process.wait()
+    finally:
+        await _akill(process)
+        span.set(files=len(entries), read_bytes=read[0])
+
+    if process.returncode != 0:
+        return None, None, None
+    return _render_changes(*parts)
+
+async def aget_staged_changes(
+    cwd: Optional[str] = None,
+    timeout: Optional[float] = None
+) -> Tuple[Optional[str], Optional[List[str]], Optional[str]]:
+    """Asynchronous version of get_staged_changes, built on asyncio subprocesses.
+
+    Nothing is printed. When the timeout expires or the calling task is
+    cancelled, the git processes are killed before the exception propagates.
+
+    Args:
+        cwd: Optional directory inside the repository, defaults to the current directory
+        timeout: Optional limit in seconds, raises asyncio.TimeoutError when exceeded
+
+    Returns:
+        Same as get_staged_changes
+    """
+    return await _aread_changes(['--cached'], cwd, "git.diff", timeout)
+
+async def aget_tree_changes(
+    old_tree: str,
+    new_tree: str,
+    cwd: Optional[str] = None,
+    timeout: Optional[float] = None
+) -> Tuple[Optional[str], Optional[List[str]], Optional[str]]:
+    """get_tree_changes 的异步版本，也可以传入两个提交"""
+    return await _aread_changes([old_tree, new_tree], cwd, "git.diff_trees", timeout)
+
+async def _aread_changes(
+    revisions: List[str],
+    cwd: Optional[str],
+    span_name: str,
+    timeout: Optional[float]
+) -> Tuple[Optional[str], Optional[List[str]], Optional[str]]:
+    import asyncio
+
+    async def read():
+        with trace.span(span_name) as span:
+            diff, dep_files, dependency_summary = await _aread_diff(revisions, cwd, span)
+            span.set(
+                bytes=len(diff) if diff else 0,
+                dependency_files=len(dep_files) if dep_files else 0,
+            )
+        return diff, dep_files, dependency_summary
+
+    return await asyncio.wait_for(read(), timeout)
+
+def get_staged_diff(cwd: Optional[str] = None) -> tuple[Optional[str], Optional[List[str]]]:
+    """Get the diff of staged changes and dependency files.
+
+    Args:
+        cwd: Optional directory inside the repository, defaults to the current directory
+
+    Returns:
+        A tuple of (diff_content, dependency_files), see get_staged_changes
+    """
+    diff, dep_files, _ = get_staged_changes(cwd)
+    return diff, dep_files
+
+async def aget_staged_diff(
+    cwd: Optional[str] = None,
+    timeout: Optional[float] = None
+) -> tuple[Optional[str], Optional[List[str]]]:
+    """Asynchronous version of get_staged_diff, see aget_staged_changes.
+
+    Returns:
+        A tuple of (diff_content, dependency_files)
+    """
+    diff, dep_files, _ = await aget_staged_changes(cwd, timeout)
+    return diff, dep_files
 
-def commit_with_message(message: str) -> bool:
+def commit_with_message(message: str, cwd: Optional[str] = None) -> bool:
     """使用指定的消息提交更改"""
     try:
         # 使用 -m 参数并正确转义消息
-        returncode, _, stderr = run_git_command(['git', 'commit', '-m', message])
+        with trace.span("git.commit"):
+            returncode, _, stderr = run_git_command(['git', 'commit', '-m', message], cwd=cwd)
         if returncode != 0:
             print(f"Error committing changes: {stderr}")
             return False
@@ -0,0 +1,346 @@
+import os
+import math
+import sqlite3
+import hashlib
+import subprocess
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .cache import CACHE_DIR
+
+# 每个仓库一个 sqlite 索引文件
+HISTORY_DIR = os.path.join(CACHE_DIR, "history")
+
+# 一次更新最多读取的提交数；之后只读取从已索引的分支顶端不可达的提交
+MAX_INITIAL_COMMITS = 20000
+
+# 最多记录的已索引分支顶端数；超出时丢弃最早记录的
+MAX_INDEXED_TIPS = 64
+
+# 每个提交最多索引的路径数；改动大量文件的提交很少是好的示例
+MAX_PATHS_PER_COMMIT = 64
+
+# 超过这个长度的提交信息不作为示例
+MAX_MESSAGE_CHARS = 2000
+
+# 默认返回的示例数
+DEFAULT_EXAMPLES = 3
+
+# 倒排索引召回的候选数，之后用 MinHash 相似度重新排序
+MAX_CANDIDATES = 200
+
+# 覆盖超过这个比例提交的路径前缀（如仓库根目录下的 src/）不参与召回，只参与排序
+MAX_PREFIX_SHARE = 0.2
+
+# MinHash 签名的哈希函数个数，每个 4 字节
+MINHASH_SIZE = 16
+_MINHASH_PRIME = (1 << 31) - 1
+_MINHASH_SEEDS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=4).digest(), "big") | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=4).digest(), "big"))
+    for i in range(MINHASH_SIZE)
+]
+
+# 写入数据库的批大小
+INSERT_BATCH = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS commits (
+    id INTEGER PRIMARY KEY,
+    sha TEXT UNIQUE NOT NULL,
+    time INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prefixes (id INTEGER PRIMARY KEY, prefix TEXT UNIQUE NOT NULL, count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (prefix_id INTEGER NOT NULL, commit_id INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS postings_prefix ON postings (prefix_id);
+"""
+
+def history_enabled() -> bool:
+    """配置项 "history" 为 false 时不使用历史提交信息作为示例，默认开启"""
+    from .config import get_config_value
+
+    value = get_config_value("history", True)
+    if isinstance(value, str):
+        return value.strip().lower() not in ("0", "false", "no", "off")
+    return bool(value)
+
+def path_prefixes(path: str) -> List[str]:
+    """路径本身和它的各级目录：src/a/b.py -> src/, src/a/, src/a/b.py"""
+    parts = path.split("/")
+    return ["/".join(parts[:i]) + "/" for i in range(1, len(parts))] + [path]
+
+def _tokens(paths: Sequence[str]) -> set:
+    tokens = set()
+    for path in paths[:MAX_PATHS_PER_COMMIT]:
+        tokens.update(path_prefixes(path))
+    return tokens
+
+def minhash(tokens: set) -> bytes:
+    """路径前缀集合的 MinHash 签名，两个签名相同位置相等的比例约等于 Jaccard 相似度"""
+    values = [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "big") for t in tokens]
+    signature = array("I", [
+        min((a * v + b) % _MINHASH_PRIME for v in values) if values else _MINHASH_PRIME
+        for a, b in _MINHASH_SEEDS
+    ])
+    return signature.tobytes()
+
+def similarity(a: bytes, b: bytes) -> float:
+    """两个 MinHash 签名估计的 Jaccard 相似度"""
+    x, y = array("I"), array("I")
+    x.frombytes(a)
+    y.frombytes(b)
+    return sum(1 for i, j in zip(x, y) if i == j) / MINHASH_SIZE
+
+def index_path(git_root: str) -> str:
+    digest = hashlib.sha1(os.path.abspath(git_root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(HISTORY_DIR, f"{digest}.sqlite")
+
+def _read_log(git_root: str, revisions: List[str]) -> Iterator[Tuple[str, int, str, List[str]]]:
+    """流式读取 git log，逐个返回 (sha, 提交时间, 提交信息, 改动的路径)
+
+    输出格式为 "\\x1e<sha> <time>\\n<message>\\0\\n<path>\\0<path>\\0..."
+    """
+    process = subprocess.Popen(
+        ['git', 'log', '-z', '--name-only', '--no-merges', '--no-renames', '--format=%x1e%H %ct%n%B', *revisions, '--'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        cwd=git_root
+    )
+    try:
+        pending = b""
+        for chunk in iter(lambda: process.stdout.read(1 << 16), b""):
+            records = (pending + chunk).split(b"\x1e")
+            pending = records.pop()
+            for record in records:
+                if record:
+                    yield _parse_record(record)
+        if pending:
+            yield _parse_record(pending)
+    finally:
+        process.stdout.close()
+        process.wait()
+
+def _parse_record(record: bytes) -> Tuple[str, int, str, List[str]]:
+    header, _, rest = record.partition(b"\n")
+    message, _, files = rest.partition(b"\0")
+    sha, _, time = header.decode("ascii", "replace").partition(" ")
+    paths = [p.decode("utf-8", "replace") for p in files.lstrip(b"\n").split(b"\0") if p]
+    return sha, int(time or 0), message.decode("utf-8", "replace").strip(), paths
+
+class HistoryIndex:
+    """仓库历史提交信息的本地索引，用于为当前暂存的文件找到风格相近的示例
+
+    - 路径前缀倒排索引：目录和文件 -> 改动过它们的提交
+    - 每个提交一个 MinHash 签名，用于按改动文件集合的相似度排序
+
+    索引记录已经读取过的分支顶端，之后只读取从它们不可达的提交（git log HEAD --not <顶端>）；
+    切换分支或 rebase 后已有的条目保留，只补充新的提交。
+    """
+
+    def __init__(self, git_root: str, path: Optional[str] = None):
+        self.git_root = git_root
+        self.path = path or index_path(git_root)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def clear(self):
+        with self.db:
+            for table in ("meta", "commits", "prefixes", "postings"):
+                self.db.execute(f"DELETE FROM {table}")
+
+    def update(self, head: Optional[str] = None, max_commits: Optional[int] = MAX_INITIAL_COMMITS) -> int:
+        """把上次索引之后的提交加入索引，返回新增的提交数
+
+        Args:
+            head: 当前 HEAD 的提交哈希，None 时读取
+            max_commits: 一次最多读取的提交数（第一次建立索引或切换到差别很大的分支时），None 为全部
+        """
+        if head is None:
+            from .git_utils import get_head
+            head = get_head(self.git_root)
+        if not head:
+            return 0
+        if head in self._recorded_tips():
+            return 0
+        tips = self._indexed_tips()
+
+        revisions = [head, *(f"^{tip}" for tip in tips)]
+        if max_commits:
+            revisions.append(f"--max-count={max_commits}")
+
+        added = 0
+        with self.db:
+            prefix_ids: Dict[str, int] = {}
+            batch = []
+            for commit in _read_log(self.git_root, revisions):
+                batch.append(commit)
+                if len(batch) >= INSERT_BATCH:
+                    added += self._insert(batch, prefix_ids)
+                    batch = []
+            added += self._insert(batch, prefix_ids)
+            self._set_meta("tips", " ".join(self._independent_tips([head, *tips])))
+        return added
+
+    def _recorded_tips(self) -> List[str]:
+        # 旧版本的索引只记录了一个 "head"
+        return (self._meta("tips") or self._meta("head") or "").split()
+
+    def _indexed_tips(self) -> List[str]:
+        """已索引的分支顶端中仍然存在的提交（rebase 后旧的提交可能已被清理）"""
+        tips = self._recorded_tips()
+        if not tips:
+            return []
+        result = subprocess.run(
+            ['git', 'cat-file', '--batch-check=%(objectname) %(objecttype)'],
+            input="\n".join(tips) + "\n",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            cwd=self.git_root
+        )
+        return [line.split()[0] for line in result.stdout.splitlines() if line.endswith(" commit")]
+
+    def _independent_tips(self, tips: List[str]) -> List[str]:
+        """去掉能从其他顶端到达的顶端，例如快进之前的 HEAD"""
+        result = subprocess.run(
+            ['git', 'merge-base', '--independent', *tips],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            cwd=self.git_root
+        )
+        independent = set(result.stdout.split()) if result.returncode == 0 else set(tips)
+        # 保持最新的顶端在前，超出上限时丢弃最早记录的
+        return [tip for tip in tips if tip in independent][:MAX_INDEXED_TIPS]
+
+    def _prefix_id(self, prefix: str, prefix_ids: Dict[str, int]) -> int:
+        prefix_id = prefix_ids.get(prefix)
+        if prefix_id is None:
+            row = self.db.execute("SELECT id FROM prefixes WHERE prefix = ?", (prefix,)).fetchone()
+            if row:
+                prefix_id = row[0]
+            else:
+                prefix_id = self.db.execute(
+                    "INSERT INTO prefixes (prefix, count) VALUES (?, 0)", (prefix,)
+                ).lastrowid
+            prefix_ids[prefix] = prefix_id
+        return prefix_id
+
+    def _insert(self, commits: List[Tuple[str, int, str, List[str]]], prefix_ids: Dict[str, int]) -> int:
+        added = 0
+        postings = []
+        counts: Dict[int, int] = {}
+        for sha, time, message, paths in commits:
+            if not message or len(message) > MAX_MESSAGE_CHARS or not paths:
+                continue
+            tokens = _tokens(paths)
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO commits (sha, time, message, signature) VALUES (?, ?, ?, ?)",
+                (sha, time, message, minhash(tokens)),
+            )
+            if not cursor.rowcount:
+                continue
+            added += 1
+            for token in tokens:
+                prefix_id = self._prefix_id(token, prefix_ids)
+                postings.append((prefix_id, cursor.lastrowid))
+                counts[prefix_id] = counts.get(prefix_id, 0) + 1
+        self.db.executemany("INSERT INTO postings (prefix_id, commit_id) VALUES (?, ?)", postings)
+        self.db.executemany("UPDATE prefixes SET count = count + ? WHERE id = ?", [(c, i) for i, c in counts.items()])
+        return added
+
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+
+    def search(self, paths: Sequence[str], k: int = DEFAULT_EXAMPLES) -> List[str]:
+        """返回与给定文件集合最相关的 k 条历史提交信息
+
+        先用路径前缀倒排索引召回候选，前缀越少见权重越高（IDF）；
+        再按 MinHash 估计的文件集合相似度和提交时间排序，相同的提交信息只保留一条。
+        """
+        tokens = _tokens(list(paths))
+        if not tokens or k <= 0:
+            return []
+        total = self.count()
+        if not total:
+            return []
+
+        placeholders = ",".join("?" * len(tokens))
+        rows = self.db.execute(
+            f"SELECT id, count FROM prefixes WHERE prefix IN ({placeholders})", list(tokens)
+        ).fetchall()
+        # 过于常见的前缀几乎匹配所有提交，只在没有其他前缀时使用
+        selective = [(i, c) for i, c in rows if c <= max(1, total * MAX_PREFIX_SHARE)]
+        rows = selective or sorted(rows, key=lambda row: row[1])[:1]
+        if not rows:
+            return []
+
+        weights = {prefix_id: math.log(1 + total / count) for prefix_id, count in rows}
+        scores: Dict[int, float] = {}
+        for prefix_id, commit_id in self.db.execute(
+            f"SELECT prefix_id, commit_id FROM postings WHERE prefix_id IN ({','.join('?' * len(weights))})",
+            list(weights),
+        ):
+            scores[commit_id] = scores.get(commit_id, 0.0) + weights[prefix_id]
+        candidates = sorted(scores, key=lambda commit_id: (scores[commit_id], commit_id), reverse=True)
+        candidates = candidates[:MAX_CANDIDATES]
+
+        signature = minhash(tokens)
+        placeholders = ",".join("?" * len(candidates))
+        ranked = sorted(
+            self.db.execute(
+                f"SELECT id, time, message, signature FROM commits WHERE id IN ({placeholders})", candidates
+            ),
+            key=lambda row: (similarity(signature, row[3]), scores[row[0]], row[1]),
+            reverse=True,
+        )
+        examples = []
+        for _, _, message, _ in ranked:
+            if message not in examples:
+                examples.append(message)
+            if len(examples) >= k:
+                break
+        return examples
+
+def get_staged_paths(cwd: Optional[str] = None) -> List[str]:
+    """暂存区中改动的路径"""
+    result = subprocess.run(
+        ['git', 'diff', '--cached', '--name-only', '-z', '--no-renames'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        cwd=cwd
+    )
+    if result.returncode != 0:
+        return []
+    return [p for p in result.stdout.decode("utf-8", "replace").split("\0") if p]
+
+def find_examples(git_root: str, head: Optional[str] = None, k: int = DEFAULT_EXAMPLES) -> List[str]:
+    """增量更新索引后，返回与暂存区文件最相关的历史提交信息；关闭或出错时返回空列表"""
+    if not history_enabled():
+        return []
+    try:
+        with HistoryIndex(git_root) as index:
+            index.update(head)
+            return index.search(get_staged_paths(git_root), k)
+    except (OSError, sqlite3.Error):
+        return []
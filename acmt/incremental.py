@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from .cache import CACHE_DIR
+
+# 每个仓库上一次生成的提交信息保存在这里
+STATE_DIR = os.path.join(CACHE_DIR, "last")
+
+# 增量 diff 超过完整 diff 的这个比例时重新完整生成
+DEFAULT_MAX_DELTA_RATIO = 0.5
+
+def get_max_delta_ratio() -> Optional[float]:
+    """配置项 "incremental"：false 关闭增量生成，数字为增量 diff 与完整 diff 的最大比例"""
+    from .config import get_config_value
+
+    value = get_config_value("incremental", True)
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ("0", "false", "no", "off"):
+            return None
+        if value in ("1", "true", "yes", "on"):
+            return DEFAULT_MAX_DELTA_RATIO
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid incremental setting: {value}")
+    if value is True:
+        return DEFAULT_MAX_DELTA_RATIO
+    if not value:
+        return None
+    return float(value)
+
+def _state_path(git_root: str) -> str:
+    digest = hashlib.sha1(os.path.abspath(git_root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(STATE_DIR, f"{digest}.json")
+
+def load_last_generation(git_root: str) -> Optional[Dict]:
+    """读取仓库上一次生成的 {tree, head, context, message}，没有时返回 None"""
+    try:
+        with open(_state_path(git_root), 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or not state.get("tree") or not state.get("message"):
+        return None
+    return state
+
+def save_last_generation(git_root: str, tree: str, head: Optional[str], context: str, message: str):
+    """记录为哪个暂存区 tree 生成了哪条提交信息，先写临时文件再替换"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = _state_path(git_root)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(
+            {"tree": tree, "head": head, "context": context, "message": message, "created": time.time()},
+            f,
+        )
+    os.replace(tmp_path, path)
+
+def clear_last_generation(git_root: str):
+    """提交之后上一次的提交信息不再适用"""
+    try:
+        os.remove(_state_path(git_root))
+    except OSError:
+        pass
+
+def get_revision_delta(
+    state: Optional[Dict],
+    tree: str,
+    head: Optional[str],
+    context: str,
+    full_diff: Optional[str],
+    cwd: Optional[str] = None
+) -> Optional[Tuple[Optional[str], Optional[List[str]], Optional[str]]]:
+    """判断能否在上一次的提交信息上修改，可以时返回两个 tree 之间的变更
+
+    HEAD、模型和提示词等设置都没有变化，且增量 diff 不超过完整 diff 的一定比例时才修改；
+    否则返回 None，由调用方完整生成。
+
+    Returns:
+        (delta_diff, dependency_files, dependency_summary)，或 None
+    """
+    from .compact import estimate_tokens
+    from .git_utils import get_tree_changes
+
+    if not state or state["tree"] == tree:
+        return None
+    if state.get("head") != head or state.get("context") != context:
+        return None
+    max_ratio = get_max_delta_ratio()
+    if max_ratio is None or not full_diff:
+        return None
+
+    try:
+        delta, dep_files, dependency_summary = get_tree_changes(state["tree"], tree, cwd)
+    except Exception:
+        # 读取增量失败时完整生成
+        return None
+    if not delta and not dep_files:
+        return None
+    delta_tokens = estimate_tokens(delta) + estimate_tokens(dependency_summary)
+    if delta_tokens > estimate_tokens(full_diff) * max_ratio:
+        return None
+    return delta, dep_files, dependency_summary
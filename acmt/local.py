@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import socket
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+# 本地模型的 API base，与 llama.cpp server 的默认地址相同
+LOCAL_API_BASE = "http://127.0.0.1:8080/v1"
+
+# 本地模型的默认上下文长度（tokens），也用于计算 diff 的 token 预算
+DEFAULT_CONTEXT = 4096
+
+# 检查本地服务是否在运行时的连接超时（秒）
+PROBE_TIMEOUT = 0.05
+
+INSTALL_HINT = "install it with: pip install 'acmt[local]'"
+
+# 已加载的模型：(路径, 上下文长度, 线程数) -> Llama；模型只加载一次，之后的请求共用
+_models: Dict[Tuple[str, int, int], "llama_cpp.Llama"] = {}
+_models_lock = threading.Lock()
+# llama.cpp 的模型实例不能并发推理，同一进程内的请求依次执行
+_inference_lock = threading.Lock()
+
+def is_local_base(api_base: Optional[str]) -> bool:
+    """API base 是否指向本机"""
+    if not api_base:
+        return False
+    host = urlparse(api_base).hostname
+    return host in ("127.0.0.1", "localhost", "::1")
+
+def _int_setting(key: str, default: int) -> int:
+    from .config import get_config_value
+
+    value = get_config_value(key)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {key} setting: {value}")
+
+def get_local_model_path() -> Optional[str]:
+    """配置项 "local_model"：GGUF 模型文件路径，设置后在进程内推理"""
+    from .config import get_config_value
+
+    path = get_config_value("local_model")
+    return os.path.expanduser(path) if path else None
+
+def load_model(path: str, context: Optional[int] = None, threads: Optional[int] = None) -> "llama_cpp.Llama":
+    """加载 GGUF 模型（只用 CPU），同一进程内只加载一次"""
+    try:
+        from llama_cpp import Llama
+    except ImportError:
+        raise Exception(f"Error: local models need llama-cpp-python, {INSTALL_HINT}")
+    if not os.path.isfile(path):
+        raise Exception(f"Error: local model not found: {path}")
+
+    context = context or _int_setting("local_context", DEFAULT_CONTEXT)
+    threads = threads or _int_setting("local_threads", os.cpu_count() or 1)
+    key = (os.path.abspath(path), context, threads)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = Llama(model_path=path, n_ctx=context, n_threads=threads, n_gpu_layers=0, verbose=False)
+            _models[key] = model
+        return model
+
+def _error(status: int, message: str) -> Tuple[int, Dict[str, str], Iterator[bytes]]:
+    body = json.dumps({"error": {"message": message, "type": "local_error"}}).encode("utf-8")
+    return status, {"content-type": "application/json"}, iter([body])
+
+def _stream_events(model: "llama_cpp.Llama", params: Dict) -> Iterator[bytes]:
+    """以 server-sent events 输出流式结果，推理期间持有推理锁"""
+    with _inference_lock:
+        for chunk in model.create_chat_completion(**params, stream=True):
+            yield b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n"
+    yield b"data: [DONE]\n\n"
+
+def handle(
+    model: "llama_cpp.Llama",
+    model_name: str,
+    method: str,
+    path: str,
+    body: bytes
+) -> Tuple[int, Dict[str, str], Iterator[bytes]]:
+    """处理一个 OpenAI 兼容的请求，进程内传输和 acmt local serve 共用
+
+    Returns:
+        (状态码, 响应头, 响应体的字节迭代器)
+    """
+    path = path.split("?", 1)[0].rstrip("/")
+    if method == "GET" and path.endswith("/models"):
+        payload = {"object": "list", "data": [{"id": model_name, "object": "model", "owned_by": "local"}]}
+        return 200, {"content-type": "application/json"}, iter([json.dumps(payload).encode("utf-8")])
+    if method != "POST" or not path.endswith("/chat/completions"):
+        return _error(404, f"not found: {method} {path}")
+
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        return _error(400, "invalid JSON body")
+    # n 大于 1 时由调用方并发发送多个请求，这里只生成一个结果
+    params = {"messages": request.get("messages") or []}
+    for key in ("temperature", "max_tokens", "top_p", "stop", "seed"):
+        if request.get(key) is not None:
+            params[key] = request[key]
+
+    if request.get("stream"):
+        return 200, {"content-type": "text/event-stream"}, _stream_events(model, params)
+    try:
+        with _inference_lock:
+            result = model.create_chat_completion(**params)
+    except ValueError as e:
+        # 例如提示词超出上下文长度
+        return _error(400, str(e))
+    result["model"] = model_name
+    return 200, {"content-type": "application/json"}, iter([json.dumps(result).encode("utf-8")])
+
+class LocalTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """把 OpenAI 客户端的请求直接交给进程内的模型，不经过网络"""
+
+    def __init__(self, model_path: str, model_name: str = "local"):
+        self.model = load_model(model_path)
+        self.model_name = model_name
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        status, headers, body = handle(self.model, self.model_name, request.method, request.url.path, request.read())
+        return httpx.Response(status, headers=headers, content=body, request=request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        import asyncio
+
+        # 推理在线程中进行，不阻塞事件循环；流式结果一次性返回
+        def run() -> Tuple[int, Dict[str, str], bytes]:
+            status, headers, body = handle(
+                self.model, self.model_name, request.method, request.url.path, request.content
+            )
+            return status, headers, b"".join(body)
+
+        status, headers, content = await asyncio.to_thread(run)
+        return httpx.Response(status, headers=headers, content=content, request=request)
+
+def _server_running(api_base: str) -> bool:
+    """本地 API base 上是否有服务在监听（acmt local serve 或 llama.cpp server）"""
+    parsed = urlparse(api_base)
+    try:
+        with socket.create_connection((parsed.hostname, parsed.port or 80), timeout=PROBE_TIMEOUT):
+            return True
+    except OSError:
+        return False
+
+def get_local_transport(api_base: Optional[str]) -> Optional[LocalTransport]:
+    """配置了 local_model 且本地没有服务在运行时，返回进程内推理的传输层；否则返回 None，照常发送 HTTP 请求"""
+    if not is_local_base(api_base):
+        return None
+    path = get_local_model_path()
+    if not path or _server_running(api_base):
+        return None
+    return LocalTransport(path)
+
+def serve(model_path: str, host: str = "127.0.0.1", port: int = 8080, log=None):
+    """常驻的本地推理服务：模型只加载一次，提供 OpenAI 兼容的 /v1/chat/completions"""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    log = log or (lambda message: None)
+    started = time.monotonic()
+    model = load_model(model_path)
+    model_name = os.path.basename(model_path)
+    log(f"Loaded {model_path} in {time.monotonic() - started:.1f}s")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _respond(self, method: str):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            started = time.monotonic()
+            status, headers, chunks = handle(model, model_name, method, self.path, body)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            if headers["content-type"] == "text/event-stream":
+                # 流式响应没有长度，发送完后关闭连接
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+                self.close_connection = True
+            else:
+                data = b"".join(chunks)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            log(f"{method} {self.path} {status} {(time.monotonic() - started) * 1000:.0f}ms")
+
+        def do_GET(self):
+            self._respond("GET")
+
+        def do_POST(self):
+            self._respond("POST")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    log(f"Serving {model_name} on http://{host}:{port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
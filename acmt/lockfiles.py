@@ -0,0 +1,264 @@
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 依赖变更表最多显示的行数，超出部分合并为一行
+MAX_SUMMARY_ROWS = 60
+
+# 解析器返回 (name, version)：
+#   (name, None)    - 之后的版本号行属于这个包
+#   (None, version) - 当前包的版本号
+#   (name, version) - 一行中同时包含包名和版本号
+LineParser = Callable[[str], Optional[Tuple[Optional[str], Optional[str]]]]
+
+# JSON 锁文件：package-lock.json、Pipfile.lock、composer.lock
+_JSON_KEY = re.compile(r'\s*"([^"]+)": \{')
+_JSON_NAME = re.compile(r'\s*"name": "([^"]+)"')
+_JSON_VERSION = re.compile(r'\s*"version": "([^"]*)"')
+
+# 这些键是包含多个包的容器，不是包名
+_JSON_CONTAINER_KEYS = frozenset([
+    "packages", "dependencies", "devDependencies", "optionalDependencies", "peerDependencies",
+    "peerDependenciesMeta", "requires", "engines", "bin", "funding", "default", "develop",
+    "_meta", "hash", "sources", "source", "dist", "require", "require-dev", "autoload",
+    "autoload-dev", "extra", "support", "suggest",
+])
+
+def _parse_json(line: str):
+    if '"version"' in line:
+        match = _JSON_VERSION.match(line)
+        return (None, match.group(1).lstrip("=")) if match else None
+    if '"name"' in line:
+        match = _JSON_NAME.match(line)
+        return (match.group(1), None) if match else None
+    match = _JSON_KEY.match(line)
+    if match:
+        # package-lock.json v2+ 的键是 node_modules/<name>，可能嵌套
+        name = match.group(1)
+        if name in _JSON_CONTAINER_KEYS:
+            return ("", None)
+        return (name.rsplit("node_modules/", 1)[-1], None)
+    return None
+
+# TOML 锁文件：poetry.lock、Cargo.lock、uv.lock 的 [[package]] 表
+_TOML_NAME = re.compile(r'name = "([^"]+)"')
+_TOML_VERSION = re.compile(r'version = "([^"]+)"')
+
+def _parse_toml(line: str):
+    if line.startswith("name"):
+        match = _TOML_NAME.match(line)
+        return (match.group(1), None) if match else None
+    if line.startswith("version"):
+        match = _TOML_VERSION.match(line)
+        return (None, match.group(1)) if match else None
+    if line.startswith("[["):
+        return ("", None)
+    return None
+
+# yarn.lock：v1 为 lodash@^4.17.20:，berry 为 "lodash@npm:^4.17.20":
+_YARN_VERSION = re.compile(r'\s+version:? "?([^"\s]+)"?')
+
+def _parse_yarn(line: str):
+    if not line or line[0] in " #":
+        if line.startswith("  version"):
+            match = _YARN_VERSION.match(line)
+            return (None, match.group(1)) if match else None
+        return None
+    if line.endswith(":"):
+        spec = line.split(",", 1)[0].strip('":')
+        if spec.startswith("__"):
+            # berry 的 __metadata 不是包
+            return ("", None)
+        at = spec.find("@", 1)
+        return (spec[:at] if at != -1 else spec, None)
+    return None
+
+# pnpm-lock.yaml：packages 下的键包含版本号，如 /lodash@4.17.21:、lodash@4.17.21(peer):、/lodash/4.17.21:
+_PNPM_KEY = re.compile(r"  '?/?((?:@[^/@\s]+/)?[^/@\s(']+)[@/]([^(_'\s:]+)")
+
+def _parse_pnpm(line: str):
+    if not line.startswith("  ") or line.startswith("   ") or not line.endswith(":"):
+        return None
+    match = _PNPM_KEY.match(line)
+    return (match.group(1), match.group(2)) if match else None
+
+# Gemfile.lock：specs 下 4 个空格缩进的 "rails (7.0.4)"，更深的缩进是依赖约束
+_GEM_SPEC = re.compile(r"    (\S+) \(([^)]+)\)$")
+
+def _parse_gemfile(line: str):
+    if line.startswith("     "):
+        return None
+    match = _GEM_SPEC.match(line)
+    return (match.group(1), match.group(2)) if match else None
+
+# go.sum：<module> <version>[/go.mod] h1:<hash>，只看模块本身那一行
+def _parse_go_sum(line: str):
+    parts = line.split(" ")
+    if len(parts) != 3 or parts[1].endswith("/go.mod"):
+        return None
+    return (parts[0], parts[1])
+
+# requirements.txt：name==1.0、name>=1.0 等
+_REQUIREMENT = re.compile(r"([A-Za-z0-9][A-Za-z0-9._\-]*(?:\[[^\]]*\])?)\s*((?:==|>=|<=|~=|!=|>|<)[^\s;#]*)?")
+
+def _parse_requirements(line: str):
+    if not line or line[0] in "#-":
+        return None
+    match = _REQUIREMENT.match(line)
+    return (match.group(1), match.group(2) or "*") if match else None
+
+# gradle.lockfile：group:artifact:version=configurations
+def _parse_gradle_lockfile(line: str):
+    coordinate = line.split("=", 1)[0]
+    parts = coordinate.split(":")
+    if len(parts) != 3:
+        return None
+    return (f"{parts[0]}:{parts[1]}", parts[2])
+
+# build.gradle(.kts)：implementation 'group:artifact:version'
+_GRADLE_DEPENDENCY = re.compile(r"""['"]([\w.\-]+:[\w.\-]+):([\w.\-+]+)['"]""")
+
+def _parse_gradle(line: str):
+    match = _GRADLE_DEPENDENCY.search(line)
+    return (match.group(1), match.group(2)) if match else None
+
+# pom.xml：<artifactId> 之后的 <version>
+_POM_ARTIFACT = re.compile(r"\s*<artifactId>([^<]+)</artifactId>")
+_POM_VERSION = re.compile(r"\s*<version>([^<]+)</version>")
+
+def _parse_pom(line: str):
+    if "<artifactId>" in line:
+        match = _POM_ARTIFACT.match(line)
+        return (match.group(1), None) if match else None
+    if "<version>" in line:
+        match = _POM_VERSION.match(line)
+        return (None, match.group(1)) if match else None
+    return None
+
+# 按文件名选择解析器；bun.lockb 是二进制文件，无法解析
+LOCKFILE_PARSERS: Dict[str, LineParser] = {
+    "package-lock.json": _parse_json,
+    "npm-shrinkwrap.json": _parse_json,
+    "Pipfile.lock": _parse_json,
+    "composer.lock": _parse_json,
+    "poetry.lock": _parse_toml,
+    "Cargo.lock": _parse_toml,
+    "uv.lock": _parse_toml,
+    "yarn.lock": _parse_yarn,
+    "pnpm-lock.yaml": _parse_pnpm,
+    "Gemfile.lock": _parse_gemfile,
+    "go.sum": _parse_go_sum,
+    "requirements.txt": _parse_requirements,
+    "gradle.lockfile": _parse_gradle_lockfile,
+    "build.gradle": _parse_gradle,
+    "build.gradle.kts": _parse_gradle,
+    "pom.xml": _parse_pom,
+}
+
+def get_lockfile_parser(path: str) -> Optional[LineParser]:
+    """根据文件名获取解析器，文件名不区分大小写"""
+    name = os.path.basename(path)
+    parser = LOCKFILE_PARSERS.get(name)
+    if parser is None:
+        lowered = name.lower()
+        for key, value in LOCKFILE_PARSERS.items():
+            if key.lower() == lowered:
+                return value
+        # dev-requirements.txt、requirements-test.txt 等
+        if lowered.endswith(".txt") and "requirements" in lowered:
+            return _parse_requirements
+    return parser
+
+class LockfileDiff:
+    """流式解析单个依赖文件的 patch，只保留每个包的旧版本和新版本
+
+    旧版本取自 "-" 行，新版本取自 "+" 行；包名可以来自上下文行，
+    所以旧、新两侧分别记录当前所在的包。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.parser = get_lockfile_parser(path)
+        self.changes: Dict[str, List[Optional[str]]] = {}
+        self._names = ["", ""]
+        self._in_hunk = False
+        self._pending = b""
+
+    def feed(self, data: bytes):
+        """输入一段 patch 字节，可以在任意位置切分"""
+        if self.parser is None:
+            return
+        data = self._pending + data
+        end = data.rfind(b"\n")
+        if end == -1:
+            self._pending = data
+            return
+        self._pending = data[end + 1:]
+        for line in data[:end].decode("utf-8", "replace").split("\n"):
+            self._feed_line(line)
+
+    def close(self):
+        if self._pending:
+            self.feed(b"\n")
+
+    def _feed_line(self, line: str):
+        if line.startswith("@@"):
+            self._in_hunk = True
+            self._names = ["", ""]
+            return
+        if not self._in_hunk or not line:
+            return
+        sign = line[0]
+        if sign == " ":
+            sides = (0, 1)
+        elif sign == "-":
+            sides = (0,)
+        elif sign == "+":
+            sides = (1,)
+        else:
+            # "\ No newline at end of file" 或下一个文件头
+            return
+
+        parsed = self.parser(line[1:])
+        if parsed is None:
+            return
+        name, version = parsed
+        for side in sides:
+            if version is None:
+                self._names[side] = name
+            elif sign != " ":
+                name = name or self._names[side]
+                if name:
+                    versions = self.changes.setdefault(name, [None, None])
+                    if versions[side] is None:
+                        versions[side] = version
+
+    def rows(self) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """返回版本有变化的 (包名, 旧版本, 新版本)，按包名排序"""
+        return sorted(
+            (name, old, new)
+            for name, (old, new) in self.changes.items()
+            if old != new
+        )
+
+def format_dependency_summary(lockfiles: List[LockfileDiff], max_rows: int = MAX_SUMMARY_ROWS) -> str:
+    """生成紧凑的依赖变更表，每行形如 "name: old → new\""""
+    lines = ["Dependency changes:"]
+    shown = 0
+    hidden = 0
+    for lockfile in lockfiles:
+        rows = lockfile.rows()
+        if not rows:
+            reason = "contents not parsed" if lockfile.parser is None else "no version changes"
+            lines.append(f"{lockfile.path}: updated ({reason})")
+            continue
+        lines.append(f"{lockfile.path}:")
+        for name, old, new in rows:
+            if shown >= max_rows:
+                hidden += 1
+                continue
+            lines.append(f"  {name}: {old or '(added)'} → {new or '(removed)'}")
+            shown += 1
+    if hidden:
+        lines.append(f"  ... and {hidden} more dependency changes")
+    return "\n".join(lines)
@@ -0,0 +1,318 @@
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, Union
+
+from .compact import estimate_tokens
+
+# 未知模型（如自定义模型）使用的默认上下文窗口
+DEFAULT_CONTEXT_WINDOW = 8192
+
+DEFAULT_SYSTEM_MESSAGE = "You are a helpful assistant that generates clear and concise git commit messages."
+
+# 可以在自定义模型中覆盖的字段及其类型
+OVERRIDABLE_FIELDS = {
+    "api_base": str,
+    "context_window": int,
+    "tokenizer": str,
+    "input_price": float,
+    "output_price": float,
+    "temperature": float,
+    "max_tokens": int,
+    "system_message": str,
+    "streaming": bool,
+    "n_choices": bool,
+    "batch": bool,
+}
+
+class ModelInfo:
+    """一个模型的能力和参数
+
+    价格为每百万 token 的美元价格，未知时为 None；tokenizer 为 tiktoken 的编码名称，
+    未知时为 None，此时按字符数估算。
+    """
+
+    __slots__ = tuple(OVERRIDABLE_FIELDS) + ("name",)
+
+    def __init__(
+        self,
+        name: str,
+        api_base: Optional[str] = None,
+        context_window: int = DEFAULT_CONTEXT_WINDOW,
+        tokenizer: Optional[str] = None,
+        input_price: Optional[float] = None,
+        output_price: Optional[float] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 100,
+        system_message: str = DEFAULT_SYSTEM_MESSAGE,
+        streaming: bool = True,
+        n_choices: bool = False,
+        batch: bool = False
+    ):
+        self.name = name
+        self.api_base = api_base
+        self.context_window = context_window
+        self.tokenizer = tokenizer
+        self.input_price = input_price
+        self.output_price = output_price
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.system_message = system_message
+        self.streaming = streaming
+        self.n_choices = n_choices
+        self.batch = batch
+
+    def replace(self, **fields) -> "ModelInfo":
+        values = {field: getattr(self, field) for field in self.__slots__}
+        values.update(fields)
+        return ModelInfo(**values)
+
+    def settings(self) -> Dict:
+        """get_model_settings 的返回格式"""
+        return {
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "system_message": self.system_message,
+        }
+
+    def cost(self, input_tokens: int, output_tokens: int) -> Optional[float]:
+        """按价格估算费用（美元），价格未知时返回 None"""
+        if self.input_price is None or self.output_price is None:
+            return None
+        return (input_tokens * self.input_price + output_tokens * self.output_price) / 1_000_000
+
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in ("name",) + tuple(OVERRIDABLE_FIELDS)}
+
+# GPT-4 - 更高温度以增加创造性
+_GPT4 = {
+    "temperature": 0.8,
+    "max_tokens": 150,
+    "system_message": "You are an expert programmer with deep understanding of code changes. Generate clear, concise, and insightful git commit messages.",
+}
+
+# 按服务商分组的模型表：共用的字段写在分组中，各模型只写不同的字段
+_FAMILIES = [
+    {
+        "api_base": "https://api.openai.com/v1",
+        "tokenizer": "cl100k_base",
+        "n_choices": True,
+        "batch": True,
+        "models": {
+            "gpt-3.5-turbo": {"context_window": 16385, "input_price": 0.5, "output_price": 1.5},
+            "gpt-3.5-turbo-16k": {"context_window": 16385, "input_price": 3.0, "output_price": 4.0},
+            "gpt-4": {**_GPT4, "context_window": 8192, "input_price": 30.0, "output_price": 60.0},
+            "gpt-4-32k": {**_GPT4, "context_window": 32768, "input_price": 60.0, "output_price": 120.0},
+            "gpt-4-1106-preview": {**_GPT4, "context_window": 128000, "input_price": 10.0, "output_price": 30.0},
+        },
+    },
+    {
+        # Anthropic Claude - 更注重准确性
+        "api_base": "https://api.anthropic.com/v1",
+        "context_window": 100000,
+        "temperature": 0.6,
+        "batch": True,
+        "system_message": "You are Claude, an AI assistant focused on generating precise and accurate git commit messages. Focus on technical accuracy and clarity.",
+        "models": {
+            "claude-2": {"input_price": 8.0, "output_price": 24.0},
+            "claude-instant-1": {"input_price": 0.8, "output_price": 2.4},
+        },
+    },
+    {
+        # Google - 平衡的设置
+        "temperature": 0.7,
+        "max_tokens": 120,
+        "system_message": "You are an AI assistant specialized in understanding code changes and generating appropriate git commit messages.",
+        "models": {
+            "palm-2": {"api_base": "https://generativelanguage.googleapis.com/v1beta", "context_window": 8192},
+            "gemini-pro": {
+                "api_base": "https://generativelanguage.googleapis.com/v1",
+                "context_window": 32760,
+                "input_price": 0.5,
+                "output_price": 1.5,
+            },
+        },
+    },
+    {
+        "api_base": "https://dashscope.aliyuncs.com/api/v1",
+        "system_message": "你是通义千问助手，专注于生成清晰准确的代码提交信息。",
+        "models": {"qwen-turbo": {"context_window": 8000}, "qwen-plus": {"context_window": 32000}},
+    },
+    {
+        "context_window": 8192,
+        "system_message": "你是讯飞星火助手，擅长理解代码变更并生成恰当的提交信息。",
+        "models": {
+            "spark-v3": {"api_base": "https://spark-api.xf-yun.com/v3.1"},
+            "spark-v2": {"api_base": "https://spark-api.xf-yun.com/v2.1"},
+        },
+    },
+    {
+        "api_base": "https://api.baichuan-ai.com/v1",
+        "system_message": "你是百川助手，专注于代码分析和提交信息生成。",
+        "models": {"baichuan-53b": {"context_window": 4096}},
+    },
+    {
+        "api_base": "https://open.bigmodel.cn/api/v1",
+        "system_message": "你是 ChatGLM 助手，专注于代码理解和提交信息生成。",
+        "models": {"chatglm-4": {"context_window": 128000}, "chatglm-turbo": {"context_window": 32000}},
+    },
+    {
+        "api_base": "https://aip.baidubce.com/rpc/2.0/ai_custom/v1",
+        "context_window": 8192,
+        "system_message": "你是文心一言助手，擅长分析代码变更并生成清晰的提交信息。",
+        "models": {"ernie-4.0": {}, "ernie-turbo": {}},
+    },
+    {
+        "api_base": "https://api.moonshot.cn/v1",
+        "system_message": "你是 KIMI 助手，专注于代码分析和生成高质量的提交信息。",
+        "models": {"kimi-v1": {"context_window": 8192}},
+    },
+    {
+        "api_base": "https://hunyuan.cloud.tencent.com/hyllm/v1",
+        "system_message": "你是腾讯混元助手，擅长分析代码变更并生成准确的提交信息。",
+        "models": {"hunyuan": {"context_window": 32000}, "hunyuan-lite": {"context_window": 4096}},
+    },
+    {
+        "api_base": "https://api.doubao.com/v1",
+        "context_window": 32000,
+        "system_message": "你是豆包助手，专注于代码理解和提交信息生成。",
+        "models": {"doubao-v1": {}, "doubao-turbo": {}},
+    },
+    {
+        "api_base": "https://api.deepseek.com/v1",
+        "system_message": "You are an expert programmer. Generate clear and concise git commit messages.",
+        "models": {"deepseek-chat": {"context_window": 64000, "input_price": 0.27, "output_price": 1.1}},
+    },
+    {
+        "system_message": "You are an AI assistant. Generate clear and helpful git commit messages.",
+        "models": {
+            "meta-llama/llama-2-70b-chat": {"api_base": "https://api.replicate.com/v1", "context_window": 4096},
+            "mistralai/mistral-7b-instruct": {"api_base": "https://api.together.xyz/v1", "context_window": 8192},
+            "mistralai/mixtral-8x7b-instruct": {"api_base": "https://api.together.xyz/v1", "context_window": 32768},
+        },
+    },
+    {
+        "api_base": "https://api.replicate.com/v1",
+        "system_message": "You are CodeLlama, an AI specialized in code understanding. Generate accurate and technical git commit messages.",
+        "models": {"meta-llama/codellama-34b-instruct": {"context_window": 16384}},
+    },
+    {
+        # 本地的小型量化模型 - 低温度使输出更稳定，不产生费用
+        "api_base": "http://127.0.0.1:8080/v1",
+        "temperature": 0.2,
+        "input_price": 0.0,
+        "output_price": 0.0,
+        "system_message": "You are an AI assistant. Generate clear and concise git commit messages.",
+        "models": {"local": {"context_window": 4096}},
+    },
+]
+
+def _build_registry() -> Dict[str, ModelInfo]:
+    registry = {}
+    for family in _FAMILIES:
+        defaults = {k: v for k, v in family.items() if k in OVERRIDABLE_FIELDS}
+        for name, fields in family["models"].items():
+            registry[name] = ModelInfo(name, **dict(defaults, **fields))
+    return registry
+
+# 模型名称 -> ModelInfo
+MODELS: Dict[str, ModelInfo] = _build_registry()
+
+# get_model_info 的结果缓存：合并后的配置对象不变时（见 config.resolve_config）直接返回
+_info_cache = {"config": None, "models": {}}
+
+# count_tokens 缓存的条目数
+TOKEN_COUNT_CACHE_SIZE = 256
+
+# (tokenizer, 文本的 sha1) -> token 数，不在缓存中保留完整的提示词
+_token_counts: "OrderedDict[Tuple[Optional[str], bytes], int]" = OrderedDict()
+# 生成候选、map 阶段、服务和批量处理会在多个线程中同时计数
+_token_counts_lock = threading.Lock()
+
+def parse_overrides(fields: Dict) -> Dict:
+    """检查自定义模型中的字段，转换为正确的类型"""
+    overrides = {}
+    for key, value in fields.items():
+        kind = OVERRIDABLE_FIELDS.get(key)
+        if kind is None:
+            raise ValueError(f"Unknown model field: {key}. Available fields: {', '.join(OVERRIDABLE_FIELDS)}")
+        if value is None:
+            overrides[key] = None
+        elif kind is bool and isinstance(value, str):
+            overrides[key] = value.strip().lower() not in ("0", "false", "no", "off")
+        else:
+            try:
+                overrides[key] = kind(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for {key}: {value}")
+    return overrides
+
+def get_model_info(model: Optional[Union[str, "Model"]]) -> ModelInfo:
+    """按名称查找模型，config.json 中 custom_models 的同名条目可以覆盖各字段
+
+    结果按模型名称缓存，配置变化后重新查找；返回的 ModelInfo 是共享的，不要修改。
+    """
+    name = getattr(model, "value", model) or ""
+    from .config import resolve_config
+
+    # resolve_config 在各层配置都没有变化时返回同一个对象
+    config = resolve_config()
+    if _info_cache["config"] is not config:
+        _info_cache["config"] = config
+        _info_cache["models"] = {}
+    info = _info_cache["models"].get(name)
+    if info is None:
+        info = _info_cache["models"][name] = _lookup_model(name, config.get("custom_models"))
+    return info
+
+def _lookup_model(name: str, custom_models) -> ModelInfo:
+    info = MODELS.get(name)
+    custom = custom_models.get(name) if isinstance(custom_models, dict) else None
+    if custom is None:
+        return info or ModelInfo(name)
+    if isinstance(custom, str):
+        custom = {"api_base": custom}
+    return (info or ModelInfo(name)).replace(**parse_overrides(custom))
+
+@functools.lru_cache(maxsize=None)
+def _encoding(tokenizer: str):
+    """tiktoken 编码，加载较慢，每个进程只加载一次；没有安装 tiktoken 时返回 None"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(tokenizer)
+    except Exception:
+        return None
+
+def _count(tokenizer: Optional[str], text: str) -> int:
+    encoding = _encoding(tokenizer) if tokenizer else None
+    if encoding is None:
+        return estimate_tokens(text)
+    key = (tokenizer, hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest())
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+    # 编码较慢，不持有锁；两个线程同时计算同一段文本时结果相同
+    count = len(encoding.encode(text, disallowed_special=()))
+    with _token_counts_lock:
+        _token_counts[key] = count
+        _token_counts.move_to_end(key)
+        while len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+def count_tokens(text: Optional[str], model: Optional[Union[str, "Model"]] = None) -> int:
+    """计算文本的 token 数：模型有已知的 tokenizer 且安装了 tiktoken 时精确计算，否则按字符数估算
+
+    精确计数的结果按 (tokenizer, 文本摘要) 缓存，同一个提示词重复计算时直接返回。
+    """
+    if not text:
+        return 0
+    return _count(get_model_info(model).tokenizer, text)
+
+def has_exact_tokenizer(model: Optional[Union[str, "Model"]] = None) -> bool:
+    """count_tokens 对这个模型是否为精确计数"""
+    tokenizer = get_model_info(model).tokenizer
+    return bool(tokenizer) and _encoding(tokenizer) is not None
@@ -1,7 +1,20 @@
+import sys
+import time
+import atexit
+import threading
+import weakref
 from enum import Enum
-from typing import Optional, Union, Dict, List
-import openai
+from typing import TYPE_CHECKING, Callable, Optional, Union, Dict, List, Tuple
+from . import trace
 from .utils import Spinner
+from .compact import compact_diff, estimate_tokens, split_diff_files
+from .models import MODELS, count_tokens, get_model_info
+
+# openai、httpx 和 asyncio 的导入开销较大，只在真正发送请求时才导入，
+# 这样 acmt --version、acmt current 等命令可以快速启动
+if TYPE_CHECKING:
+    import asyncio
+    import openai
 
 class Model(str, Enum):
     # OpenAI Models
@@ -42,43 +55,13 @@ class Model(str, Enum):
     MIXTRAL = "mistralai/mixtral-8x7b-instruct"   # Together AI hosted
     CODELLAMA = "meta-llama/codellama-34b-instruct" # Replicate hosted
 
+    # Local Models
+    LOCAL = "local"                 # 本机 llama.cpp server 或进程内推理
+
     @property
     def api_base(self) -> str:
         """获取模型的默认 API base"""
-        api_bases = {
-            # OpenAI Models - 使用默认 API base
-            "gpt-3.5-turbo": "https://api.openai.com/v1",
-            "gpt-3.5-turbo-16k": "https://api.openai.com/v1",
-            "gpt-4": "https://api.openai.com/v1",
-            "gpt-4-32k": "https://api.openai.com/v1",
-            "gpt-4-1106-preview": "https://api.openai.com/v1",
-            
-            # Other models...
-            "claude-2": "https://api.anthropic.com/v1",
-            "claude-instant-1": "https://api.anthropic.com/v1",
-            "palm-2": "https://generativelanguage.googleapis.com/v1beta",
-            "gemini-pro": "https://generativelanguage.googleapis.com/v1",
-            "qwen-turbo": "https://dashscope.aliyuncs.com/api/v1",
-            "qwen-plus": "https://dashscope.aliyuncs.com/api/v1",
-            "spark-v3": "https://spark-api.xf-yun.com/v3.1",
-            "spark-v2": "https://spark-api.xf-yun.com/v2.1",
-            "baichuan-53b": "https://api.baichuan-ai.com/v1",
-            "chatglm-4": "https://open.bigmodel.cn/api/v1",
-            "chatglm-turbo": "https://open.bigmodel.cn/api/v1",
-            "ernie-4.0": "https://aip.baidubce.com/rpc/2.0/ai_custom/v1",
-            "ernie-turbo": "https://aip.baidubce.com/rpc/2.0/ai_custom/v1",
-            "kimi-v1": "https://api.moonshot.cn/v1",
-            "hunyuan": "https://hunyuan.cloud.tencent.com/hyllm/v1",
-            "hunyuan-lite": "https://hunyuan.cloud.tencent.com/hyllm/v1",
-            "doubao-v1": "https://api.doubao.com/v1",
-            "doubao-turbo": "https://api.doubao.com/v1",
-            "deepseek-chat": "https://api.deepseek.com/v1",
-            "meta-llama/llama-2-70b-chat": "https://api.replicate.com/v1",
-            "mistralai/mistral-7b-instruct": "https://api.together.xyz/v1",
-            "mistralai/mixtral-8x7b-instruct": "https://api.together.xyz/v1",
-            "meta-llama/codellama-34b-instruct": "https://api.replicate.com/v1",
-        }
-        return api_bases.get(self.value)
+        return MODELS[self.value].api_base
 
 DEFAULT_PROMPT = """Based on the following git diff, generate a concise and descriptive commit message that follows conventional commits format.
 Focus on the "what" and "why" of the changes.
@@ -88,116 +71,576 @@ Limit the first line to 72 characters.
 Add a blank line followed by a more detailed description if necessary.
 """
 
-def get_model_settings(model: Model):
-    """Get model specific settings."""
-    # OpenAI GPT-4 Models - 更高温度以增加创造性
-    if model in [Model.GPT4, Model.GPT4_32K, Model.GPT4_TURBO]:
-        return {
-            "temperature": 0.8,
-            "max_tokens": 150,
-            "system_message": "You are an expert programmer with deep understanding of code changes. Generate clear, concise, and insightful git commit messages."
-        }
-    
-    # Anthropic Claude Models - 更注重准确性
-    elif model in [Model.CLAUDE2, Model.CLAUDE_INSTANT]:
-        return {
-            "temperature": 0.6,
-            "max_tokens": 100,
-            "system_message": "You are Claude, an AI assistant focused on generating precise and accurate git commit messages. Focus on technical accuracy and clarity."
-        }
-    
-    # Google Models - 平衡的设置
-    elif model in [Model.PALM2, Model.GEMINI_PRO]:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 120,
-            "system_message": "You are an AI assistant specialized in understanding code changes and generating appropriate git commit messages."
-        }
-    
-    # Chinese Models - 根据各自特点调整
-    elif model in [Model.QIANWEN, Model.QIANWEN_PLUS]:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 100,
-            "system_message": "你是通义千问助手，专注于生成清晰准确的代码提交信息。"
-        }
-    elif model in [Model.SPARK, Model.SPARK_V2]:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 100,
-            "system_message": "你是讯飞星火助手，擅长理解代码变更并生成恰当的提交信息。"
-        }
-    elif model in [Model.GLM4, Model.GLM3_TURBO]:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 100,
-            "system_message": "你是 ChatGLM 助手，专注于代码理解和提交信息生成。"
-        }
-    elif model in [Model.ERNIE, Model.ERNIE_TURBO]:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 100,
-            "system_message": "你是文心一言助手，擅长分析代码变更并生成清晰的提交信息。"
-        }
-    elif model == Model.BAICHUAN:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 100,
-            "system_message": "你是百川助手，专注于代码分析和提交信息生成。"
-        }
-    elif model == Model.KIMI:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 100,
-            "system_message": "你是 KIMI 助手，专注于代码分析和生成高质量的提交信息。"
-        }
-    elif model in [Model.HUNYUAN, Model.HUNYUAN_LITE]:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 100,
-            "system_message": "你是腾讯混元助手，擅长分析代码变更并生成准确的提交信息。"
-        }
-    elif model in [Model.DOUBAO, Model.DOUBAO_TURBO]:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 100,
-            "system_message": "你是豆包助手，专注于代码理解和提交信息生成。"
-        }
-    
-    # Open Source Models - 使用托管服务
-    elif model == Model.DEEPSEEK:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 100,
-            "system_message": "You are an expert programmer. Generate clear and concise git commit messages."
-        }
-    elif model == Model.CODELLAMA:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 100,
-            "system_message": "You are CodeLlama, an AI specialized in code understanding. Generate accurate and technical git commit messages."
-        }
-    elif model in [Model.LLAMA2, Model.MISTRAL, Model.MIXTRAL]:
-        return {
-            "temperature": 0.7,
-            "max_tokens": 100,
-            "system_message": "You are an AI assistant. Generate clear and helpful git commit messages."
-        }
-    
-    # Default settings for GPT-3.5 and any new models
+# 即使模型的上下文窗口很大，diff 也不超过这个 token 数，以控制成本和延迟
+MAX_DIFF_TOKENS = 12000
+
+# 预留给消息格式等额外开销的 token 数
+PROMPT_OVERHEAD_TOKENS = 200
+
+# 提示词超出上下文窗口时最多重新压缩的次数，每次按超出比例再留出一些余量
+PREFLIGHT_ATTEMPTS = 3
+PREFLIGHT_MARGIN = 0.9
+
+def get_diff_token_budget(model: Optional[Union[Model, str]], prompt_template: Optional[str] = None) -> int:
+    """计算 diff 可以使用的 token 预算"""
+    info = get_model_info(model)
+    reserved = count_tokens(prompt_template or DEFAULT_PROMPT, model) + info.max_tokens + PROMPT_OVERHEAD_TOKENS
+    return max(min(info.context_window - reserved, MAX_DIFF_TOKENS), PROMPT_OVERHEAD_TOKENS)
+
+def get_model_settings(model: Union[Model, str]):
+    """Get model specific settings from the model registry."""
+    return get_model_info(model).settings()
+
+# HTTP 连接池参数，所有客户端共用
+HTTP_POOL_SETTINGS = {
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 60.0,
+}
+
+# 按 (api_base, api_key) 复用的客户端，避免每次请求都重新建立 TLS 连接
+_clients: "Dict[Tuple[str, str], openai.OpenAI]" = {}
+# 异步客户端绑定事件循环，按事件循环分别保存
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], openai.AsyncOpenAI]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+def configure_http_pool(
+    max_connections: Optional[int] = None,
+    max_keepalive_connections: Optional[int] = None,
+    keepalive_expiry: Optional[float] = None
+):
+    """调整连接池参数；已创建的同步客户端会被关闭，下次使用时按新参数重建"""
+    updates = {
+        "max_connections": max_connections,
+        "max_keepalive_connections": max_keepalive_connections,
+        "keepalive_expiry": keepalive_expiry,
+    }
+    HTTP_POOL_SETTINGS.update({k: v for k, v in updates.items() if v is not None})
+    close_clients()
+
+def _pool_limits():
+    import httpx
+    return httpx.Limits(**HTTP_POOL_SETTINGS)
+
+def _local_transport(api_base: Optional[str]):
+    """本地模型在进程内推理时使用的传输层，其他情况为 None（使用 httpx 默认的网络传输）"""
+    from .local import get_local_transport
+    return get_local_transport(api_base)
+
+def _client_api_key(api_key: Optional[str], api_base: Optional[str]) -> Optional[str]:
+    """客户端使用的 API key：本地服务不校验 API key，但 OpenAI 客户端要求提供一个，没有配置时用 local 占位"""
+    if api_key:
+        return api_key
+    from .local import is_local_base
+    return "local" if is_local_base(api_base) else None
+
+def get_client(api_key: Optional[str], api_base: Optional[str] = None) -> "openai.OpenAI":
+    """获取共享连接池的同步客户端"""
+    import httpx
+    import openai
+
+    key = (api_base or "", api_key or "")
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = openai.OpenAI(
+                api_key=_client_api_key(api_key, api_base),
+                base_url=api_base,
+                http_client=httpx.Client(
+                    limits=_pool_limits(),
+                    timeout=openai.DEFAULT_TIMEOUT,
+                    follow_redirects=True,
+                    transport=_local_transport(api_base),
+                ),
+            )
+            _clients[key] = client
+        return client
+
+def get_async_client(api_key: Optional[str], api_base: Optional[str] = None) -> "openai.AsyncOpenAI":
+    """获取当前事件循环中共享连接池的异步客户端"""
+    import asyncio
+    import httpx
+    import openai
+
+    loop = asyncio.get_running_loop()
+    key = (api_base or "", api_key or "")
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = openai.AsyncOpenAI(
+                api_key=_client_api_key(api_key, api_base),
+                base_url=api_base,
+                http_client=httpx.AsyncClient(
+                    limits=_pool_limits(),
+                    timeout=openai.DEFAULT_TIMEOUT,
+                    follow_redirects=True,
+                    transport=_local_transport(api_base),
+                ),
+            )
+            clients[key] = client
+        return client
+
+def close_clients():
+    """关闭所有同步客户端，进程退出时自动调用"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+async def aclose_clients():
+    """关闭当前事件循环中的异步客户端，应在事件循环结束前调用"""
+    import asyncio
+
+    with _clients_lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+atexit.register(close_clients)
+
+def get_request_settings(model: Optional[Union[Model, str]]) -> Dict:
+    """获取请求使用的采样参数，未知的自定义模型使用默认值"""
+    info = get_model_info(model)
+    return {"temperature": info.temperature, "max_tokens": info.max_tokens}
+
+def _write_stdout(text: str):
+    """把流式输出的 token 直接写到终端"""
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+def _stream_completion(response, on_token: Callable[[str], None], spinner: Spinner) -> str:
+    """逐块读取流式响应，收到第一个 token 时停止 spinner"""
+    chunks = []
+    for chunk in response:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if not chunks:
+            spinner.stop()
+        chunks.append(delta)
+        on_token(delta)
+    return "".join(chunks)
+
+def _usage_attrs(response) -> Dict:
+    """服务端返回的 token 用量，用于追踪"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
     return {
-        "temperature": 0.7,
-        "max_tokens": 100,
-        "system_message": "You are a helpful assistant that generates clear and concise git commit messages."
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
     }
 
+def _peek_stream(response):
+    """读取流式响应直到第一个有内容的块，返回从头开始的 chunk 迭代器
+
+    重试策略以收到第一个 token 作为请求成功：之后的失败无法重试，已经显示的内容也不能撤回
+    """
+    iterator = iter(response)
+    buffered = []
+    for chunk in iterator:
+        buffered.append(chunk)
+        if any(choice.delta and choice.delta.content for choice in chunk.choices):
+            break
+
+    def chunks():
+        yield from buffered
+        yield from iterator
+
+    return chunks()
+
+def _request_with_policy(
+    request: Dict,
+    build: Callable[[Union[Model, str]], Dict],
+    api_key: str,
+    api_base: Optional[str] = None,
+    stream: bool = False
+):
+    """按配置的重试策略发送 chat.completions 请求，失败时依次切换到 failover 中的模型
+
+    build 为切换到其他模型时重新构造请求参数的函数。
+    返回响应对象；流式请求返回从第一个 token 开始的 chunk 迭代器。
+    """
+    from .retry import call_with_policy, get_retry_policy, resolve_targets
+
+    policy = get_retry_policy()
+    targets = resolve_targets(request["model"], api_base, api_key, policy.failover)
+    requests = {str(request["model"]): request}
+    lock = threading.Lock()
+
+    def call(target, timeout: float):
+        with lock:
+            target_request = requests.get(str(target.model))
+            if target_request is None:
+                target_request = requests[str(target.model)] = build(target.model)
+        # 重试由策略负责，关闭 SDK 自带的重试
+        client = get_client(target.api_key, target.api_base).with_options(max_retries=0)
+        response = client.chat.completions.create(**target_request, stream=stream, timeout=timeout)
+        if not stream:
+            return response
+        return _peek_stream(response), response
+
+    if not stream:
+        return call_with_policy(call, targets, policy, kind="complete")
+    chunks, _ = call_with_policy(call, targets, policy, kind="stream", discard=lambda result: result[1].close())
+    return chunks
+
+async def _arequest_with_policy(
+    request: Dict,
+    build: Callable[[Union[Model, str]], Dict],
+    api_key: str,
+    api_base: Optional[str] = None
+):
+    """_request_with_policy 的异步版本，不支持流式"""
+    from .retry import acall_with_policy, get_retry_policy, resolve_targets
+
+    policy = get_retry_policy()
+    targets = resolve_targets(request["model"], api_base, api_key, policy.failover)
+    requests = {str(request["model"]): request}
+
+    async def call(target, timeout: float):
+        target_request = requests.get(str(target.model))
+        if target_request is None:
+            target_request = requests[str(target.model)] = build(target.model)
+        client = get_async_client(target.api_key, target.api_base).with_options(max_retries=0)
+        return await client.chat.completions.create(**target_request, timeout=timeout)
+
+    return await acall_with_policy(call, targets, policy, kind="complete")
+
+# diff 超过 token 预算的这个倍数时跳过语义预处理：它为整个 diff 的每一行建立对象，
+# 耗时和内存随 diff 大小增长，而这样的 diff 无论如何都要由 compact_diff 压缩
+SEMANTIC_MAX_BUDGET_RATIO = 8
+
+def simplify(diff: Optional[str], max_diff_tokens: Optional[int] = None) -> Optional[str]:
+    """发送前折叠空白变化、移动的代码块和机械替换，配置 "semantic": false 时原样返回
+
+    给出 max_diff_tokens 时，超过它 SEMANTIC_MAX_BUDGET_RATIO 倍的 diff 也原样返回
+    """
+    if not diff:
+        return diff
+    from .semantic import semantic_enabled, simplify_diff
+
+    if not semantic_enabled():
+        return diff
+    if max_diff_tokens is not None and estimate_tokens(diff) > max_diff_tokens * SEMANTIC_MAX_BUDGET_RATIO:
+        trace.mark("semantic.skipped", since=time.monotonic(), tokens=estimate_tokens(diff))
+        return diff
+    with trace.span("semantic") as span:
+        simplified = simplify_diff(diff)
+        span.set(tokens=estimate_tokens(diff), simplified_tokens=estimate_tokens(simplified))
+    return simplified
+
+def dependency_only_message(dependency_files: List[str]) -> str:
+    """只有依赖更新时直接生成提交信息，无需调用模型"""
+    return f"chore: update dependencies in {', '.join(dependency_files)}"
+
+def dependency_suffix(dependency_files: Optional[List[str]], dependency_summary: Optional[str] = None) -> str:
+    """追加在生成的提交信息后面的依赖更新说明；模型看到依赖变更表时无需追加"""
+    if not dependency_files or dependency_summary:
+        return ""
+    return f" and update dependencies in {', '.join(dependency_files)}"
+
+# 历史提交信息示例之前的说明
+EXAMPLES_HEADER = """
+Previous commit messages in this repository that changed similar files.
+Follow their conventions (type names, scope, language, capitalization, level of detail):
+
+"""
+
+def build_chat_request(
+    diff: str,
+    model: Optional[Union[Model, str]] = None,
+    prompt_template: Optional[str] = None,
+    max_diff_tokens: Optional[int] = None,
+    dependency_summary: Optional[str] = None,
+    examples: Optional[List[str]] = None
+) -> Dict:
+    """构造 chat.completions 请求参数，同步和异步接口共用
+
+    examples 为仓库中改动过相似文件的历史提交信息，附加在系统提示词之后作为风格示例
+    """
+    system = prompt_template or DEFAULT_PROMPT
+    if examples:
+        system += EXAMPLES_HEADER + "\n---\n".join(examples) + "\n"
+    # 把 diff 压缩到模型的 token 预算之内，依赖变更表和示例占用的部分从预算中扣除
+    with trace.span("prompt.build") as span:
+        if max_diff_tokens is None:
+            max_diff_tokens = get_diff_token_budget(model, prompt_template)
+        if dependency_summary:
+            max_diff_tokens = max(1, max_diff_tokens - estimate_tokens(dependency_summary))
+        if examples:
+            examples_tokens = estimate_tokens(system) - estimate_tokens(prompt_template or DEFAULT_PROMPT)
+            max_diff_tokens = max(1, max_diff_tokens - examples_tokens)
+        compacted = compact_diff(diff, max_diff_tokens)
+        content = "\n\n".join(part for part in (compacted, dependency_summary) if part)
+
+        # 发送前用模型的 tokenizer 检查提示词：按字符数估算的预算可能偏大，超出上下文窗口时缩小预算重新压缩
+        info = get_model_info(model)
+        limit = info.context_window - info.max_tokens - PROMPT_OVERHEAD_TOKENS
+        prompt_tokens = count_tokens(system, model) + count_tokens(content, model)
+        for _ in range(PREFLIGHT_ATTEMPTS):
+            if prompt_tokens <= limit or not compacted:
+                break
+            max_diff_tokens = max(1, int(max_diff_tokens * limit / prompt_tokens * PREFLIGHT_MARGIN))
+            compacted = compact_diff(diff, max_diff_tokens)
+            content = "\n\n".join(part for part in (compacted, dependency_summary) if part)
+            prompt_tokens = count_tokens(system, model) + count_tokens(content, model)
+        if prompt_tokens > limit:
+            raise ValueError(
+                f"Prompt needs {prompt_tokens} tokens but {info.name or 'the model'} accepts {limit} "
+                f"(context window {info.context_window}, {info.max_tokens} reserved for the answer)"
+            )
+        span.set(
+            diff_tokens=estimate_tokens(diff or ""),
+            tokens=estimate_tokens(content),
+            prompt_tokens=prompt_tokens,
+            budget=max_diff_tokens,
+        )
+
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": content},
+        ],
+        "temperature": info.temperature,
+        "max_tokens": info.max_tokens,
+        "n": 1,
+    }
+
+# map 阶段的提示词：为 diff 的一部分生成简要总结
+MAP_PROMPT = """Summarize the following part of a git diff for someone writing the commit message.
+List the changed files and describe what changed and why in a few short bullet points.
+Do not write a commit message.
+"""
+
+# reduce 阶段放在总结之前的说明
+REDUCE_HEADER = "The diff was too large to show in full. Here are summaries of its parts:\n\n"
+
+# map 阶段的最大并发请求数
+MAP_REDUCE_MAX_WORKERS = 4
+
+# map 阶段每个总结的最大 token 数
+MAP_SUMMARY_TOKENS = 200
+
+def split_diff_chunks(diff: str, max_tokens: int) -> List[str]:
+    """按文件把 diff 分组，每组不超过 max_tokens；单个文件超出时先压缩"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for file_diff in split_diff_files(diff):
+        tokens = estimate_tokens(file_diff)
+        if tokens > max_tokens:
+            file_diff = compact_diff(file_diff, max_tokens)
+            tokens = estimate_tokens(file_diff)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(file_diff if file_diff.endswith("\n") else file_diff + "\n")
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+def build_map_request(chunk: str, model: Optional[Union[Model, str]] = None) -> Dict:
+    """map 阶段总结一个分组的请求参数，同步和异步接口共用"""
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": MAP_PROMPT},
+            {"role": "user", "content": chunk},
+        ],
+        "temperature": 0.3,
+        "max_tokens": MAP_SUMMARY_TOKENS,
+        "n": 1,
+    }
+
+def summarize_diff_chunks(
+    chunks: List[str],
+    api_key: str,
+    api_base: Optional[str] = None,
+    model: Optional[Union[Model, str]] = None,
+    max_workers: int = MAP_REDUCE_MAX_WORKERS
+) -> List[str]:
+    """并发总结每个 diff 分组（map 阶段），结果与输入顺序一致
+
+    与生成提交信息的请求一样按配置的重试策略发送，失败时切换到 failover 中的模型。
+    """
+    def summarize(chunk: str) -> str:
+        response = _request_with_policy(
+            build_map_request(chunk, model), lambda target: build_map_request(chunk, target), api_key, api_base
+        )
+        return response.choices[0].message.content.strip()
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+        return list(pool.map(summarize, chunks))
+
+async def asummarize_diff_chunks(
+    chunks: List[str],
+    api_key: str,
+    api_base: Optional[str] = None,
+    model: Optional[Union[Model, str]] = None,
+    max_workers: int = MAP_REDUCE_MAX_WORKERS
+) -> List[str]:
+    """summarize_diff_chunks 的异步版本，最多 max_workers 个请求同时进行"""
+    import asyncio
+
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def summarize(chunk: str) -> str:
+        async with semaphore:
+            response = await _arequest_with_policy(
+                build_map_request(chunk, model), lambda target: build_map_request(chunk, target), api_key, api_base
+            )
+        return response.choices[0].message.content.strip()
+
+    return list(await asyncio.gather(*(summarize(chunk) for chunk in chunks)))
+
+def reduce_summaries(summaries: List[str]) -> str:
+    """把各分组的总结拼接为 reduce 阶段的内容"""
+    return REDUCE_HEADER + "\n\n".join(
+        f"Part {i}:\n{summary}" for i, summary in enumerate(summaries, 1)
+    )
+
+def map_reduce_diff(
+    diff: str,
+    api_key: str,
+    api_base: Optional[str] = None,
+    model: Optional[Union[Model, str]] = None,
+    map_model: Optional[Union[Model, str]] = None,
+    max_workers: int = MAP_REDUCE_MAX_WORKERS
+) -> str:
+    """把超出上下文的 diff 分组总结，返回用于 reduce 阶段的内容"""
+    map_model = map_model or model
+    chunks = split_diff_chunks(diff, get_diff_token_budget(map_model, MAP_PROMPT))
+    with Spinner(f"Summarizing {len(chunks)} diff chunks..."), trace.span("openai.map", chunks=len(chunks)):
+        summaries = summarize_diff_chunks(chunks, api_key, api_base, map_model, max_workers)
+    return reduce_summaries(summaries)
+
+async def amap_reduce_diff(
+    diff: str,
+    api_key: str,
+    api_base: Optional[str] = None,
+    model: Optional[Union[Model, str]] = None,
+    map_model: Optional[Union[Model, str]] = None,
+    max_workers: int = MAP_REDUCE_MAX_WORKERS
+) -> str:
+    """map_reduce_diff 的异步版本，不显示 spinner"""
+    map_model = map_model or model
+    chunks = split_diff_chunks(diff, get_diff_token_budget(map_model, MAP_PROMPT))
+    with trace.span("openai.map", chunks=len(chunks)):
+        summaries = await asummarize_diff_chunks(chunks, api_key, api_base, map_model, max_workers)
+    return reduce_summaries(summaries)
+
+def dependency_only(
+    diff: Optional[str],
+    dependency_files: Optional[List[str]],
+    dependency_summary: Optional[str] = None
+) -> Optional[str]:
+    """只有依赖文件变化且没有版本变更表时，返回无需调用模型的提交信息；否则返回 None"""
+    if dependency_files and not diff and not dependency_summary:
+        return dependency_only_message(dependency_files)
+    return None
+
+def prepare_diff(
+    diff: Optional[str],
+    model: Optional[Union[Model, str]] = None,
+    prompt_template: Optional[str] = None,
+    max_diff_tokens: Optional[int] = None,
+    map_reduce: bool = False
+) -> Tuple[Optional[str], bool]:
+    """发送前的 diff 预处理，所有生成接口共用
+
+    Returns:
+        (处理后的 diff, 是否需要先分组总结)；开启 map_reduce 且超出模型的 token 预算时为 True
+    """
+    if not diff:
+        return diff, False
+    budget = get_diff_token_budget(model, prompt_template) if max_diff_tokens is None else max_diff_tokens
+    content = simplify(diff, budget)
+    return content, map_reduce and estimate_tokens(content) > budget
+
+def chat_request_builder(
+    content: Optional[str],
+    prompt_template: Optional[str] = None,
+    max_diff_tokens: Optional[int] = None,
+    dependency_summary: Optional[str] = None,
+    examples: Optional[List[str]] = None
+) -> Callable[[Union[Model, str]], Dict]:
+    """按模型构造请求参数的函数；切换到 failover 中的模型时用它重新构造，预算按各模型计算"""
+    def build(target_model: Union[Model, str]) -> Dict:
+        return build_chat_request(content, target_model, prompt_template, max_diff_tokens, dependency_summary, examples)
+
+    return build
+
+def prepare_generation(
+    diff: Optional[str],
+    api_key: str,
+    api_base: Optional[str] = None,
+    model: Optional[Union[Model, str]] = None,
+    prompt_template: Optional[str] = None,
+    max_diff_tokens: Optional[int] = None,
+    dependency_summary: Optional[str] = None,
+    examples: Optional[List[str]] = None,
+    map_reduce: bool = False,
+    map_model: Optional[Union[Model, str]] = None
+) -> Tuple[Optional[str], Dict, Callable[[Union[Model, str]], Dict]]:
+    """prepare_diff、超出预算时的 map 阶段和请求构造，同步的生成接口共用
+
+    Returns:
+        (发送的 diff 内容, 请求参数, 按模型重新构造请求的函数)
+    """
+    content, oversized = prepare_diff(diff, model, prompt_template, max_diff_tokens, map_reduce)
+    if oversized:
+        content = map_reduce_diff(content, api_key, api_base, model, map_model)
+    build = chat_request_builder(content, prompt_template, max_diff_tokens, dependency_summary, examples)
+    return content, build(model), build
+
+async def aprepare_generation(
+    diff: Optional[str],
+    api_key: str,
+    api_base: Optional[str] = None,
+    model: Optional[Union[Model, str]] = None,
+    prompt_template: Optional[str] = None,
+    max_diff_tokens: Optional[int] = None,
+    dependency_summary: Optional[str] = None,
+    examples: Optional[List[str]] = None,
+    map_reduce: bool = False,
+    map_model: Optional[Union[Model, str]] = None
+) -> Tuple[Optional[str], Dict, Callable[[Union[Model, str]], Dict]]:
+    """prepare_generation 的异步版本，map 阶段的请求在事件循环中并发发送"""
+    content, oversized = prepare_diff(diff, model, prompt_template, max_diff_tokens, map_reduce)
+    if oversized:
+        content = await amap_reduce_diff(content, api_key, api_base, model, map_model)
+    build = chat_request_builder(content, prompt_template, max_diff_tokens, dependency_summary, examples)
+    return content, build(model), build
+
 def generate_commit_message(
     diff: Optional[str],
     api_key: str,
     api_base: Optional[str] = None,
     model: Optional[Union[Model, str]] = None,
     prompt_template: Optional[str] = None,
-    dependency_files: Optional[List[str]] = None
+    dependency_files: Optional[List[str]] = None,
+    dependency_summary: Optional[str] = None,
+    max_diff_tokens: Optional[int] = None,
+    stream: bool = False,
+    on_token: Optional[Callable[[str], None]] = None,
+    map_reduce: bool = False,
+    map_model: Optional[Union[Model, str]] = None,
+    examples: Optional[List[str]] = None
 ) -> str:
     """Generate commit message using OpenAI API.
     
@@ -208,42 +651,382 @@ def generate_commit_message(
         model: Optional model to use
         prompt_template: Optional custom prompt template
         dependency_files: Optional list of dependency files that were changed
+        dependency_summary: Optional table of dependency version changes, sent to the model
+        max_diff_tokens: Optional token budget for the diff, defaults to the model's budget
+        stream: Render tokens as they arrive instead of waiting for the full response
+        on_token: Optional callback for streamed tokens, defaults to writing to stdout
+        map_reduce: Summarize oversized diffs in parallel chunks instead of compacting them
+        map_model: Optional cheaper model for the chunk summaries, defaults to model
+        examples: Optional past commit messages of the repository to imitate
     
     Returns:
         Generated commit message
     """
+    if stream and on_token is None:
+        on_token = _write_stdout
 
     # 如果只有依赖更新，没有其他变更
-    if dependency_files and not diff:
-        files_str = ', '.join(dependency_files)
-        return f"chore: update dependencies in {files_str}"
-
-    # 使用 AI 生成提交信息
-    client = openai.OpenAI(
-        api_key=api_key,
-        base_url=api_base,
+    commit_msg = dependency_only(diff, dependency_files, dependency_summary)
+    if commit_msg:
+        if stream:
+            on_token(commit_msg)
+        return commit_msg
+
+    # diff 超出预算时先分组总结，再用配置的模型生成提交信息
+    _, request, build = prepare_generation(
+        diff, api_key, api_base, model, prompt_template, max_diff_tokens, dependency_summary, examples,
+        map_reduce, map_model
     )
 
-    with Spinner("Generating commit message..."):
+    # 使用 AI 生成提交信息；首次调用时包含导入 openai 和创建连接池的时间
+    with trace.span("openai.client"):
+        get_client(api_key, api_base)
+
+    with Spinner("Generating commit message...") as spinner:
         try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": prompt_template or DEFAULT_PROMPT},
-                    {"role": "user", "content": diff},
-                ],
-                temperature=get_model_settings(model)["temperature"] if isinstance(model, Model) else 0.7,
-                max_tokens=get_model_settings(model)["max_tokens"] if isinstance(model, Model) else 100,
-                n=1,
-            )
-            commit_msg = response.choices[0].message.content.strip()
+            with trace.span("openai.request", model=str(model), stream=stream) as span:
+                started = time.monotonic()
+                response = _request_with_policy(request, build, api_key, api_base, stream)
+                if stream:
+                    trace.mark("openai.first_token", since=started)
+                    commit_msg = _stream_completion(response, on_token, spinner).strip()
+                else:
+                    commit_msg = response.choices[0].message.content.strip()
+                    span.set(**_usage_attrs(response))
+                span.set(output_tokens=estimate_tokens(commit_msg))
             
             # 如果有依赖更新，在生成的提交信息后面添加依赖信息
-            if dependency_files:
-                files_str = ', '.join(dependency_files)
-                return f"{commit_msg} and update dependencies in {files_str}"
-            
-            return commit_msg
+            suffix = dependency_suffix(dependency_files, dependency_summary)
+            if stream and suffix:
+                on_token(suffix)
+            return f"{commit_msg}{suffix}"
             
         except Exception as e:
             raise Exception(f"Error: {str(e)}")
+
+# 修改上一次生成的提交信息时附加在系统提示词之后的说明
+REVISE_PROMPT = """
+You previously wrote a commit message for the staged changes. More changes have been staged since then.
+You will be given the previous message and only the diff of the newly staged changes.
+Revise the previous message so that it describes all of the changes, keeping the same format.
+Return only the revised commit message.
+"""
+
+def build_revise_request(
+    previous_message: str,
+    delta: Optional[str],
+    model: Optional[Union[Model, str]] = None,
+    prompt_template: Optional[str] = None,
+    max_diff_tokens: Optional[int] = None,
+    dependency_summary: Optional[str] = None
+) -> Dict:
+    """构造修改提交信息的请求：上一次的提交信息加上之后新暂存的 diff"""
+    request = build_chat_request(delta, model, prompt_template, max_diff_tokens, dependency_summary)
+    system, user = request["messages"]
+    request["messages"] = [
+        {"role": "system", "content": system["content"] + REVISE_PROMPT},
+        {
+            "role": "user",
+            "content": f"Previous commit message:\n{previous_message}\n\n"
+                       f"Changes staged since then:\n{user['content']}",
+        },
+    ]
+    return request
+
+def revise_commit_message(
+    previous_message: str,
+    delta: Optional[str],
+    api_key: str,
+    api_base: Optional[str] = None,
+    model: Optional[Union[Model, str]] = None,
+    prompt_template: Optional[str] = None,
+    dependency_files: Optional[List[str]] = None,
+    dependency_summary: Optional[str] = None,
+    max_diff_tokens: Optional[int] = None,
+    stream: bool = False,
+    on_token: Optional[Callable[[str], None]] = None
+) -> str:
+    """Revise a previously generated commit message after more changes were staged.
+
+    Only the diff between the tree the message was generated for and the
+    current staged tree is sent, together with the previous message.
+
+    Args:
+        previous_message: The message generated for the earlier staged tree
+        delta: The diff between the earlier and the current staged tree
+        dependency_files: Optional list of dependency files changed in the delta
+        dependency_summary: Optional table of dependency version changes in the delta
+
+    The other arguments are the same as for generate_commit_message.
+
+    Returns:
+        Revised commit message
+    """
+    if stream and on_token is None:
+        on_token = _write_stdout
+
+    delta, _ = prepare_diff(delta, model, prompt_template, max_diff_tokens)
+    request = build_revise_request(
+        previous_message, delta, model, prompt_template, max_diff_tokens, dependency_summary
+    )
+
+    def build(failover_model: Union[Model, str]) -> Dict:
+        return build_revise_request(
+            previous_message, delta, failover_model, prompt_template, max_diff_tokens, dependency_summary
+        )
+
+    with trace.span("openai.client"):
+        get_client(api_key, api_base)
+
+    with Spinner("Revising commit message...") as spinner:
+        try:
+            with trace.span("openai.request", model=str(model), stream=stream, revise=True) as span:
+                started = time.monotonic()
+                response = _request_with_policy(request, build, api_key, api_base, stream)
+                if stream:
+                    trace.mark("openai.first_token", since=started)
+                    commit_msg = _stream_completion(response, on_token, spinner).strip()
+                else:
+                    commit_msg = response.choices[0].message.content.strip()
+                    span.set(**_usage_attrs(response))
+                span.set(output_tokens=estimate_tokens(commit_msg))
+
+            suffix = dependency_suffix(dependency_files, dependency_summary)
+            if stream and suffix:
+                on_token(suffix)
+            return f"{commit_msg}{suffix}"
+
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+# 生成候选消息时的最大并发请求数
+CANDIDATES_MAX_WORKERS = 8
+
+def supports_n_choices(model: Optional[Union[Model, str]]) -> bool:
+    """模型是否支持用 n 参数一次返回多个候选（OpenAI GPT 系列）；
+    其他服务商大多忽略或拒绝 n，改为并发发送多个请求"""
+    return get_model_info(model).n_choices
+
+def _stream_choices(response, on_choice: Callable[[int, str], None]) -> Dict[int, str]:
+    """读取带 n 个 choice 的流式响应，每个 choice 结束时立即回调"""
+    chunks: Dict[int, List[str]] = {}
+    finished = {}
+    for chunk in response:
+        for choice in chunk.choices:
+            delta = choice.delta.content if choice.delta else None
+            if delta:
+                chunks.setdefault(choice.index, []).append(delta)
+            if choice.finish_reason and choice.index not in finished:
+                finished[choice.index] = "".join(chunks.get(choice.index, []))
+                on_choice(choice.index, finished[choice.index])
+    # 部分服务不发送 finish_reason，结束时补齐
+    for index, parts in chunks.items():
+        if index not in finished:
+            finished[index] = "".join(parts)
+            on_choice(index, finished[index])
+    return finished
+
+def generate_commit_messages(
+    diff: Optional[str],
+    api_key: str,
+    candidates: int,
+    api_base: Optional[str] = None,
+    model: Optional[Union[Model, str]] = None,
+    prompt_template: Optional[str] = None,
+    dependency_files: Optional[List[str]] = None,
+    dependency_summary: Optional[str] = None,
+    max_diff_tokens: Optional[int] = None,
+    on_candidate: Optional[Callable[[str], None]] = None,
+    map_reduce: bool = False,
+    map_model: Optional[Union[Model, str]] = None,
+    examples: Optional[List[str]] = None
+) -> List[str]:
+    """Generate several alternative commit messages at once.
+
+    Models that support ``n`` get all candidates from a single streamed
+    request, other models get ``candidates`` concurrent requests. Each
+    candidate is passed to ``on_candidate`` as soon as it is complete;
+    duplicates are dropped.
+
+    Args:
+        candidates: Number of alternatives to request
+        on_candidate: Optional callback receiving each new candidate as it arrives
+        Other arguments are the same as generate_commit_message
+
+    Returns:
+        Unique commit messages in arrival order
+    """
+    results: List[str] = []
+    lock = threading.Lock()
+
+    def add(message: str):
+        message = f"{message.strip()}{dependency_suffix(dependency_files, dependency_summary)}"
+        with lock:
+            if not message or message in results:
+                return
+            results.append(message)
+            spinner.stop()
+            if on_candidate:
+                on_candidate(message)
+
+    # 只有依赖更新时只有一个候选
+    message = dependency_only(diff, dependency_files, dependency_summary)
+    if message:
+        if on_candidate:
+            on_candidate(message)
+        return [message]
+
+    _, request, build_request = prepare_generation(
+        diff, api_key, api_base, model, prompt_template, max_diff_tokens, dependency_summary, examples,
+        map_reduce, map_model
+    )
+    with trace.span("openai.client"):
+        get_client(api_key, api_base)
+    candidates = max(1, candidates)
+
+    def build(failover_model: Union[Model, str]) -> Dict:
+        return dict(build_request(failover_model), n=request["n"])
+
+    with Spinner(f"Generating {candidates} commit messages...") as spinner, \
+            trace.span("openai.request", model=str(model), candidates=candidates) as span:
+        try:
+            if supports_n_choices(model):
+                request["n"] = candidates
+                response = _request_with_policy(request, build, api_key, api_base, stream=True)
+                _stream_choices(response, lambda index, message: add(message))
+            else:
+                from concurrent.futures import ThreadPoolExecutor, as_completed
+
+                def generate() -> str:
+                    response = _request_with_policy(request, build, api_key, api_base)
+                    return response.choices[0].message.content
+
+                errors = []
+                workers = min(candidates, CANDIDATES_MAX_WORKERS)
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    futures = [pool.submit(generate) for _ in range(candidates)]
+                    for future in as_completed(futures):
+                        try:
+                            add(future.result())
+                        except Exception as e:
+                            errors.append(e)
+                # 部分请求失败时保留已生成的候选
+                if not results and errors:
+                    raise errors[0]
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+        span.set(unique=len(results))
+
+    return results
+
+def bulk_generate_commit_messages(
+    changes: Dict[str, Tuple[Optional[str], Optional[List[str]], Optional[str]]],
+    api_key: str,
+    api_base: Optional[str] = None,
+    model: Optional[Union[Model, str]] = None,
+    prompt_template: Optional[str] = None,
+    provider: Optional[str] = None,
+    poll_interval: Optional[float] = None,
+    timeout: Optional[float] = None,
+    on_status: Optional[Callable[[str], None]] = None
+) -> Dict[str, Dict]:
+    """Generate commit messages for many diffs as one offline job.
+
+    Uses the provider's batch API where one exists (OpenAI Batches,
+    Anthropic Message Batches), which is cheaper but may take hours;
+    other providers get concurrent chat.completions requests.
+
+    Args:
+        changes: Key -> (diff, dependency_files, dependency_summary), as returned by get_staged_changes
+        api_key: API key for the AI service
+        api_base: Optional API base URL
+        model: Optional model to use
+        prompt_template: Optional custom prompt template
+        provider: Optional provider adapter name, detected from api_base by default
+        poll_interval: Optional maximum seconds between batch status checks
+        timeout: Optional seconds to wait before cancelling the batch
+        on_status: Optional callback receiving batch status updates
+
+    Returns:
+        Key -> {"message": str or None, "error": str or None}
+    """
+    from .providers import DEFAULT_POLL_INTERVAL, get_provider, run_bulk
+
+    results = {}
+    requests = {}
+    for key, (diff, dependency_files, dependency_summary) in changes.items():
+        message = dependency_only(diff, dependency_files, dependency_summary)
+        if message:
+            results[key] = {"message": message, "error": None}
+        else:
+            content, _ = prepare_diff(diff, model, prompt_template)
+            requests[key] = build_chat_request(content, model, prompt_template, dependency_summary=dependency_summary)
+
+    with get_provider(api_key, api_base, provider) as bulk_provider:
+        bulk_results = run_bulk(
+            bulk_provider,
+            requests,
+            poll_interval=poll_interval or DEFAULT_POLL_INTERVAL,
+            timeout=timeout,
+            on_status=on_status
+        )
+    for key, result in bulk_results.items():
+        if result["message"] is not None:
+            dependency_files, dependency_summary = changes[key][1:]
+            result = dict(result, message=f"{result['message']}{dependency_suffix(dependency_files, dependency_summary)}")
+        results[key] = result
+    return results
+
+async def agenerate_commit_message(
+    diff: Optional[str],
+    api_key: str,
+    api_base: Optional[str] = None,
+    model: Optional[Union[Model, str]] = None,
+    prompt_template: Optional[str] = None,
+    dependency_files: Optional[List[str]] = None,
+    dependency_summary: Optional[str] = None,
+    max_diff_tokens: Optional[int] = None,
+    examples: Optional[List[str]] = None,
+    map_reduce: bool = False,
+    map_model: Optional[Union[Model, str]] = None,
+    timeout: Optional[float] = None
+) -> str:
+    """Asynchronous version of generate_commit_message, without terminal output.
+
+    Builds the same request as the synchronous version and sends it with the
+    shared async client, so one event loop can run many generations at once.
+    Cancelling the calling task cancels the HTTP request.
+
+    Args:
+        Same as generate_commit_message, except streaming options
+        timeout: Optional limit in seconds for the whole generation, raises
+            asyncio.TimeoutError when exceeded
+
+    Returns:
+        Generated commit message
+    """
+    import asyncio
+
+    message = dependency_only(diff, dependency_files, dependency_summary)
+    if message:
+        return message
+
+    async def generate() -> str:
+        _, request, build = await aprepare_generation(
+            diff, api_key, api_base, model, prompt_template, max_diff_tokens, dependency_summary, examples,
+            map_reduce, map_model
+        )
+        with trace.span("openai.request", model=str(model)) as span:
+            response = await _arequest_with_policy(request, build, api_key, api_base)
+            commit_msg = response.choices[0].message.content.strip()
+            span.set(**_usage_attrs(response))
+        return f"{commit_msg}{dependency_suffix(dependency_files, dependency_summary)}"
+
+    try:
+        return await asyncio.wait_for(generate(), timeout)
+    except asyncio.TimeoutError as e:
+        if timeout is None:
+            raise Exception(f"Error: {str(e)}")
+        raise asyncio.TimeoutError(f"Error: commit message generation timed out after {timeout:g}s")
+    except Exception as e:
+        raise Exception(f"Error: {str(e)}")
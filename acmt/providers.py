@@ -0,0 +1,330 @@
+import abc
+import json
+import time
+from typing import Callable, Dict, Optional, Tuple, Type
+from urllib.parse import urlparse
+
+from .openai_utils import get_client, _pool_limits
+
+# 批量任务轮询间隔的上限（秒）；从 1 秒开始逐步加倍
+DEFAULT_POLL_INTERVAL = 30.0
+
+# 服务商没有批量接口时，并发发送单个请求的线程数
+FALLBACK_MAX_WORKERS = 8
+
+ANTHROPIC_API_BASE = "https://api.anthropic.com/v1"
+ANTHROPIC_VERSION = "2023-06-01"
+
+class Provider(abc.ABC):
+    """服务商适配器
+
+    单个请求通过 complete 发送，各适配器必须实现；supports_batch 为 True 的服务商
+    还要实现 submit_batch / poll_batch / fetch_batch / cancel_batch，使用服务商的批量接口，
+    费用更低、吞吐更高，但结果可能在数小时后才返回。不支持批量接口的适配器调用这些方法时报错，
+    run_bulk 会先检查 supports_batch，改为并发发送单个请求。
+
+    请求统一使用 chat.completions 的参数格式（model、messages、temperature、max_tokens），
+    由各适配器转换为服务商自己的格式。适配器持有的连接通过 close 释放，也可以用作上下文管理器。
+    """
+
+    name = "base"
+    supports_batch = False
+
+    def __init__(self, api_key: Optional[str], api_base: Optional[str] = None):
+        self.api_key = api_key
+        self.api_base = api_base
+
+    def __enter__(self) -> "Provider":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """释放适配器自己创建的连接；共享的 OpenAI 客户端由 openai_utils 统一关闭"""
+
+    @abc.abstractmethod
+    def complete(self, request: Dict) -> str:
+        """发送单个请求，返回生成的文本"""
+
+    def _unsupported(self):
+        raise NotImplementedError(f"The {self.name} provider does not support batch requests")
+
+    def submit_batch(self, requests: Dict[str, Dict]) -> str:
+        """提交批量任务，requests 为 custom_id -> 请求参数，返回任务 ID"""
+        self._unsupported()
+
+    def poll_batch(self, batch_id: str) -> Tuple[str, bool]:
+        """查询任务状态，返回 (状态, 是否已结束)"""
+        self._unsupported()
+
+    def fetch_batch(self, batch_id: str) -> Dict[str, Dict]:
+        """读取已结束任务的结果：custom_id -> {"message": ..., "error": ...}"""
+        self._unsupported()
+
+    def cancel_batch(self, batch_id: str):
+        self._unsupported()
+
+class OpenAICompatibleProvider(Provider):
+    """OpenAI 兼容的 chat.completions 接口，默认适配器；不使用批量接口"""
+
+    name = "openai-compatible"
+
+    def complete(self, request: Dict) -> str:
+        response = get_client(self.api_key, self.api_base).chat.completions.create(**request)
+        return response.choices[0].message.content.strip()
+
+class OpenAIProvider(OpenAICompatibleProvider):
+    """OpenAI：单个请求同上，批量请求使用 Files + Batches 接口"""
+
+    name = "openai"
+    supports_batch = True
+
+    # 批量任务的结束状态
+    FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+    def submit_batch(self, requests: Dict[str, Dict]) -> str:
+        client = get_client(self.api_key, self.api_base)
+        lines = [
+            json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": request,
+            }, ensure_ascii=False)
+            for custom_id, request in requests.items()
+        ]
+        input_file = client.files.create(
+            file=("acmt-batch.jsonl", ("\n".join(lines) + "\n").encode("utf-8"), "application/jsonl"),
+            purpose="batch",
+        )
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return batch.id
+
+    def poll_batch(self, batch_id: str) -> Tuple[str, bool]:
+        batch = get_client(self.api_key, self.api_base).batches.retrieve(batch_id)
+        if batch.status == "failed":
+            errors = getattr(batch, "errors", None)
+            details = "; ".join(e.message for e in (errors.data or [])) if errors and errors.data else ""
+            raise Exception(f"Error: batch {batch_id} failed{': ' + details if details else ''}")
+        return batch.status, batch.status in self.FINAL_STATUSES
+
+    def fetch_batch(self, batch_id: str) -> Dict[str, Dict]:
+        client = get_client(self.api_key, self.api_base)
+        batch = client.batches.retrieve(batch_id)
+        results = {}
+        for file_id in (batch.output_file_id, getattr(batch, "error_file_id", None)):
+            if not file_id:
+                continue
+            for line in client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                body = response.get("body") or {}
+                error = record.get("error") or body.get("error")
+                if error or response.get("status_code", 200) >= 400:
+                    message = error.get("message") if isinstance(error, dict) else str(error)
+                    results[record["custom_id"]] = {"message": None, "error": message or "request failed"}
+                else:
+                    content = body["choices"][0]["message"]["content"]
+                    results[record["custom_id"]] = {"message": content.strip(), "error": None}
+        return results
+
+    def cancel_batch(self, batch_id: str):
+        get_client(self.api_key, self.api_base).batches.cancel(batch_id)
+
+class AnthropicProvider(Provider):
+    """Anthropic Messages 接口，批量请求使用 Message Batches 接口"""
+
+    name = "anthropic"
+    supports_batch = True
+
+    def __init__(self, api_key: Optional[str], api_base: Optional[str] = None):
+        super().__init__(api_key, api_base or ANTHROPIC_API_BASE)
+        self._http = None
+
+    @property
+    def http(self):
+        if self._http is None:
+            import httpx
+
+            self._http = httpx.Client(
+                base_url=self.api_base.rstrip("/") + "/",
+                headers={
+                    "x-api-key": self.api_key or "",
+                    "anthropic-version": ANTHROPIC_VERSION,
+                },
+                limits=_pool_limits(),
+                timeout=60.0,
+            )
+        return self._http
+
+    def close(self):
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+    def _request(self, method: str, path: str, **kwargs) -> Dict:
+        response = self.http.request(method, path, **kwargs)
+        if response.status_code >= 400:
+            raise Exception(f"Error: {response.status_code} {response.text}")
+        return response.json()
+
+    @staticmethod
+    def to_params(request: Dict) -> Dict:
+        """把 chat.completions 参数转换为 Messages 参数：system 消息单独传递"""
+        system = "\n\n".join(m["content"] for m in request["messages"] if m["role"] == "system")
+        params = {
+            "model": str(request["model"]),
+            "max_tokens": request.get("max_tokens") or 1024,
+            "messages": [m for m in request["messages"] if m["role"] != "system"],
+        }
+        if system:
+            params["system"] = system
+        if request.get("temperature") is not None:
+            params["temperature"] = min(request["temperature"], 1.0)
+        return params
+
+    @staticmethod
+    def _text(message: Dict) -> str:
+        return "".join(block.get("text", "") for block in message.get("content", [])).strip()
+
+    def complete(self, request: Dict) -> str:
+        return self._text(self._request("POST", "messages", json=self.to_params(request)))
+
+    def submit_batch(self, requests: Dict[str, Dict]) -> str:
+        batch = self._request("POST", "messages/batches", json={
+            "requests": [
+                {"custom_id": custom_id, "params": self.to_params(request)}
+                for custom_id, request in requests.items()
+            ]
+        })
+        return batch["id"]
+
+    def poll_batch(self, batch_id: str) -> Tuple[str, bool]:
+        status = self._request("GET", f"messages/batches/{batch_id}")["processing_status"]
+        return status, status == "ended"
+
+    def fetch_batch(self, batch_id: str) -> Dict[str, Dict]:
+        batch = self._request("GET", f"messages/batches/{batch_id}")
+        response = self.http.get(batch["results_url"])
+        if response.status_code >= 400:
+            raise Exception(f"Error: {response.status_code} {response.text}")
+        results = {}
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            result = record.get("result") or {}
+            if result.get("type") == "succeeded":
+                results[record["custom_id"]] = {"message": self._text(result["message"]), "error": None}
+            else:
+                error = (result.get("error") or {}).get("error") or {}
+                results[record["custom_id"]] = {
+                    "message": None,
+                    "error": error.get("message") or result.get("type") or "request failed",
+                }
+        return results
+
+    def cancel_batch(self, batch_id: str):
+        self._request("POST", f"messages/batches/{batch_id}/cancel")
+
+# 已注册的适配器，可以通过 register_provider 添加
+PROVIDERS: Dict[str, Type[Provider]] = {
+    OpenAICompatibleProvider.name: OpenAICompatibleProvider,
+    OpenAIProvider.name: OpenAIProvider,
+    AnthropicProvider.name: AnthropicProvider,
+}
+
+# 按 API base 主机名自动选择的适配器，其他主机使用 OpenAI 兼容接口
+PROVIDER_HOSTS = {
+    "api.openai.com": OpenAIProvider.name,
+    "api.anthropic.com": AnthropicProvider.name,
+}
+
+def register_provider(provider_class: Type[Provider], hosts: Tuple[str, ...] = ()):
+    """注册自定义适配器，可选地指定自动使用它的 API 主机名"""
+    PROVIDERS[provider_class.name] = provider_class
+    for host in hosts:
+        PROVIDER_HOSTS[host] = provider_class.name
+
+def get_provider(api_key: Optional[str], api_base: Optional[str] = None, name: Optional[str] = None) -> Provider:
+    """获取适配器：优先使用指定的名称，否则按 API base 主机名选择"""
+    if not name:
+        host = urlparse(api_base).netloc if api_base else "api.openai.com"
+        name = PROVIDER_HOSTS.get(host, OpenAICompatibleProvider.name)
+    provider_class = PROVIDERS.get(name)
+    if provider_class is None:
+        raise ValueError(f"Unknown provider: {name}. Available providers: {', '.join(sorted(PROVIDERS))}")
+    return provider_class(api_key, api_base)
+
+def run_bulk(
+    provider: Provider,
+    requests: Dict[str, Dict],
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    timeout: Optional[float] = None,
+    on_status: Optional[Callable[[str], None]] = None
+) -> Dict[str, Dict]:
+    """Send many chat requests through the provider's batch API and wait for the results.
+
+    Providers without a batch API get the requests concurrently instead.
+    Results are mapped back to the keys of ``requests``; a request without
+    a result gets an error entry.
+
+    Args:
+        provider: Provider adapter
+        requests: Key -> chat.completions request parameters
+        poll_interval: Maximum seconds between status checks
+        timeout: Optional seconds to wait before cancelling the batch
+        on_status: Optional callback receiving the batch status after each check
+
+    Returns:
+        Key -> {"message": str or None, "error": str or None}
+    """
+    if not requests:
+        return {}
+
+    if not provider.supports_batch:
+        from concurrent.futures import ThreadPoolExecutor
+
+        def complete(request: Dict) -> Dict:
+            try:
+                return {"message": provider.complete(request), "error": None}
+            except Exception as e:
+                return {"message": None, "error": str(e)}
+
+        keys = list(requests)
+        with ThreadPoolExecutor(max_workers=min(FALLBACK_MAX_WORKERS, len(keys))) as pool:
+            return dict(zip(keys, pool.map(complete, (requests[key] for key in keys))))
+
+    # 服务商对 custom_id 的格式有限制，这里使用序号，返回前再对应回原来的键
+    keys = list(requests)
+    batch_requests = {f"acmt-{i}": requests[key] for i, key in enumerate(keys)}
+    batch_id = provider.submit_batch(batch_requests)
+    if on_status:
+        on_status(f"submitted {batch_id}")
+
+    started = time.monotonic()
+    interval = 1.0
+    while True:
+        status, done = provider.poll_batch(batch_id)
+        if on_status:
+            on_status(status)
+        if done:
+            break
+        if timeout is not None and time.monotonic() - started > timeout:
+            provider.cancel_batch(batch_id)
+            raise Exception(f"Error: batch {batch_id} did not finish within {timeout:.0f}s and was cancelled")
+        time.sleep(interval)
+        interval = min(interval * 2, poll_interval)
+
+    results = provider.fetch_batch(batch_id)
+    return {
+        key: results.get(f"acmt-{i}") or {"message": None, "error": "no result returned"}
+        for i, key in enumerate(keys)
+    }
@@ -0,0 +1,507 @@
+import os
+import sys
+import json
+import atexit
+import time
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from . import trace
+from .cache import CACHE_DIR
+
+# 默认策略：每个模型最多尝试 3 次，单次请求 30 秒，整体 90 秒
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_ATTEMPT_TIMEOUT = 30.0
+DEFAULT_TOTAL_TIMEOUT = 90.0
+
+# 指数退避：第 n 次重试前等待 [0, min(backoff_max, backoff_base * 2^n)] 之间的随机时间
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 8.0
+
+# 对冲请求：请求耗时超过历史 p95 仍未返回时，再发送一个相同的请求，取先返回的结果
+DEFAULT_HEDGE_PERCENTILE = 95
+# 样本数达到这个值后才按百分位对冲
+HEDGE_MIN_SAMPLES = 20
+
+# 每个模型保留的最近耗时样本数
+LATENCY_WINDOW = 100
+LATENCY_FILE = os.path.join(CACHE_DIR, "latency.json")
+# 新样本在内存中累积，最多每隔这么多秒写入一次文件（秒）；进程退出时写入剩余的样本
+LATENCY_FLUSH_INTERVAL = 60.0
+
+# 可以重试的 HTTP 状态码；其他 4xx 重试也不会成功，直接切换到下一个模型
+RETRYABLE_STATUS = frozenset([408, 409, 425, 429, 500, 502, 503, 504, 529])
+
+class AttemptTimeout(TimeoutError):
+    """单次请求超过了 attempt_timeout"""
+
+class RetryError(Exception):
+    """所有模型的所有尝试都失败了"""
+
+    def __init__(self, errors: List[Tuple["Target", BaseException]]):
+        self.errors = errors
+        details = "; ".join(f"{target}: {error or type(error).__name__}" for target, error in errors[-3:])
+        super().__init__(f"{len(errors)} attempt(s) failed ({details})")
+
+class Target:
+    """一个可以发送请求的模型：模型名、API base 和 API key"""
+
+    __slots__ = ("model", "api_base", "api_key")
+
+    def __init__(self, model: Any, api_base: Optional[str], api_key: Optional[str]):
+        self.model = model
+        self.api_base = api_base
+        self.api_key = api_key
+
+    def __eq__(self, other):
+        return isinstance(other, Target) and \
+            (str(self.model), self.api_base, self.api_key) == (str(other.model), other.api_base, other.api_key)
+
+    def __hash__(self):
+        return hash((str(self.model), self.api_base, self.api_key))
+
+    def __str__(self):
+        model = getattr(self.model, "value", self.model)
+        return f"{model}@{self.api_base}" if self.api_base else str(model)
+
+class RetryPolicy:
+    """Retry, timeout, hedging and failover settings for model requests.
+
+    Args:
+        max_attempts: Attempts per model before failing over to the next one
+        attempt_timeout: Seconds before a single attempt is abandoned
+        total_timeout: Seconds for all attempts across all models
+        backoff_base: First backoff ceiling in seconds, doubled after every attempt
+        backoff_max: Upper bound for the backoff ceiling
+        hedge_after: Seconds before a hedged request is sent, "p<N>" to use the Nth
+            percentile of recent latencies, or None to disable hedging
+        failover: Ordered models to try when the configured model keeps failing;
+            names of built-in or custom models, or {"model", "api_base", "api_key"} dicts
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        attempt_timeout: float = DEFAULT_ATTEMPT_TIMEOUT,
+        total_timeout: float = DEFAULT_TOTAL_TIMEOUT,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_max: float = DEFAULT_BACKOFF_MAX,
+        hedge_after: Any = f"p{DEFAULT_HEDGE_PERCENTILE}",
+        failover: Optional[List[Any]] = None
+    ):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        self.attempt_timeout = attempt_timeout
+        self.total_timeout = total_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = _parse_hedge_after(hedge_after)
+        self.failover = list(failover or [])
+
+    @classmethod
+    def from_config(cls, config: Any) -> "RetryPolicy":
+        """从配置文件的 "retry" 项创建；环境变量 ACMT_RETRY 可以是 JSON 字符串"""
+        if isinstance(config, str):
+            config = json.loads(config) if config.strip() else {}
+        config = config or {}
+        unknown = set(config) - _POLICY_KEYS
+        if unknown:
+            raise ValueError(f"Unknown retry settings: {', '.join(sorted(unknown))}")
+        failover = config.get("failover")
+        if isinstance(failover, str):
+            failover = [name.strip() for name in failover.split(",") if name.strip()]
+        return cls(**dict(config, failover=failover))
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """第 attempt 次失败后的等待时间（full jitter）；服务端给出 Retry-After 时至少等待这么久"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def hedge_delay(self, stats: "LatencyStats", key: str) -> Optional[float]:
+        """发送对冲请求前等待的秒数，不对冲时返回 None"""
+        kind, value = self.hedge_after
+        if kind == "seconds":
+            return value
+        if kind == "percentile":
+            return stats.percentile(key, value)
+        return None
+
+_POLICY_KEYS = frozenset([
+    "max_attempts", "attempt_timeout", "total_timeout", "backoff_base", "backoff_max", "hedge_after", "failover",
+])
+
+def _parse_hedge_after(value: Any) -> Tuple[Optional[str], float]:
+    if value is None or value is False:
+        return (None, 0.0)
+    if isinstance(value, str) and value.lower().startswith("p"):
+        percentile = float(value[1:])
+        if not 0 < percentile < 100:
+            raise ValueError(f"Invalid hedge percentile: {value}")
+        return ("percentile", percentile)
+    return ("seconds", float(value))
+
+def get_retry_policy() -> RetryPolicy:
+    """按配置文件 "retry" 项（或 ACMT_RETRY）创建重试策略"""
+    from .config import get_config_value
+
+    return RetryPolicy.from_config(get_config_value("retry"))
+
+def resolve_targets(
+    model: Any,
+    api_base: Optional[str],
+    api_key: Optional[str],
+    failover: Optional[List[Any]] = None
+) -> List[Target]:
+    """按顺序列出要尝试的模型：配置的模型在前，然后是 failover 列表
+
+    failover 中的自定义模型使用自己的 API base，其他模型沿用当前的 API base 和 key
+    （大多数网关在同一个地址下提供多个模型）；也可以用字典分别指定。
+    """
+    from .config import get_custom_model
+
+    targets = [Target(model, api_base, api_key)]
+    for entry in failover or []:
+        if isinstance(entry, dict):
+            if not entry.get("model"):
+                raise ValueError(f"Failover entry without a model: {entry}")
+            target = Target(entry["model"], entry.get("api_base") or api_base, entry.get("api_key") or api_key)
+        else:
+            custom = get_custom_model(entry)
+            target = Target(entry, custom["api_base"] if custom else api_base, api_key)
+        if target not in targets:
+            targets.append(target)
+    return targets
+
+def is_retryable(error: BaseException) -> bool:
+    """超时、连接错误、429 和 5xx 可以重试"""
+    if isinstance(error, TimeoutError):
+        return True
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    # openai 和 httpx 只在发送请求后才会导入，这里不主动导入
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(error, openai.APIConnectionError):
+        return True
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    return False
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """从响应头 retry-after-ms / Retry-After 读取服务端要求的等待秒数"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # HTTP 日期格式
+    from email.utils import parsedate_to_datetime
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class LatencyStats:
+    """每个模型最近的请求耗时，保存在缓存目录中，供下次运行计算对冲阈值
+
+    record 只修改内存中的样本，每隔 flush_interval 秒或进程退出时才写入文件，
+    请求路径上（包括事件循环中）不会每次都写文件。写入时与文件中其他进程的样本合并。
+    """
+
+    def __init__(self, path: str = LATENCY_FILE, window: int = LATENCY_WINDOW,
+                 flush_interval: float = LATENCY_FLUSH_INTERVAL):
+        self.path = path
+        self.window = window
+        self.flush_interval = flush_interval
+        self._samples: Optional[Dict[str, List[float]]] = None
+        # 上次写入之后记录的样本
+        self._pending: Dict[str, List[float]] = {}
+        self._flushed = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _read(self) -> Dict[str, List[float]]:
+        try:
+            with open(self.path, 'r') as f:
+                samples = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return samples if isinstance(samples, dict) else {}
+
+    def _load(self) -> Dict[str, List[float]]:
+        if self._samples is None:
+            self._samples = self._read()
+        return self._samples
+
+    def percentile(self, key: str, percentile: float) -> Optional[float]:
+        """最近样本的百分位数，样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._load().get(key, []))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+    def record(self, key: str, seconds: float):
+        sample = round(seconds, 4)
+        with self._lock:
+            samples = self._load().setdefault(key, [])
+            samples.append(sample)
+            del samples[:-self.window]
+            self._pending.setdefault(key, []).append(sample)
+            due = time.monotonic() - self._flushed >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """把新样本合并到文件中，先写临时文件再替换，其他进程不会读到不完整的文件"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._flushed = time.monotonic()
+            if not pending:
+                return
+            merged = self._read()
+            for key, samples in pending.items():
+                merged[key] = (merged.get(key, []) + samples)[-self.window:]
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(merged, f)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+            with self._lock:
+                # 合并期间记录的样本不能丢掉
+                for key, samples in self._pending.items():
+                    merged[key] = (merged.get(key, []) + samples)[-self.window:]
+                self._samples = merged
+
+_stats = LatencyStats()
+atexit.register(_stats.flush)
+
+def _latency_key(target: Target, kind: str) -> str:
+    return f"{kind}:{target}"
+
+def _start(call: Callable[[Target, float], Any], target: Target, timeout: float) -> Future:
+    """在守护线程中发送请求；超时后放弃的请求不会阻止进程退出"""
+    future: Future = Future()
+    future.started = time.monotonic()
+
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(call(target, timeout))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+def _discard_when_done(future: Future, discard: Optional[Callable[[Any], None]]):
+    """被放弃的请求完成后释放它的结果（如关闭流式响应）"""
+    if discard is None:
+        return
+
+    def release(done: Future):
+        if done.exception() is None:
+            try:
+                discard(done.result())
+            except Exception:
+                pass
+
+    future.add_done_callback(release)
+
+def _attempt(
+    call: Callable[[Target, float], Any],
+    target: Target,
+    timeout: float,
+    hedge_after: Optional[float],
+    discard: Optional[Callable[[Any], None]]
+) -> Tuple[Any, float]:
+    """发送一次请求，超过 hedge_after 仍未返回时再发送一个，返回 (结果, 耗时)"""
+    started = time.monotonic()
+    deadline = started + timeout
+    hedge_at = started + hedge_after if hedge_after is not None and hedge_after < timeout else None
+    pending = {_start(call, target, timeout)}
+    first_error = None
+    while True:
+        wake = min(deadline, hedge_at) if hedge_at is not None else deadline
+        done, _ = wait(pending, timeout=max(0.0, wake - time.monotonic()), return_when=FIRST_COMPLETED)
+        pending -= done
+        winner = next((future for future in done if future.exception() is None), None)
+        if winner is not None:
+            for other in pending | done:
+                if other is not winner:
+                    _discard_when_done(other, discard)
+            return winner.result(), time.monotonic() - winner.started
+        for future in done:
+            first_error = first_error or future.exception()
+        if not pending:
+            raise first_error
+        now = time.monotonic()
+        if now >= deadline:
+            for future in pending:
+                _discard_when_done(future, discard)
+            raise AttemptTimeout(f"no response within {timeout:.1f}s")
+        if hedge_at is not None and now >= hedge_at:
+            trace.mark("retry.hedge", since=started, target=str(target))
+            pending.add(_start(call, target, deadline - now))
+            hedge_at = None
+
+def call_with_policy(
+    call: Callable[[Target, float], Any],
+    targets: List[Target],
+    policy: Optional[RetryPolicy] = None,
+    kind: str = "complete",
+    discard: Optional[Callable[[Any], None]] = None,
+    stats: Optional[LatencyStats] = None
+) -> Any:
+    """Run ``call(target, timeout)`` under a retry policy.
+
+    Each attempt gets its own deadline and may be hedged; retryable errors
+    are retried with jittered exponential backoff that honors Retry-After,
+    and the next target is tried once a target's attempts are used up or it
+    fails with an error that retrying will not fix.
+
+    Args:
+        call: Sends one request and returns its result; ``timeout`` is the attempt's remaining seconds
+        targets: Models to try in order, see resolve_targets
+        policy: Retry policy, defaults to RetryPolicy()
+        kind: Latency bucket for hedging, e.g. "complete" or "stream"
+        discard: Optional callback releasing results of abandoned requests
+        stats: Optional latency statistics, defaults to the shared on-disk statistics
+
+    Returns:
+        The first successful result
+
+    Raises:
+        RetryError: When every attempt failed or the total timeout ran out
+    """
+    policy = policy or RetryPolicy()
+    stats = stats or _stats
+    deadline = time.monotonic() + policy.total_timeout
+    errors: List[Tuple[Target, BaseException]] = []
+    for target in targets:
+        key = _latency_key(target, kind)
+        for attempt in range(policy.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RetryError(errors or [(target, AttemptTimeout("total timeout exceeded"))])
+            started = time.monotonic()
+            try:
+                result, latency = _attempt(
+                    call, target, min(policy.attempt_timeout, remaining), policy.hedge_delay(stats, key), discard
+                )
+            except Exception as e:
+                errors.append((target, e))
+                trace.mark("retry.attempt", since=started, target=str(target), attempt=attempt + 1, error=type(e).__name__)
+                if not is_retryable(e) or attempt + 1 == policy.max_attempts:
+                    break
+                delay = policy.backoff(attempt, retry_after(e))
+                if time.monotonic() + delay >= deadline:
+                    # 等待会超出整体时限，直接切换到下一个模型
+                    break
+                time.sleep(delay)
+                continue
+            stats.record(key, latency)
+            return result
+    raise RetryError(errors)
+
+async def _aattempt(
+    call: Callable[[Target, float], Awaitable[Any]],
+    target: Target,
+    timeout: float,
+    hedge_after: Optional[float]
+) -> Tuple[Any, float]:
+    """_attempt 的异步版本，被放弃的请求直接取消"""
+    import asyncio
+
+    started = time.monotonic()
+    deadline = started + timeout
+    hedge_at = started + hedge_after if hedge_after is not None and hedge_after < timeout else None
+    task = asyncio.ensure_future(call(target, timeout))
+    task.started = started
+    pending = {task}
+    first_error = None
+    try:
+        while True:
+            wake = min(deadline, hedge_at) if hedge_at is not None else deadline
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, wake - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), time.monotonic() - task.started
+                first_error = first_error or task.exception()
+            if not pending:
+                raise first_error
+            now = time.monotonic()
+            if now >= deadline:
+                raise AttemptTimeout(f"no response within {timeout:.1f}s")
+            if hedge_at is not None and now >= hedge_at:
+                trace.mark("retry.hedge", since=started, target=str(target))
+                task = asyncio.ensure_future(call(target, deadline - now))
+                task.started = now
+                pending.add(task)
+                hedge_at = None
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def acall_with_policy(
+    call: Callable[[Target, float], Awaitable[Any]],
+    targets: List[Target],
+    policy: Optional[RetryPolicy] = None,
+    kind: str = "complete",
+    stats: Optional[LatencyStats] = None
+) -> Any:
+    """Asynchronous version of call_with_policy; abandoned requests are cancelled."""
+    import asyncio
+
+    policy = policy or RetryPolicy()
+    stats = stats or _stats
+    deadline = time.monotonic() + policy.total_timeout
+    errors: List[Tuple[Target, BaseException]] = []
+    for target in targets:
+        key = _latency_key(target, kind)
+        for attempt in range(policy.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RetryError(errors or [(target, AttemptTimeout("total timeout exceeded"))])
+            try:
+                result, latency = await _aattempt(
+                    call, target, min(policy.attempt_timeout, remaining), policy.hedge_delay(stats, key)
+                )
+            except Exception as e:
+                errors.append((target, e))
+                if not is_retryable(e) or attempt + 1 == policy.max_attempts:
+                    break
+                delay = policy.backoff(attempt, retry_after(e))
+                if time.monotonic() + delay >= deadline:
+                    break
+                await asyncio.sleep(delay)
+                continue
+            stats.record(key, latency)
+            return result
+    raise RetryError(errors)
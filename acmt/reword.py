@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import subprocess
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .git_utils import READ_CHUNK_SIZE, aget_tree_changes, get_git_root, run_git_command
+
+# git 的空 tree，根提交与它比较
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+# 默认同时进行的模型请求数
+DEFAULT_CONCURRENCY = 8
+
+# 改写前的分支保存在这里，与 git filter-branch 的 refs/original 类似
+BACKUP_REF_PREFIX = "refs/acmt/original/"
+
+# 已生成的提交信息保存在仓库的 git 目录中，中断后再次运行时继续
+CHECKPOINT_FILE = "acmt-reword.json"
+
+def _git(args: List[str], cwd: str) -> str:
+    returncode, stdout, stderr = run_git_command(['git', *args], cwd=cwd)
+    if returncode != 0:
+        raise Exception(f"Error: git {args[0]} failed: {stderr.strip()}")
+    return stdout
+
+def parse_range(rev_range: str, cwd: str) -> Tuple[str, str, str]:
+    """解析 <base>..[<branch>]，branch 默认为当前分支
+
+    Returns:
+        (base 提交, 分支的完整 ref 名称, 分支当前指向的提交)
+    """
+    base, sep, tip = rev_range.partition("..")
+    if not sep or not base or tip.startswith("."):
+        raise ValueError(f"Expected a range like main..feature or main.., got: {rev_range}")
+    tip = tip or "HEAD"
+    returncode, ref, _ = run_git_command(['git', 'rev-parse', '--symbolic-full-name', tip], cwd=cwd)
+    ref = ref.strip()
+    if returncode != 0 or not ref.startswith("refs/heads/"):
+        raise ValueError(f"{tip} is not a branch; only branches can be reworded")
+    base_commit = _git(['rev-parse', '--verify', f"{base}^{{commit}}"], cwd).strip()
+    tip_commit = _git(['rev-parse', '--verify', ref], cwd).strip()
+    return base_commit, ref, tip_commit
+
+def list_commits(base: str, tip: str, cwd: str) -> List[Tuple[str, List[str], str]]:
+    """范围内的提交，按从旧到新的顺序
+
+    Returns:
+        [(提交, 父提交列表, 标题), ...]
+    """
+    output = _git(['log', '--reverse', '--topo-order', '--format=%H%x00%P%x00%s%x1e', f"{base}..{tip}"], cwd)
+    commits = []
+    for record in output.split("\x1e"):
+        record = record.strip("\n")
+        if not record:
+            continue
+        sha, parents, subject = record.split("\x00", 2)
+        commits.append((sha, parents.split(), subject))
+    return commits
+
+def _checkpoint_path(git_root: str) -> str:
+    path = _git(['rev-parse', '--git-path', CHECKPOINT_FILE], git_root).strip()
+    return os.path.join(git_root, path)
+
+def load_checkpoint(path: str, tip: str, context: str) -> Dict[str, str]:
+    """读取同一分支、同一设置下已生成的提交信息；分支或设置变化后重新开始"""
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(state, dict) or state.get("tip") != tip or state.get("context") != context:
+        return {}
+    messages = state.get("messages")
+    return messages if isinstance(messages, dict) else {}
+
+def save_checkpoint(path: str, tip: str, context: str, messages: Dict[str, str]):
+    """先写临时文件再替换，中断时不会留下不完整的文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"tip": tip, "context": context, "messages": messages, "updated": time.time()}, f)
+    os.replace(tmp_path, path)
+
+def clear_checkpoint(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+async def generate_messages(
+    commits: List[Tuple[str, List[str], str]],
+    git_root: str,
+    messages: Dict[str, str],
+    on_message: Callable[[Tuple[str, List[str], str], Optional[str]], None],
+    concurrency: int = DEFAULT_CONCURRENCY
+) -> List[Tuple[str, Exception]]:
+    """为每个提交读取与第一个父提交之间的 diff 并生成提交信息，最多 concurrency 个同时进行
+
+    结果写入 messages 后调用 on_message；没有内容变化的提交不生成，message 为 None。
+
+    Returns:
+        失败的 [(提交, 错误), ...]
+    """
+    import asyncio
+    from .config import get_config_value
+    from .openai_utils import agenerate_commit_message, aclose_clients
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(commit: Tuple[str, List[str], str]):
+        sha, parents, _ = commit
+        async with semaphore:
+            diff, dependency_files, dependency_summary = await aget_tree_changes(
+                parents[0] if parents else EMPTY_TREE, sha, git_root
+            )
+            if not diff and not dependency_files:
+                on_message(commit, None)
+                return
+            message = await agenerate_commit_message(
+                diff=diff,
+                api_key=get_config_value("api_key"),
+                api_base=get_config_value("api_base"),
+                model=get_config_value("model"),
+                prompt_template=get_config_value("prompt"),
+                dependency_files=dependency_files,
+                dependency_summary=dependency_summary
+            )
+        messages[sha] = message
+        on_message(commit, message)
+
+    try:
+        results = await asyncio.gather(*(process(commit) for commit in commits), return_exceptions=True)
+    finally:
+        await aclose_clients()
+    failures = []
+    for commit, result in zip(commits, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                raise result
+            failures.append((commit[0], result))
+    return failures
+
+def _copy(reader, writer, size: int):
+    """把 size 字节从 fast-export 原样转给 fast-import，大文件分块读取"""
+    while size > 0:
+        chunk = reader.read(min(size, READ_CHUNK_SIZE))
+        if not chunk:
+            raise Exception("Error: git fast-export output ended unexpectedly")
+        if writer is not None:
+            writer.write(chunk)
+        size -= len(chunk)
+
+def rewrite_history(git_root: str, base: str, ref: str, messages: Dict[str, str]) -> int:
+    """用一次 git fast-export | git fast-import 改写 base..ref 的提交信息
+
+    只替换 messages 中提交的 data 段，其他内容原样传递，tree 与作者信息都不变。
+
+    Returns:
+        改写的提交数
+    """
+    export = subprocess.Popen(
+        ['git', 'fast-export', '--show-original-ids', '--reference-excluded-parents', '--reencode=yes',
+         '--signed-tags=strip', ref, f"^{base}"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        cwd=git_root
+    )
+    importer = subprocess.Popen(
+        ['git', 'fast-import', '--force', '--quiet', '--done'],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        cwd=git_root
+    )
+    rewritten = 0
+    kind = None
+    original = None
+    reader, writer = export.stdout, importer.stdin
+    try:
+        for line in iter(reader.readline, b""):
+            if line.startswith((b"commit ", b"blob", b"tag ", b"reset ")):
+                kind = line.split(b" ", 1)[0].strip()
+                original = None
+            elif line.startswith(b"original-oid "):
+                original = line[len(b"original-oid "):].strip().decode("ascii")
+            elif line.startswith(b"data "):
+                size = int(line[len(b"data "):])
+                message = messages.get(original) if kind == b"commit" else None
+                if message is None:
+                    writer.write(line)
+                    _copy(reader, writer, size)
+                else:
+                    data = message.rstrip("\n").encode("utf-8") + b"\n"
+                    writer.write(b"data %d\n" % len(data) + data)
+                    _copy(reader, None, size)
+                    rewritten += 1
+                continue
+            writer.write(line)
+        # 没有读完就中断时不写 done，fast-import 会放弃所有更新，分支保持原样
+        writer.write(b"done\n")
+    finally:
+        reader.close()
+        export.wait()
+        try:
+            writer.close()
+        except BrokenPipeError:
+            pass
+        stderr = importer.stderr.read().decode("utf-8", "replace")
+        importer.wait()
+    if export.returncode != 0:
+        raise Exception("Error: git fast-export failed")
+    if importer.returncode != 0:
+        raise Exception(f"Error: git fast-import failed: {stderr.strip()}")
+    return rewritten
+
+def run_reword(
+    rev_range: str,
+    cwd: Optional[str] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    dry_run: bool = False,
+    restart: bool = False,
+    confirm: Optional[Callable[[int, str], bool]] = None,
+    log: Optional[Callable[[str], None]] = None
+) -> Dict:
+    """Regenerate the messages of the commits in ``<base>..<branch>`` and rewrite the branch.
+
+    Messages are generated concurrently and saved to a checkpoint in the git
+    directory as they arrive, so an interrupted run continues where it stopped.
+    The history is then rewritten in one ``git fast-export | git fast-import``
+    pass; the old branch tip is kept under ``refs/acmt/original/``. Merge
+    commits and commits without changes keep their messages.
+
+    Args:
+        rev_range: Range like ``main..feature`` or ``main..`` (current branch)
+        cwd: Optional path inside the repository, defaults to the current directory
+        concurrency: Maximum number of concurrent model requests
+        dry_run: Generate and checkpoint the messages without rewriting
+        restart: Discard the checkpoint and generate every message again
+        confirm: Optional callback (commit count, branch) returning whether to rewrite
+        log: Optional callback receiving progress messages
+
+    Returns:
+        A dict with commits, generated, rewritten and backup (the backup ref, or None)
+    """
+    import asyncio
+    from .cache import commit_cache_key
+    from .config import get_config_value
+
+    log = log or (lambda message: None)
+    git_root = get_git_root(cwd)
+    if not git_root:
+        raise Exception("Error: not a git repository")
+    base, ref, tip = parse_range(rev_range, git_root)
+    commits = [commit for commit in list_commits(base, tip, git_root) if len(commit[1]) <= 1]
+    result = {"commits": len(commits), "generated": 0, "rewritten": 0, "backup": None}
+    if not commits:
+        log(f"No commits to reword in {rev_range}")
+        return result
+
+    # 检查点只在分支和模型设置都没有变化时有效
+    checkpoint = _checkpoint_path(git_root)
+    context = commit_cache_key(
+        "", get_config_value("model"), get_config_value("api_base"), get_config_value("prompt")
+    )
+    if restart:
+        clear_checkpoint(checkpoint)
+    messages = load_checkpoint(checkpoint, tip, context)
+    pending = [commit for commit in commits if commit[0] not in messages]
+    if len(pending) < len(commits):
+        log(f"Resuming: {len(commits) - len(pending)} of {len(commits)} messages already generated")
+
+    done = [len(commits) - len(pending)]
+
+    def on_message(commit: Tuple[str, List[str], str], message: Optional[str]):
+        done[0] += 1
+        sha, _, subject = commit
+        if message is None:
+            log(f"[{done[0]}/{len(commits)}] {sha[:10]} {subject} (no changes, kept)")
+            return
+        save_checkpoint(checkpoint, tip, context, messages)
+        result["generated"] += 1
+        log(f"[{done[0]}/{len(commits)}] {sha[:10]} {subject} -> {message.splitlines()[0] if message else ''}")
+
+    if pending:
+        failures = asyncio.run(generate_messages(pending, git_root, messages, on_message, concurrency))
+        if failures:
+            for sha, error in failures:
+                log(f"{sha[:10]} failed: {str(error)}")
+            raise Exception(f"Error: {len(failures)} commits failed, run the command again to resume")
+
+    if dry_run or not messages:
+        return result
+    if confirm and not confirm(len(messages), ref):
+        return result
+
+    # 改写之前保存原来的分支，改写后的 tree 必须与原来相同
+    backup = BACKUP_REF_PREFIX + ref[len("refs/"):]
+    _git(['update-ref', backup, tip], git_root)
+    result["backup"] = backup
+    result["rewritten"] = rewrite_history(git_root, base, ref, messages)
+    if _git(['rev-parse', f"{ref}^{{tree}}"], git_root) != _git(['rev-parse', f"{tip}^{{tree}}"], git_root):
+        _git(['update-ref', ref, tip], git_root)
+        raise Exception(f"Error: rewritten {ref} does not match the original tree, restored it")
+    clear_checkpoint(checkpoint)
+    return result
@@ -0,0 +1,417 @@
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .compact import split_diff_files
+
+# 说明行的前缀：替代被折叠的改动，compact_diff 会像改动行一样保留它们
+NOTE_PREFIX = "~ "
+
+# 移动的代码块至少包含的行数和字母数字字符数（与 git --color-moved 的默认阈值相同）
+MIN_MOVED_LINES = 3
+MIN_MOVED_CHARS = 20
+
+# 忽略空白后短于这个长度的行（如 "}"、"end"）太常见，不作为查找移动块的起点
+MIN_SEED_CHARS = 4
+# 出现次数超过这个值的行不作为起点，避免在重复代码中做大量匹配
+MAX_SEED_CANDIDATES = 32
+
+# 同一个替换至少出现在这么多行中，才认为是机械的查找替换
+MIN_REPLACED_LINES = 3
+# 每行最多允许的不同替换数
+MAX_REPLACEMENTS_PER_LINE = 2
+
+# 对齐删除行和新增行时，遇到不对应的行最多向前查找的行数
+ALIGN_LOOKAHEAD = 8
+
+_HUNK_HEADER = re.compile(r"@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@")
+_TOKEN = re.compile(r"\w+|\s+|[^\w\s]")
+_ALNUM = re.compile(r"[A-Za-z0-9_]")
+
+def _squash(text: str) -> str:
+    """去掉所有空白，用于忽略空白的比较"""
+    return "".join(text.split())
+
+class _Line:
+    """hunk 中的一行：sign 为 "+"、"-"、" " 或 "\\"，old/new 为旧、新文件中的行号"""
+
+    __slots__ = ("sign", "text", "old", "new", "key", "note", "dropped")
+
+    def __init__(self, sign: str, text: str, old: int, new: int):
+        self.sign = sign
+        self.text = text
+        self.old = old
+        self.new = new
+        self.key = None
+        self.note = None
+        self.dropped = False
+
+class _Hunk:
+    __slots__ = ("header", "lines", "note")
+
+    def __init__(self, header: str, lines: List[_Line]):
+        self.header = header
+        self.lines = lines
+        self.note = None
+
+    def render(self) -> str:
+        if self.note:
+            return f"{self.header}\n{self.note}"
+        parts = [self.header]
+        for line in self.lines:
+            if line.note:
+                parts.append(line.note)
+            if not line.dropped:
+                parts.append(line.sign + line.text)
+        return "\n".join(parts)
+
+class _File:
+    __slots__ = ("path", "header", "hunks", "text", "changed")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.changed = False
+        pos = text.find("\n@@")
+        if pos == -1:
+            self.header, self.hunks, self.path = text, [], ""
+            return
+        self.header = text[:pos]
+        self.path = _parse_path(self.header)
+        self.hunks = [_parse_hunk(part) for part in ("@@" + part for part in text[pos + 3:].split("\n@@"))]
+
+    def render(self) -> str:
+        if not self.changed:
+            return self.text
+        trailing = "\n" if self.text.endswith("\n") else ""
+        return "\n".join([self.header] + [hunk.render().rstrip("\n") for hunk in self.hunks]) + trailing
+
+def _parse_path(header: str) -> str:
+    for marker in ("\n+++ b/", "\nrename to "):
+        pos = header.find(marker)
+        if pos != -1:
+            end = header.find("\n", pos + 1)
+            return header[pos + len(marker):end if end != -1 else None]
+    first_line = header.split("\n", 1)[0]
+    pos = first_line.rfind(" b/")
+    return first_line[pos + 3:] if pos != -1 else first_line
+
+def _parse_hunk(text: str) -> _Hunk:
+    raw = text.split("\n")
+    match = _HUNK_HEADER.match(raw[0])
+    old, new = (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+    lines = []
+    for line in raw[1:]:
+        sign = line[:1] or " "
+        lines.append(_Line(sign, line[1:], old, new))
+        if sign == "-":
+            old += 1
+        elif sign == "+":
+            new += 1
+        elif sign == " ":
+            old += 1
+            new += 1
+    # 文件以换行结尾时最后是一个空字符串，不是空的上下文行
+    if lines and not raw[-1]:
+        lines.pop()
+    return _Hunk(raw[0], lines)
+
+def _change_blocks(hunk: _Hunk) -> List[Tuple[int, int]]:
+    """hunk 中连续的改动行区间 [start, end)，包括其中的 "\\ No newline at end of file" 行"""
+    blocks = []
+    start = None
+    for i, line in enumerate(hunk.lines):
+        if line.sign in "+-" or (line.sign == "\\" and start is not None):
+            if start is None:
+                start = i
+        elif start is not None:
+            blocks.append((start, i))
+            start = None
+    if start is not None:
+        blocks.append((start, len(hunk.lines)))
+    return blocks
+
+def _align(n: int, m: int, match: Callable[[int, int], bool]) -> List[Tuple[int, int]]:
+    """按顺序对齐两组行，返回对应的 (i, j)
+
+    git 已经按顺序给出了删除行和新增行，这里只需顺序匹配，遇到不对应的行时在
+    ALIGN_LOOKAHEAD 行内跳过插入或删除的行；耗时与行数成线性关系。
+    """
+    pairs = []
+    i = j = 0
+    while i < n and j < m:
+        if match(i, j):
+            pairs.append((i, j))
+            i += 1
+            j += 1
+            continue
+        for step in range(1, ALIGN_LOOKAHEAD + 1):
+            if i + step < n and match(i + step, j):
+                i += step
+                break
+            if j + step < m and match(i, j + step):
+                j += step
+                break
+        else:
+            i += 1
+            j += 1
+    return pairs
+
+def _collapse_whitespace(hunk: _Hunk) -> int:
+    """把只有空白不同的 -/+ 行对合并为上下文行（与 git diff -w 相同），返回合并的行数
+
+    整个 hunk 都只有空白变化时，替换为一行说明。
+    """
+    merged = 0
+    changed = False
+    lines = []
+    position = 0
+    for start, end in _change_blocks(hunk):
+        lines.extend(hunk.lines[position:start])
+        position = end
+        block = hunk.lines[start:end]
+        removed = [line for line in block if line.sign == "-"]
+        added = [line for line in block if line.sign == "+"]
+        if not removed or not added:
+            lines.extend(block)
+            continue
+        old_keys = [_squash(line.text) for line in removed]
+        new_keys = [_squash(line.text) for line in added]
+        pairs = _align(len(removed), len(added), lambda i, j: old_keys[i] == new_keys[j])
+        if not pairs:
+            lines.extend(block)
+            continue
+        # 对应的行变为上下文行，其间未对应的行仍按先删除后新增的顺序输出
+        i = j = 0
+        for pair_i, pair_j in pairs:
+            lines.extend(removed[i:pair_i])
+            lines.extend(added[j:pair_j])
+            new_line = added[pair_j]
+            new_line.sign = " "
+            new_line.old = removed[pair_i].old
+            lines.append(new_line)
+            i, j = pair_i + 1, pair_j + 1
+        lines.extend(removed[i:])
+        lines.extend(added[j:])
+        # 新文件末尾没有换行的标记放在区间末尾，旧文件的标记不再需要
+        lines.extend(line for k, line in enumerate(block) if line.sign == "\\" and k and block[k - 1].sign == "+")
+        merged += len(pairs)
+        changed = True
+    lines.extend(hunk.lines[position:])
+
+    if not changed:
+        return 0
+    hunk.lines = lines
+    if not any(line.sign in "+-" for line in lines):
+        hunk.note = f"{NOTE_PREFIX}whitespace-only changes on {_count(merged)}"
+    else:
+        hunk.lines[0].note = f"{NOTE_PREFIX}{_count(merged)} with whitespace-only changes shown as context"
+    return merged
+
+def _runs(files: List[_File], sign: str) -> List[Tuple[str, List[_Line]]]:
+    """所有文件中连续的 sign 行：(文件路径, 行列表)"""
+    runs = []
+    for file in files:
+        for hunk in file.hunks:
+            if hunk.note:
+                continue
+            current = []
+            for line in hunk.lines:
+                if line.sign == sign and not line.dropped:
+                    current.append(line)
+                elif current:
+                    runs.append((file.path, current))
+                    current = []
+            if current:
+                runs.append((file.path, current))
+    return runs
+
+def _collapse_moved(files: List[_File]) -> int:
+    """找出删除后在其他位置原样（忽略空白）加回的代码块，两边各替换为一行说明，返回移动的行数"""
+    removed_runs = _runs(files, "-")
+    added_runs = _runs(files, "+")
+    if not removed_runs or not added_runs:
+        return 0
+
+    # 新增行按内容建立索引：内容 -> [(run 序号, 行序号)]
+    index: Dict[str, List[Tuple[int, int]]] = {}
+    for run_index, (_, run) in enumerate(added_runs):
+        for line_index, line in enumerate(run):
+            line.key = _squash(line.text)
+            if len(line.key) >= MIN_SEED_CHARS:
+                index.setdefault(line.key, []).append((run_index, line_index))
+
+    claimed = set()
+    moved = 0
+    for path, run in removed_runs:
+        for line in run:
+            line.key = _squash(line.text)
+        i = 0
+        while i < len(run):
+            candidates = index.get(run[i].key)
+            if not candidates or len(candidates) > MAX_SEED_CANDIDATES:
+                i += 1
+                continue
+            best = None
+            for run_index, line_index in candidates:
+                target = added_runs[run_index][1]
+                length = 0
+                while (
+                    i + length < len(run)
+                    and line_index + length < len(target)
+                    and run[i + length].key == target[line_index + length].key
+                    and id(target[line_index + length]) not in claimed
+                ):
+                    length += 1
+                if best is None or length > best[0]:
+                    best = (length, run_index, line_index)
+            length, run_index, line_index = best
+            block = run[i:i + length]
+            if length < MIN_MOVED_LINES or sum(len(_ALNUM.findall(l.key)) for l in block) < MIN_MOVED_CHARS:
+                i += 1
+                continue
+            target_path, target = added_runs[run_index]
+            target = target[line_index:line_index + length]
+            for line in block + target:
+                line.dropped = True
+                claimed.add(id(line))
+            block[0].note = f"{NOTE_PREFIX}moved {_count(length)} to {target_path}:{target[0].new}"
+            target[0].note = f"{NOTE_PREFIX}moved {_count(length)} from {path}:{block[0].old}"
+            moved += length
+            i += length
+    return moved
+
+def _replacements(old_tokens: List[str], new_tokens: List[str]) -> Optional[Tuple[Tuple[str, str], ...]]:
+    """两行之间的单词替换；不是逐词替换（如插入、删除了单词）时返回 None"""
+    if len(old_tokens) != len(new_tokens):
+        return None
+    pairs = []
+    for a, b in zip(old_tokens, new_tokens):
+        if a != b:
+            if a.isspace() and b.isspace():
+                continue
+            pair = (a, b)
+            if pair not in pairs:
+                pairs.append(pair)
+    if not pairs or len(pairs) > MAX_REPLACEMENTS_PER_LINE:
+        return None
+    return tuple(pairs)
+
+def _count(n: int) -> str:
+    return f"{n} line" if n == 1 else f"{n} lines"
+
+def _collapse_replacements(files: List[_File]) -> int:
+    """折叠机械的查找替换：-/+ 行对之间只有相同的单词替换，且该替换在整个 diff 中至少出现 MIN_REPLACED_LINES 次"""
+    # 先找出所有一一对应的行对及其替换，block 用于合并同一改动区间内的说明
+    pairs = []
+    block_id = 0
+    for file in files:
+        for hunk in file.hunks:
+            if hunk.note:
+                continue
+            for start, end in _change_blocks(hunk):
+                block_id += 1
+                block = [line for line in hunk.lines[start:end] if not line.dropped]
+                removed = [line for line in block if line.sign == "-"]
+                added = [line for line in block if line.sign == "+"]
+                if not removed or not added:
+                    continue
+                old_tokens = [_TOKEN.findall(line.text) for line in removed]
+                new_tokens = [_TOKEN.findall(line.text) for line in added]
+                found = {}
+
+                def match(i: int, j: int) -> bool:
+                    if (i, j) not in found:
+                        found[(i, j)] = _replacements(old_tokens[i], new_tokens[j])
+                    return found[(i, j)] is not None
+
+                for i, j in _align(len(removed), len(added), match):
+                    pairs.append((block_id, removed[i], added[j], found[(i, j)]))
+    if not pairs:
+        return 0
+
+    counts: Dict[Tuple[str, str], int] = {}
+    for _, _, _, replacements in pairs:
+        for pair in replacements:
+            counts[pair] = counts.get(pair, 0) + 1
+
+    # 同一改动区间内相同替换的行合并为一条说明
+    collapsed = 0
+    notes: Dict[Tuple[int, Tuple], List] = {}
+    for block, old_line, new_line, replacements in pairs:
+        if any(counts[pair] < MIN_REPLACED_LINES for pair in replacements):
+            continue
+        old_line.dropped = True
+        new_line.dropped = True
+        note = notes.get((block, replacements))
+        if note is None:
+            note = notes[(block, replacements)] = [old_line, 0]
+        note[1] += 1
+        description = ", ".join(f"`{a}` → `{b}`" for a, b in replacements)
+        note[0].note = f"{NOTE_PREFIX}replaced {description} on {_count(note[1])}"
+        collapsed += 1
+    return collapsed
+
+def simplify_diff(
+    diff: Optional[str],
+    whitespace: bool = True,
+    moved: bool = True,
+    replaced: bool = True
+) -> Optional[str]:
+    """Collapse mechanical changes in a diff into one-line notes.
+
+    - whitespace: -/+ line pairs that differ only in whitespace become
+      context lines, as with ``git diff -w``; hunks with nothing else left
+      become a single note
+    - moved: blocks of at least MIN_MOVED_LINES lines that are removed in one
+      place and added unchanged (ignoring whitespace) in another, in the same
+      or another file, become "moved N lines to/from path:line" notes
+    - replaced: line pairs that differ only by a token replacement seen on at
+      least MIN_REPLACED_LINES lines become "replaced `a` → `b`" notes
+
+    Notes start with NOTE_PREFIX. Files without hunks (renames, binary and
+    omitted files) are kept as they are.
+
+    Args:
+        diff: Diff content, as returned by get_staged_changes
+        whitespace: Collapse whitespace-only changes
+        moved: Collapse moved blocks
+        replaced: Collapse mechanical search-and-replace edits
+
+    Returns:
+        The simplified diff
+    """
+    if not diff or "\n@@" not in diff:
+        return diff
+    files = [_File(text) for text in split_diff_files(diff)]
+
+    if whitespace:
+        for file in files:
+            for hunk in file.hunks:
+                if _collapse_whitespace(hunk):
+                    file.changed = True
+
+    if moved and _collapse_moved(files):
+        _mark_changed(files)
+
+    if replaced and _collapse_replacements(files):
+        _mark_changed(files)
+
+    # 没有 "diff --git" 开头的前缀部分原样保留
+    parts = diff.split("\ndiff --git ", 1)
+    prefix = [] if parts[0].startswith("diff --git ") else [parts[0]]
+    return "\n".join(prefix + [file.render().rstrip("\n") for file in files]) + ("\n" if diff.endswith("\n") else "")
+
+def _mark_changed(files: List[_File]):
+    for file in files:
+        if not file.changed and any(
+            hunk.note or any(line.dropped or line.note for line in hunk.lines) for hunk in file.hunks
+        ):
+            file.changed = True
+
+def semantic_enabled() -> bool:
+    """配置项 "semantic" 为 false 时关闭预处理，默认开启"""
+    from .config import get_config_value
+
+    value = get_config_value("semantic", True)
+    if isinstance(value, str):
+        return value.strip().lower() not in ("0", "false", "no", "off")
+    return bool(value)
@@ -0,0 +1,400 @@
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from .cache import CACHE_DIR, ResponseCache, make_cache_key
+
+# 服务只在运行时导入 asyncio，acmt commit 作为客户端时只需要 urllib
+if TYPE_CHECKING:
+    import asyncio
+
+DEFAULT_PORT = 8765
+
+# 默认同时进行的模型请求数，也是连接池的大小
+DEFAULT_CONCURRENCY = 16
+
+# 内存 LRU 缓存的条目数
+DEFAULT_MEMORY_ENTRIES = 1024
+
+# 服务端的磁盘缓存与本机的缓存分开存放
+SERVER_CACHE_DIR = os.path.join(CACHE_DIR, "server")
+
+# 请求体的大小上限（字节）
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+# 超过这个大小的 diff 先只发送指纹，服务端没有结果时再上传完整内容
+FINGERPRINT_MIN_BYTES = 32 * 1024
+
+# 客户端等待服务端生成的最长时间（秒）
+DEFAULT_CLIENT_TIMEOUT = 120.0
+
+# 请求中可以出现的字段及其类型
+PAYLOAD_FIELDS = {
+    "diff": str,
+    "dependency_files": list,
+    "dependency_summary": str,
+    "examples": list,
+    "model": str,
+    "prompt": str,
+    "map_reduce": bool,
+    "map_model": str,
+}
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               413: "Payload Too Large", 502: "Bad Gateway"}
+
+class ServerError(Exception):
+    """返回给客户端的错误，带 HTTP 状态码"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def build_payload(
+    diff: Optional[str],
+    model: Optional[str] = None,
+    prompt: Optional[str] = None,
+    dependency_files: Optional[List[str]] = None,
+    dependency_summary: Optional[str] = None,
+    examples: Optional[List[str]] = None,
+    map_reduce: bool = False,
+    map_model: Optional[str] = None
+) -> Dict:
+    """构造发送给服务端的请求内容，省略空字段使指纹与字段顺序和默认值无关"""
+    payload = {
+        "diff": diff,
+        "dependency_files": dependency_files,
+        "dependency_summary": dependency_summary,
+        "examples": examples,
+        "model": str(model) if model else None,
+        "prompt": prompt,
+        "map_reduce": map_reduce,
+        "map_model": str(map_model) if map_model else None,
+    }
+    return {key: value for key, value in payload.items() if value}
+
+def payload_fingerprint(payload: Dict) -> str:
+    """请求内容的指纹，客户端和服务端用同样的方式计算"""
+    content = {key: value for key, value in payload.items() if key in PAYLOAD_FIELDS and value}
+    data = json.dumps(content, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def _validate(payload: Dict):
+    if not isinstance(payload, dict):
+        raise ServerError(400, "request body must be a JSON object")
+    for key, value in payload.items():
+        kind = PAYLOAD_FIELDS.get(key)
+        if kind is None:
+            if key != "fingerprint":
+                raise ServerError(400, f"unknown field: {key}")
+            continue
+        if value is not None and not isinstance(value, kind):
+            raise ServerError(400, f"invalid value for {key}")
+        if kind is list and value and not all(isinstance(item, str) for item in value):
+            raise ServerError(400, f"{key} must be a list of strings")
+
+class MemoryCache:
+    """进程内的 LRU 缓存，命中时移到末尾，超出容量时删除最久未使用的条目"""
+
+    def __init__(self, max_entries: int = DEFAULT_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        message = self._entries.get(key)
+        if message is not None:
+            self._entries.move_to_end(key)
+        return message
+
+    def put(self, key: str, message: str):
+        self._entries[key] = message
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class GenerationServer:
+    """团队共用的提交信息生成服务
+
+    相同的请求（按内容指纹）只向模型发送一次：进行中的请求被后来的相同请求共享，
+    结果保存在内存 LRU 和磁盘缓存中。所有请求共用连接池，并受全局并发数和限速约束。
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        api_base: Optional[str],
+        model: Optional[str],
+        prompt: Optional[str] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        rate_limit: Optional[float] = None,
+        memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+        cache: Optional[ResponseCache] = None,
+        token: Optional[str] = None,
+        log: Optional[Callable[[str], None]] = None
+    ):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.model = model
+        self.prompt = prompt
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.memory = MemoryCache(memory_entries)
+        self.cache = cache or ResponseCache(SERVER_CACHE_DIR)
+        self.token = token
+        self.log = log or (lambda message: None)
+        self.stats = {"requests": 0, "generated": 0, "memory_hits": 0, "disk_hits": 0, "coalesced": 0, "errors": 0}
+        self._inflight: Dict[str, "asyncio.Task"] = {}
+        self._semaphore = None
+        self._limiter = None
+
+    def _key(self, fingerprint: str, model: Optional[str]) -> str:
+        """缓存键：请求内容的指纹加上服务端的 API base、默认提示词和模型参数"""
+        from .openai_utils import get_request_settings
+
+        model = model or self.model
+        return make_cache_key(fingerprint, model, self.api_base, self.prompt, get_request_settings(model))
+
+    def _lookup(self, key: str) -> Tuple[Optional[str], Optional[str]]:
+        """返回 (提交信息, 来源)"""
+        message = self.memory.get(key)
+        if message is not None:
+            self.stats["memory_hits"] += 1
+            return message, "memory"
+        message = self.cache.get(key)
+        if message is not None:
+            self.stats["disk_hits"] += 1
+            self.memory.put(key, message)
+            return message, "disk"
+        return None, None
+
+    async def _run(self, key: str, payload: Dict) -> str:
+        from .openai_utils import agenerate_commit_message
+
+        async with self._semaphore:
+            await self._limiter.acquire()
+            started = time.monotonic()
+            message = await agenerate_commit_message(
+                diff=payload.get("diff"),
+                api_key=self.api_key,
+                api_base=self.api_base,
+                model=payload.get("model") or self.model,
+                prompt_template=payload.get("prompt") or self.prompt,
+                dependency_files=payload.get("dependency_files"),
+                dependency_summary=payload.get("dependency_summary"),
+                examples=payload.get("examples"),
+                map_reduce=bool(payload.get("map_reduce")),
+                map_model=payload.get("map_model")
+            )
+        self.stats["generated"] += 1
+        self.memory.put(key, message)
+        self.cache.put(key, message)
+        self.log(f"Generated {key[:12]} in {(time.monotonic() - started) * 1000:.0f}ms")
+        return message
+
+    async def generate(self, payload: Dict) -> Dict:
+        """处理一个生成请求
+
+        只有指纹的请求只查找缓存和进行中的请求，都没有时返回 404，客户端再上传完整内容。
+        """
+        import asyncio
+
+        _validate(payload)
+        self.stats["requests"] += 1
+        has_content = any(payload.get(field) for field in ("diff", "dependency_files", "dependency_summary"))
+        fingerprint = payload_fingerprint(payload) if has_content else payload.get("fingerprint")
+        if not fingerprint or not isinstance(fingerprint, str):
+            raise ServerError(400, "request needs a diff or a fingerprint")
+        key = self._key(fingerprint, payload.get("model"))
+
+        message, source = self._lookup(key)
+        if message is not None:
+            return {"message": message, "fingerprint": fingerprint, "source": source}
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            source = "coalesced"
+        elif not has_content:
+            raise ServerError(404, "not found")
+        else:
+            task = asyncio.create_task(self._run(key, payload))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            source = "generated"
+
+        # 客户端断开时不取消共享的请求，其他等待者仍然需要结果
+        try:
+            message = await asyncio.shield(task)
+        except Exception as e:
+            self.stats["errors"] += 1
+            raise ServerError(502, str(e))
+        return {"message": message, "fingerprint": fingerprint, "source": source}
+
+    def status(self) -> Dict:
+        return dict(self.stats, inflight=len(self._inflight), memory_entries=len(self.memory), model=self.model)
+
+    async def _dispatch(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Dict]:
+        if self.token and headers.get("authorization") != f"Bearer {self.token}":
+            return 401, {"error": "invalid or missing token"}
+        path = urlparse(path).path.rstrip("/")
+        try:
+            if method == "GET" and path == "/v1/health":
+                return 200, self.status()
+            if method == "POST" and path == "/v1/messages":
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError:
+                    raise ServerError(400, "invalid JSON body")
+                return 200, await self.generate(payload)
+            return 404, {"error": f"not found: {method} {path}"}
+        except ServerError as e:
+            return e.status, {"error": str(e)}
+
+    async def _handle(self, reader: "asyncio.StreamReader", writer: "asyncio.StreamWriter"):
+        """HTTP/1.1 连接，支持 keep-alive；请求体只支持 Content-Length"""
+        import asyncio
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    await _write_response(writer, 400, {"error": "bad request line"}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await _write_response(writer, 413, {"error": f"body exceeds {MAX_BODY_BYTES} bytes"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                started = time.monotonic()
+                status, response = await self._dispatch(method, path, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await _write_response(writer, status, response, keep_alive)
+                self.log(f"{method} {path} {status} {response.get('source', '-')} "
+                         f"{(time.monotonic() - started) * 1000:.0f}ms")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        import asyncio
+        from .batch import RateLimiter
+        from .openai_utils import aclose_clients, configure_http_pool
+
+        # 连接池与并发数一致，所有请求复用同一组到服务商的连接
+        configure_http_pool(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._limiter = RateLimiter(self.rate_limit)
+        server = await asyncio.start_server(self._handle, host, port)
+        self.log(f"Serving {self.model} on http://{host}:{port} (concurrency {self.concurrency}, "
+                 f"rate limit {self.rate_limit or 'none'})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in list(self._inflight.values()):
+                task.cancel()
+            await aclose_clients()
+
+async def _write_response(writer: "asyncio.StreamWriter", status: int, payload: Dict, keep_alive: bool):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+def run_server(
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    log: Optional[Callable[[str], None]] = None,
+    **options
+):
+    """Run the shared generation service until interrupted.
+
+    Args:
+        host: Address to listen on
+        port: Port to listen on
+        log: Optional callback receiving progress messages
+        **options: Passed to GenerationServer (api_key, api_base, model, concurrency, ...)
+    """
+    import asyncio
+
+    try:
+        asyncio.run(GenerationServer(log=log, **options).serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+def _post(url: str, payload: Dict, token: Optional[str], timeout: float) -> Tuple[int, Dict]:
+    import urllib.request
+    import urllib.error
+
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    request = urllib.request.Request(
+        url.rstrip("/") + "/v1/messages",
+        data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        headers=headers,
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        try:
+            return e.code, json.loads(e.read() or b"{}")
+        except ValueError:
+            return e.code, {}
+    except (OSError, ValueError) as e:
+        raise Exception(f"Error: cannot reach acmt server at {url}: {str(e)}")
+
+def request_message(
+    url: str,
+    payload: Dict,
+    token: Optional[str] = None,
+    timeout: float = DEFAULT_CLIENT_TIMEOUT
+) -> Tuple[str, str]:
+    """向 acmt serve 请求提交信息
+
+    diff 较大时先只发送指纹，服务端已有结果（或正在生成）时不必上传完整的 diff。
+
+    Returns:
+        (提交信息, 来源)；来源为 memory、disk、coalesced 或 generated
+    """
+    if len(payload.get("diff") or "") >= FINGERPRINT_MIN_BYTES:
+        status, response = _post(
+            url, {"fingerprint": payload_fingerprint(payload), "model": payload.get("model")}, token, timeout
+        )
+        if status == 200:
+            return response["message"], response.get("source", "")
+        if status != 404:
+            raise Exception(f"Error: acmt server returned {status}: {response.get('error', '')}")
+    status, response = _post(url, payload, token, timeout)
+    if status != 200:
+        raise Exception(f"Error: acmt server returned {status}: {response.get('error', '')}")
+    return response["message"], response.get("source", "")
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+
+# 追踪默认关闭；关闭时 span() 返回共享的空对象，开销只有一次布尔判断
+_state = {"enabled": False, "started": 0.0, "started_wall": 0.0, "run_id": "", "command": None}
+_spans: List["Span"] = []
+_sinks: List[Callable[[Dict], None]] = []
+_local = threading.local()
+
+class _NoopSpan:
+    """追踪关闭时使用的空 span"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NOOP = _NoopSpan()
+
+class Span:
+    """一个计时阶段，基于 time.monotonic；可以附加字节数、token 数等属性"""
+
+    __slots__ = ("name", "attrs", "start", "end", "depth", "thread", "error")
+
+    def __init__(self, name: str, attrs: Dict):
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+        self.end = 0.0
+        self.depth = 0
+        self.thread = threading.get_ident()
+        self.error = None
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.depth = len(stack)
+        stack.append(self)
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.end = time.monotonic()
+        _local.stack.pop()
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        _record(self)
+        return False
+
+    def set(self, **attrs):
+        """附加属性，如 bytes=…、tokens=…"""
+        self.attrs.update(attrs)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def to_dict(self) -> Dict:
+        record = {
+            "run_id": _state["run_id"],
+            "command": _state["command"],
+            "name": self.name,
+            "start_ms": round((self.start - _state["started"]) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "depth": self.depth,
+            "thread": self.thread,
+            "timestamp": _state["started_wall"] + (self.start - _state["started"]),
+        }
+        if self.attrs:
+            record["attrs"] = self.attrs
+        if self.error:
+            record["error"] = self.error
+        return record
+
+def _record(span: Span):
+    _spans.append(span)
+    if _sinks:
+        record = span.to_dict()
+        for sink in _sinks:
+            try:
+                sink(record)
+            except Exception:
+                pass
+
+def is_enabled() -> bool:
+    return _state["enabled"]
+
+def enable(jsonl_path: Optional[str] = None, command: Optional[str] = None, started: Optional[float] = None):
+    """开启追踪，可选地把每个 span 以 JSON 行追加到文件中
+
+    started 为 time.monotonic() 的起始时间，默认为现在；同一次运行的 span 带有相同的 run_id
+    """
+    now = time.monotonic()
+    started = now if started is None else started
+    _spans.clear()
+    _state["enabled"] = True
+    _state["started"] = started
+    _state["started_wall"] = time.time() - (now - started)
+    _state["run_id"] = os.urandom(8).hex()
+    _state["command"] = command
+    if jsonl_path:
+        add_sink(_jsonl_sink(jsonl_path))
+
+def disable():
+    """关闭追踪并移除所有输出"""
+    _state["enabled"] = False
+    _sinks.clear()
+
+def add_sink(sink: Callable[[Dict], None]):
+    """添加 span 输出，每个结束的 span 以字典形式传入"""
+    _sinks.append(sink)
+
+def _jsonl_sink(path: str) -> Callable[[Dict], None]:
+    lock = threading.Lock()
+
+    def write(record: Dict):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with lock, open(path, "a") as f:
+            f.write(line)
+
+    return write
+
+def span(name: str, **attrs):
+    """Time a stage of work.
+
+    Usage::
+
+        with trace.span("git.diff") as s:
+            ...
+            s.set(bytes=len(data))
+
+    Returns a shared no-op object when tracing is disabled.
+    """
+    if not _state["enabled"]:
+        return _NOOP
+    return Span(name, attrs)
+
+def mark(name: str, since: Optional[float] = None, **attrs):
+    """记录一个已经发生的阶段，since 为 time.monotonic() 的起始时间，默认为追踪开始时间"""
+    if not _state["enabled"]:
+        return
+    stack = getattr(_local, "stack", None) or []
+    record = Span(name, attrs)
+    record.start = since if since is not None else _state["started"]
+    record.end = time.monotonic()
+    record.depth = len(stack)
+    _record(record)
+
+def spans() -> List[Span]:
+    return list(_spans)
+
+def _format_attrs(attrs: Dict) -> str:
+    return " ".join(f"{key}={value}" for key, value in attrs.items())
+
+def format_report() -> str:
+    """按开始时间输出各阶段耗时表，子阶段缩进显示"""
+    total = time.monotonic() - _state["started"]
+    rows = sorted(_spans, key=lambda s: (s.start, s.depth))
+    name_width = max([len("Stage")] + [len(s.name) + 2 * s.depth for s in rows]) + 2
+    lines = [
+        f"{'Stage':<{name_width}}{'Start ms':>10}{'Time ms':>10}{'%':>7}  Details",
+        "-" * (name_width + 27 + 9),
+    ]
+    for s in rows:
+        details = _format_attrs(s.attrs)
+        if s.error:
+            details = f"{details} error={s.error}".strip()
+        percent = s.duration / total * 100 if total else 0.0
+        lines.append(
+            f"{'  ' * s.depth + s.name:<{name_width}}"
+            f"{(s.start - _state['started']) * 1000:>10.1f}"
+            f"{s.duration * 1000:>10.1f}"
+            f"{percent:>7.1f}  {details}".rstrip()
+        )
+    lines.append("-" * (name_width + 27 + 9))
+    lines.append(f"{'total':<{name_width}}{'':>10}{total * 1000:>10.1f}{100.0:>7.1f}")
+    return "\n".join(lines)
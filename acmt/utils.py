@@ -41,8 +41,11 @@ class Spinner:
 
     def stop(self):
         """Stop the spinner animation and clear the line."""
+        if not self.running:
+            return
         self.running = False
         if self.spinner_thread is not None:
             self.spinner_thread.join()
+            self.spinner_thread = None
         sys.stdout.write('\r' + ' ' * (len(self.message) + 2) + '\r')
         sys.stdout.flush()
@@ -0,0 +1,353 @@
+"""Local mock of the model provider APIs used by acmt.
+
+Serves enough of the OpenAI and Anthropic HTTP APIs to exercise every
+provider adapter without network access or API keys:
+
+- OpenAI: POST /v1/chat/completions (with ``stream`` and ``n``),
+  POST /v1/files, GET /v1/files/<id>/content, POST /v1/batches,
+  GET /v1/batches/<id>, POST /v1/batches/<id>/cancel
+- Anthropic: POST /v1/messages, POST /v1/messages/batches,
+  GET /v1/messages/batches/<id>, GET /v1/messages/batches/<id>/results,
+  POST /v1/messages/batches/<id>/cancel
+
+Completion requests can be made to fail or stall to exercise the retry
+policy: ``--fail-rate`` answers a fraction of them with ``--fail-status``
+(and ``Retry-After`` when ``--retry-after`` is set), ``--fail-model`` always
+fails one model to trigger failover, and ``--slow-rate``/``--slow-delay``
+add a latency tail for hedged requests.
+
+Usage:
+    python benchmarks/mock_server.py [--port 18080] [--delay 0.2] [--jitter 0.1] [--batch-delay 3]
+    python benchmarks/mock_server.py --fail-rate 0.3 --retry-after 1 --slow-rate 0.05 --slow-delay 10
+
+Then point acmt at it, e.g.:
+    ACMT_API_BASE=http://127.0.0.1:18080/v1 ACMT_API_KEY=test acmt batch --bulk --provider openai ...
+"""
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 所有响应共用的提交信息前缀
+MESSAGE_PREFIX = "chore: mock commit message"
+
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_files = {}
+_batches = {}
+
+
+def _new_id(prefix: str) -> str:
+    with _lock:
+        return f"{prefix}_{next(_ids)}"
+
+
+def _message_text(messages, index: int = 0) -> str:
+    """根据请求内容生成确定的提交信息，便于核对结果是否对应到正确的请求"""
+    content = "".join(m.get("content", "") for m in messages if m.get("role") == "user")
+    suffix = f" #{index}" if index else ""
+    return f"{MESSAGE_PREFIX} ({len(content)} chars){suffix}"
+
+
+def _chat_completion(body: dict) -> dict:
+    n = body.get("n") or 1
+    return {
+        "id": _new_id("chatcmpl"),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [
+            {
+                "index": i,
+                "message": {"role": "assistant", "content": _message_text(body.get("messages", []), i)},
+                "finish_reason": "stop",
+            }
+            for i in range(n)
+        ],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+    }
+
+
+def _anthropic_message(params: dict) -> dict:
+    return {
+        "id": _new_id("msg"),
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "mock"),
+        "content": [{"type": "text", "text": _message_text(params.get("messages", []))}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": 10, "output_tokens": 10},
+    }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = None
+
+    def log_message(self, *args):
+        pass
+
+    # ---- 通用 ----
+
+    def _sleep(self):
+        delay = self.options.delay + random.uniform(0, self.options.jitter)
+        if self.options.slow_rate and random.random() < self.options.slow_rate:
+            delay += self.options.slow_delay
+        if delay > 0:
+            time.sleep(delay)
+
+    def _inject_failure(self, model) -> bool:
+        """按 --fail-model / --fail-rate 返回错误响应，返回是否已经响应"""
+        options = self.options
+        if str(model) not in options.fail_model and not (options.fail_rate and random.random() < options.fail_rate):
+            return False
+        data = json.dumps({"error": {"message": "injected failure", "type": "server_error"}}).encode("utf-8")
+        self.send_response(options.fail_status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if options.retry_after is not None:
+            self.send_header("Retry-After", f"{options.retry_after:g}")
+        self.end_headers()
+        self.wfile.write(data)
+        return True
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send(self, status: int, payload, content_type: str = "application/json"):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self):
+        self._send(404, {"error": {"message": f"not found: {self.path}", "type": "not_found"}})
+
+    # ---- 路由 ----
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        body = self._read_body()
+        if path == "/v1/chat/completions":
+            return self._chat(json.loads(body or b"{}"))
+        if path == "/v1/files":
+            return self._upload(body)
+        if path == "/v1/batches":
+            return self._create_openai_batch(json.loads(body or b"{}"))
+        if path.startswith("/v1/batches/") and path.endswith("/cancel"):
+            return self._cancel(path.split("/")[3])
+        if path == "/v1/messages":
+            params = json.loads(body or b"{}")
+            if self._inject_failure(params.get("model")):
+                return
+            self._sleep()
+            return self._send(200, _anthropic_message(params))
+        if path == "/v1/messages/batches":
+            return self._create_anthropic_batch(json.loads(body or b"{}"))
+        if path.startswith("/v1/messages/batches/") and path.endswith("/cancel"):
+            return self._cancel(path.split("/")[4])
+        self._not_found()
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        parts = path.split("/")
+        if path.startswith("/v1/files/") and path.endswith("/content"):
+            file = _files.get(parts[3])
+            return self._send(200, file["content"], "application/jsonl") if file else self._not_found()
+        if path.startswith("/v1/batches/"):
+            batch = _batches.get(parts[3])
+            return self._send(200, self._openai_batch_view(batch)) if batch else self._not_found()
+        if path.startswith("/v1/messages/batches/") and path.endswith("/results"):
+            batch = _batches.get(parts[4])
+            return self._send(200, self._anthropic_results(batch), "application/jsonl") if batch else self._not_found()
+        if path.startswith("/v1/messages/batches/"):
+            batch = _batches.get(parts[4])
+            return self._send(200, self._anthropic_batch_view(batch)) if batch else self._not_found()
+        self._not_found()
+
+    # ---- chat.completions ----
+
+    def _chat(self, body: dict):
+        if self._inject_failure(body.get("model")):
+            return
+        self._sleep()
+        response = _chat_completion(body)
+        if not body.get("stream"):
+            return self._send(200, response)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        for choice in response["choices"]:
+            for word in choice["message"]["content"].split(" "):
+                write_event(json.dumps({
+                    "id": response["id"], "object": "chat.completion.chunk", "created": response["created"],
+                    "model": response["model"],
+                    "choices": [{"index": choice["index"], "delta": {"content": word + " "}, "finish_reason": None}],
+                }))
+            write_event(json.dumps({
+                "id": response["id"], "object": "chat.completion.chunk", "created": response["created"],
+                "model": response["model"],
+                "choices": [{"index": choice["index"], "delta": {}, "finish_reason": "stop"}],
+            }))
+        write_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # ---- OpenAI Files + Batches ----
+
+    def _upload(self, body: bytes):
+        # multipart/form-data：取出 file 字段的内容
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+        )
+        content, filename, purpose = b"", "upload.jsonl", "batch"
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name == "file":
+                content = part.get_payload(decode=True)
+                filename = part.get_filename() or filename
+            elif name == "purpose":
+                purpose = part.get_content().strip()
+        file_id = _new_id("file")
+        _files[file_id] = {"content": content, "filename": filename, "purpose": purpose}
+        self._send(200, self._file_view(file_id))
+
+    def _file_view(self, file_id: str) -> dict:
+        file = _files[file_id]
+        return {
+            "id": file_id, "object": "file", "bytes": len(file["content"]), "created_at": int(time.time()),
+            "filename": file["filename"], "purpose": file["purpose"], "status": "processed",
+        }
+
+    def _create_openai_batch(self, body: dict):
+        file = _files.get(body.get("input_file_id"))
+        if not file:
+            return self._send(400, {"error": {"message": "input file not found", "type": "invalid_request_error"}})
+        requests = [json.loads(line) for line in file["content"].decode("utf-8").splitlines() if line.strip()]
+        batch_id = _new_id("batch")
+        _batches[batch_id] = {
+            "kind": "openai", "requests": requests, "created": time.time(), "cancelled": False,
+            "endpoint": body.get("endpoint"), "input_file_id": body.get("input_file_id"), "output_file_id": None,
+        }
+        self._send(200, self._openai_batch_view(_batches[batch_id], batch_id))
+
+    def _batch_done(self, batch: dict) -> bool:
+        return batch["cancelled"] or time.time() - batch["created"] >= self.options.batch_delay
+
+    def _openai_batch_view(self, batch: dict, batch_id: str = None) -> dict:
+        batch_id = batch_id or next(k for k, v in _batches.items() if v is batch)
+        if self._batch_done(batch) and not batch["cancelled"] and batch["output_file_id"] is None:
+            # 任务完成时生成输出文件
+            lines = [
+                json.dumps({
+                    "id": _new_id("batch_req"),
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "request_id": _new_id("req"), "body": _chat_completion(request["body"])},
+                    "error": None,
+                })
+                for request in batch["requests"]
+            ]
+            output_id = _new_id("file")
+            _files[output_id] = {"content": ("\n".join(lines) + "\n").encode("utf-8"),
+                                 "filename": "output.jsonl", "purpose": "batch_output"}
+            batch["output_file_id"] = output_id
+        if batch["cancelled"]:
+            status = "cancelled"
+        elif self._batch_done(batch):
+            status = "completed"
+        else:
+            status = "in_progress"
+        total = len(batch["requests"])
+        return {
+            "id": batch_id, "object": "batch", "endpoint": batch["endpoint"], "input_file_id": batch["input_file_id"],
+            "completion_window": "24h", "status": status, "output_file_id": batch["output_file_id"],
+            "error_file_id": None, "created_at": int(batch["created"]),
+            "request_counts": {"total": total, "completed": total if status == "completed" else 0, "failed": 0},
+        }
+
+    def _cancel(self, batch_id: str):
+        batch = _batches.get(batch_id)
+        if not batch:
+            return self._not_found()
+        batch["cancelled"] = True
+        if batch["kind"] == "openai":
+            return self._send(200, self._openai_batch_view(batch, batch_id))
+        self._send(200, self._anthropic_batch_view(batch, batch_id))
+
+    # ---- Anthropic Message Batches ----
+
+    def _create_anthropic_batch(self, body: dict):
+        batch_id = _new_id("msgbatch")
+        _batches[batch_id] = {
+            "kind": "anthropic", "requests": body.get("requests", []), "created": time.time(), "cancelled": False,
+        }
+        self._send(200, self._anthropic_batch_view(_batches[batch_id], batch_id))
+
+    def _anthropic_batch_view(self, batch: dict, batch_id: str = None) -> dict:
+        batch_id = batch_id or next(k for k, v in _batches.items() if v is batch)
+        ended = self._batch_done(batch)
+        host = self.headers.get("Host", "127.0.0.1")
+        total = len(batch["requests"])
+        return {
+            "id": batch_id, "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total if ended and not batch["cancelled"] else 0,
+                "errored": 0, "canceled": total if batch["cancelled"] else 0, "expired": 0,
+            },
+            "results_url": f"http://{host}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _anthropic_results(self, batch: dict) -> bytes:
+        lines = []
+        for request in batch["requests"]:
+            if batch["cancelled"]:
+                result = {"type": "canceled"}
+            else:
+                result = {"type": "succeeded", "message": _anthropic_message(request["params"])}
+            lines.append(json.dumps({"custom_id": request["custom_id"], "result": result}))
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds added to every completion request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra delay up to this many seconds")
+    parser.add_argument("--batch-delay", type=float, default=3.0, help="seconds until a batch job completes")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of completion requests that fail")
+    parser.add_argument("--fail-status", type=int, default=503, help="HTTP status of injected failures")
+    parser.add_argument("--fail-model", action="append", default=[], help="model whose requests always fail")
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with injected failures")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of completion requests that stall")
+    parser.add_argument("--slow-delay", type=float, default=10.0, help="extra seconds for stalled requests")
+    args = parser.parse_args()
+
+    MockHandler.options = args
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    print(f"Mock provider API listening on http://{args.host}:{args.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""Benchmark of the diff-to-message pipeline on synthetic repositories.
+
+Builds throwaway git repositories of several shapes, stages a change in
+each and measures:
+
+- ``diff_ms`` / ``diff_peak_kb``: ``get_staged_diff`` time and peak Python memory
+- ``prompt_ms``: ``prepare_diff`` (semantic preprocessing) plus ``build_chat_request``
+- ``commit_ms``: end-to-end ``acmt commit`` in a subprocess against
+  ``benchmarks/mock_server.py`` started with the given delay and jitter
+- ``config_ms``: ``resolve_config`` with cold and warm caches
+
+Results are printed as JSON and compared with the thresholds in
+``benchmarks/thresholds.json`` (``"<shape>.<metric>": max``); the exit
+status is 1 when any metric is above its threshold.
+
+Shapes:
+    many_small      many small files, a few lines changed in each
+    huge_file       one very large file with changes spread across it
+    lockfile_heavy  package-lock.json and poetry.lock bumps plus a small code change
+    many_renames    many files renamed, some of them edited
+    huge_diff       every line of a hundred large files rewritten, a diff of about 56 MB
+
+Usage:
+    python benchmarks/pipeline.py [--shape many_small] [--scale 1.0] [--runs 3]
+                                  [--delay 0.2] [--jitter 0.1] [--output results.json]
+    python benchmarks/pipeline.py --no-commit   # skip the end-to-end runs
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_THRESHOLDS = os.path.join(BENCH_DIR, "thresholds.json")
+
+# 被测进程使用的 git 身份，避免依赖全局配置
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "bench",
+    "GIT_AUTHOR_EMAIL": "bench@example.com",
+    "GIT_COMMITTER_NAME": "bench",
+    "GIT_COMMITTER_EMAIL": "bench@example.com",
+    "GIT_CONFIG_NOSYSTEM": "1",
+}
+
+
+def _git(repo: str, *args: str):
+    subprocess.run(["git", *args], cwd=repo, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _write(repo: str, path: str, text: str):
+    full = os.path.join(repo, path)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    with open(full, "w") as f:
+        f.write(text)
+
+
+def _source(name: str, lines: int, variant: int = 0) -> str:
+    """生成一段 Python 代码，variant 不同时每隔几行有一处改动"""
+    out = []
+    for i in range(lines):
+        value = i * 7 + (variant if i % 5 == 0 else 0)
+        out.append(f"def {name}_{i}(value):\n    return value + {value}\n")
+    return "".join(out)
+
+
+# ---- 仓库形状：每个函数写入初始版本并提交，然后修改并暂存 ----
+
+def shape_many_small(repo: str, scale: float):
+    files = int(1500 * scale)
+    for i in range(files):
+        _write(repo, f"src/pkg{i % 30}/module_{i}.py", _source(f"f{i}", 10))
+    yield
+    for i in range(files):
+        _write(repo, f"src/pkg{i % 30}/module_{i}.py", _source(f"f{i}", 10, variant=1))
+
+
+def shape_huge_file(repo: str, scale: float):
+    lines = int(60000 * scale)
+    _write(repo, "src/generated_tables.py", _source("table", lines))
+    yield
+    _write(repo, "src/generated_tables.py", _source("table", lines, variant=3))
+
+
+def _package_lock(packages: int, bump: int) -> str:
+    entries = ",\n".join(
+        f'    "node_modules/pkg-{i}": {{\n'
+        f'      "version": "1.{i % 17}.{bump if i % 3 == 0 else 0}",\n'
+        f'      "resolved": "https://registry.npmjs.org/pkg-{i}/-/pkg-{i}.tgz",\n'
+        f'      "integrity": "sha512-{"%064x" % (i * 2654435761 + bump * (i % 3 == 0))}"\n'
+        f'    }}'
+        for i in range(packages)
+    )
+    return f'{{\n  "name": "bench",\n  "lockfileVersion": 3,\n  "packages": {{\n{entries}\n  }}\n}}\n'
+
+
+def _poetry_lock(packages: int, bump: int) -> str:
+    return "".join(
+        f'[[package]]\nname = "lib{i}"\nversion = "2.{i % 11}.{bump if i % 4 == 0 else 0}"\n'
+        f'description = "synthetic package {i}"\noptional = false\n\n'
+        for i in range(packages)
+    )
+
+
+def shape_lockfile_heavy(repo: str, scale: float):
+    packages = int(4000 * scale)
+    _write(repo, "package-lock.json", _package_lock(packages, 0))
+    _write(repo, "poetry.lock", _poetry_lock(packages // 2, 0))
+    _write(repo, "src/app.py", _source("app", 50))
+    yield
+    _write(repo, "package-lock.json", _package_lock(packages, 1))
+    _write(repo, "poetry.lock", _poetry_lock(packages // 2, 1))
+    _write(repo, "src/app.py", _source("app", 50, variant=1))
+
+
+def shape_many_renames(repo: str, scale: float):
+    files = int(800 * scale)
+    for i in range(files):
+        _write(repo, f"old/module_{i}.py", _source(f"r{i}", 20))
+    yield
+    _git(repo, "mv", "old", "new")
+    for i in range(0, files, 10):
+        _write(repo, f"new/module_{i}.py", _source(f"r{i}", 20, variant=1))
+
+
+def _rewritten(name: str, lines: int, variant: int) -> str:
+    """每一行都随 variant 变化的数据文件"""
+    return "".join(f"{name}_row_{i} = ({i}, {i * 31 + variant}, 'value {i % 97} {variant}')\n" for i in range(lines))
+
+
+def shape_huge_diff(repo: str, scale: float):
+    files = int(100 * scale)
+    for i in range(files):
+        _write(repo, f"data/table_{i}.py", _rewritten(f"t{i}", 6400, 0))
+    yield
+    for i in range(files):
+        _write(repo, f"data/table_{i}.py", _rewritten(f"t{i}", 6400, 1))
+
+
+SHAPES = {
+    "many_small": shape_many_small,
+    "huge_file": shape_huge_file,
+    "lockfile_heavy": shape_lockfile_heavy,
+    "many_renames": shape_many_renames,
+    "huge_diff": shape_huge_diff,
+}
+
+
+def build_repo(root: str, shape: str, scale: float) -> str:
+    repo = os.path.join(root, shape)
+    os.makedirs(repo)
+    _git(repo, "init", "-q")
+    steps = SHAPES[shape](repo, scale)
+    next(steps)
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "initial")
+    next(steps, None)
+    _git(repo, "add", "-A")
+    return repo
+
+
+# ---- 模拟服务 ----
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_server(delay: float, jitter: float) -> "tuple[subprocess.Popen, str]":
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "mock_server.py"), "--port", str(port),
+         "--delay", str(delay), "--jitter", str(jitter)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return process, f"http://127.0.0.1:{port}/v1"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("mock server did not start")
+
+
+# ---- 测量 ----
+
+def _best_ms(func, runs: int) -> float:
+    """取多次运行的最小值，排除系统抖动"""
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2)
+
+
+def measure_config(runs: int) -> dict:
+    from acmt import config
+
+    def cold():
+        config._file_cache.update(signature=None, config=None)
+        config._resolved_cache.update(signature=None, config=None)
+        config.resolve_config()
+
+    cold()
+    return {
+        "cold_ms": _best_ms(cold, runs),
+        "warm_ms": _best_ms(config.resolve_config, max(runs, 100)) if runs else 0.0,
+    }
+
+
+def measure_shape(repo: str, runs: int, api_base: "str | None") -> dict:
+    from acmt.git_utils import get_staged_diff
+    from acmt.openai_utils import build_chat_request, prepare_diff
+
+    diff, dep_files = get_staged_diff(repo)
+    result = {
+        "diff_bytes": len(diff or ""),
+        "dependency_files": len(dep_files or []),
+        "diff_ms": _best_ms(lambda: get_staged_diff(repo), runs),
+    }
+
+    tracemalloc.start()
+    get_staged_diff(repo)
+    result["diff_peak_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    tracemalloc.stop()
+
+    def prompt():
+        build_chat_request(prepare_diff(diff, "gpt-4")[0], "gpt-4")
+
+    result["prompt_ms"] = _best_ms(prompt, runs)
+
+    if api_base:
+        result["commit_ms"] = _best_ms(lambda: run_commit(repo, api_base), runs)
+    return result
+
+
+def run_commit(repo: str, api_base: str):
+    """在子进程中运行 acmt commit 并拒绝提交，包含解释器启动和导入时间"""
+    env = dict(
+        os.environ,
+        **GIT_ENV,
+        PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        ACMT_API_KEY="bench",
+        ACMT_API_BASE=api_base,
+        ACMT_MODEL="gpt-4",
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", "from acmt.cli import cli; cli()", "commit", "--no-cache", "--no-stream", "--full"],
+        input="n\n",
+        capture_output=True,
+        text=True,
+        cwd=repo,
+        env=env,
+    )
+    if "Generated commit message" not in result.stdout:
+        raise RuntimeError(f"acmt commit failed in {repo}:\n{result.stdout}\n{result.stderr}")
+
+
+def check_thresholds(results: dict, thresholds: dict) -> list:
+    """返回超出阈值的指标列表"""
+    failures = []
+    for name, limit in sorted(thresholds.items()):
+        group, metric = name.rsplit(".", 1)
+        value = results.get(group, {}).get(metric)
+        if value is not None and value > limit:
+            failures.append({"metric": name, "value": value, "threshold": limit})
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", action="append", choices=sorted(SHAPES),
+                        help="Shapes to run (repeatable), defaults to all")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the size of every shape")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per measurement, the fastest is kept")
+    parser.add_argument("--delay", type=float, default=0.2, help="Mock server delay per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Mock server random extra delay (seconds)")
+    parser.add_argument("--no-commit", action="store_true", help="Skip the end-to-end acmt commit runs")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS, help="JSON file of metric thresholds")
+    parser.add_argument("--output", help="Also write the JSON result to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="acmt-bench-")
+    # 使用空的配置和缓存目录，结果不受本机配置影响；必须在导入 acmt 之前设置
+    os.environ.update(GIT_ENV, HOME=workdir, XDG_CACHE_HOME=os.path.join(workdir, "cache"))
+    for key in [key for key in os.environ if key.startswith("ACMT_")]:
+        del os.environ[key]
+    sys.path.insert(0, REPO_ROOT)
+
+    server = None
+    try:
+        api_base = None
+        if not args.no_commit:
+            server, api_base = start_mock_server(args.delay, args.jitter)
+
+        results = {"config": measure_config(args.runs)}
+        for shape in args.shape or sorted(SHAPES):
+            started = time.perf_counter()
+            repo = build_repo(workdir, shape, args.scale)
+            setup_ms = (time.perf_counter() - started) * 1000
+            results[shape] = measure_shape(repo, args.runs, api_base)
+            results[shape]["setup_ms"] = round(setup_ms, 1)
+            print(f"{shape}: {json.dumps(results[shape])}", file=sys.stderr)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    thresholds = {}
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    # 阈值按 scale 为 1 设定，其他规模只报告结果
+    failures = check_thresholds(results, thresholds) if args.scale == 1.0 else []
+
+    report = {
+        "benchmark": "pipeline",
+        "python": sys.version.split()[0],
+        "scale": args.scale,
+        "runs": args.runs,
+        "mock_delay": args.delay,
+        "mock_jitter": args.jitter,
+        "results": results,
+        "failures": failures,
+        "passed": not failures,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
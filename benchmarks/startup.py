@@ -0,0 +1,89 @@
+"""Startup time benchmark for the acmt CLI.
+
+Runs ``acmt --version`` under ``python -X importtime`` and fails when the
+import cost of ``acmt.cli`` exceeds the budget, or when a heavy SDK module
+is imported before a command actually sends a request.
+
+Usage:
+    python benchmarks/startup.py [--budget-ms 80] [--runs 5] [--json]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# acmt --version 的导入耗时预算（毫秒）
+DEFAULT_BUDGET_MS = 80
+
+# 这些模块只应在真正发送请求时才导入
+HEAVY_MODULES = ("openai", "httpx", "pydantic", "asyncio")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = "import sys; sys.argv = ['acmt', '--version']; from acmt.cli import cli; cli()"
+
+
+def measure_once() -> dict:
+    """运行一次 acmt --version，返回 acmt.cli 的累计导入耗时和已导入的重模块"""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=REPO_ROOT,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+
+    cli_us = None
+    heavy = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        if name == "acmt.cli":
+            cli_us = int(parts[1])
+        if name.split(".")[0] in HEAVY_MODULES:
+            heavy.add(name.split(".")[0])
+    if cli_us is None:
+        raise RuntimeError("acmt.cli not found in -X importtime output")
+    return {"import_ms": cli_us / 1000, "heavy_modules": sorted(heavy)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(max(1, args.runs))]
+    # 取最小值，排除冷缓存和系统抖动的影响
+    import_ms = min(run["import_ms"] for run in runs)
+    heavy = sorted({name for run in runs for name in run["heavy_modules"]})
+    passed = import_ms <= args.budget_ms and not heavy
+
+    result = {
+        "benchmark": "startup",
+        "import_ms": round(import_ms, 2),
+        "budget_ms": args.budget_ms,
+        "heavy_modules": heavy,
+        "passed": passed,
+    }
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"acmt --version imports acmt.cli in {import_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+        if heavy:
+            print(f"Heavy modules imported at startup: {', '.join(heavy)}")
+        print("PASS" if passed else "FAIL")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
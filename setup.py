@@ -6,10 +6,14 @@ setup(
     packages=find_packages(),
     install_requires=[
         "openai>=1.0.0",
-        "gitpython>=3.1.40",
+        "httpx>=0.23.0",
         "python-dotenv>=1.0.0",
         "click>=8.1.7",
     ],
+    extras_require={
+        "local": ["llama-cpp-python>=0.2.0"],
+        "tokens": ["tiktoken>=0.5.0"],
+    },
     entry_points={
         "console_scripts": [
             "acmt=acmt.cli:cli",